@@ -0,0 +1,139 @@
+import numpy as np
+
+
+# Stave limits are allowed to be None; they are stored as this value
+NONE_COL = -1
+
+DEFAULT_INITIAL_CAPACITY = 16
+
+
+class AnnotationStore:
+
+    # --------------------------------------------------------------------------
+    # Contiguous backing arrays for the annotations of a page:
+    #     - line_rows:  (num_lines, 2)  -> [top_edge_row, bottom_edge_row]
+    #                                      of every stave line
+    #     - stave_cols: (num_staves, 2) -> [left_lim_col, right_lim_col]
+    #     - bar_cols:   (num_bars, 4)   -> [inner_left_col, inner_right_col,
+    #                                       outer_left_col, outer_right_col]
+    # `Stave` and `Bar` objects are thin views, holding only their indices
+    # into these arrays; so page-wide edits (e.g. offsetting all the rows, or
+    # clamping all the cols to a new page width) are single array operations.
+    #
+    # The arrays grow by doubling. Rows are never freed: objects that are
+    # deleted (or moved to another store) just leave unused rows behind,
+    # which page-wide edits harmlessly touch as well.
+    #
+    # `version` is bumped by every edit of existing rows/cols (but not by
+    # additions), so anything caching the limits knows when to re-read them.
+    # --------------------------------------------------------------------------
+
+    def __init__(self, initial_capacity=DEFAULT_INITIAL_CAPACITY):
+
+        self.line_rows = np.zeros((initial_capacity, 2), dtype="int64")
+        self.stave_cols = np.zeros((initial_capacity, 2), dtype="int64")
+        self.bar_cols = np.zeros((initial_capacity, 4), dtype="int64")
+
+        self.num_lines = 0
+        self.num_staves = 0
+        self.num_bars = 0
+
+        self.version = 0
+
+        return
+
+
+    @staticmethod
+    def grow_array(arr, required_len):
+
+        if required_len <= arr.shape[0]:
+            return arr
+
+        new_arr = np.zeros((max(required_len, 2 * arr.shape[0]),) + arr.shape[1:],
+                           dtype=arr.dtype)
+        new_arr[:arr.shape[0]] = arr
+
+        return new_arr
+
+
+    @staticmethod
+    def col_to_stored(col):
+        return NONE_COL if col is None else col
+
+
+    @staticmethod
+    def stored_to_col(stored_col):
+        return None if stored_col == NONE_COL else int(stored_col)
+
+
+    def get_sizes(self):
+
+        # Used as a marker, to later edit only the rows added after it
+        return self.num_lines, self.num_staves, self.num_bars
+
+
+    def add_lines(self, top_edge_rows, bottom_edge_rows):
+
+        num_new_lines = len(top_edge_rows)
+        if len(bottom_edge_rows) != num_new_lines:
+            raise Exception("Got {} line top edges, but {} line bottom edges".format(
+                num_new_lines, len(bottom_edge_rows)
+            ))
+
+        start_idx = self.num_lines
+        self.line_rows = self.grow_array(self.line_rows, start_idx + num_new_lines)
+        self.line_rows[start_idx: start_idx + num_new_lines, 0] = top_edge_rows
+        self.line_rows[start_idx: start_idx + num_new_lines, 1] = bottom_edge_rows
+        self.num_lines += num_new_lines
+
+        return start_idx
+
+
+    def add_stave_cols(self, left_lim_col, right_lim_col):
+
+        stave_idx = self.num_staves
+        self.stave_cols = self.grow_array(self.stave_cols, stave_idx + 1)
+        self.stave_cols[stave_idx] = [self.col_to_stored(left_lim_col),
+                                      self.col_to_stored(right_lim_col)]
+        self.num_staves += 1
+
+        return stave_idx
+
+
+    def add_bar_cols(self, inner_left_col, inner_right_col,
+                     outer_left_col, outer_right_col):
+
+        bar_idx = self.num_bars
+        self.bar_cols = self.grow_array(self.bar_cols, bar_idx + 1)
+        self.bar_cols[bar_idx] = [inner_left_col, inner_right_col,
+                                  outer_left_col, outer_right_col]
+        self.num_bars += 1
+
+        return bar_idx
+
+
+    def offset_rows(self, offset, since=(0, 0, 0)):
+
+        self.line_rows[since[0]: self.num_lines] += offset
+        self.version += 1
+
+        return
+
+
+    def clamp_right_cols(self, page_width, since=(0, 0, 0)):
+
+        # Same as `Stave/Bar.adjust_lims_for_new_page_width`, for every stave
+        # and bar at once. A None (NONE_COL) limit is never above the max col,
+        # so it is left alone
+        max_col = page_width - 1
+
+        stave_right_cols = self.stave_cols[since[1]: self.num_staves, 1]
+        np.minimum(stave_right_cols, max_col, out=stave_right_cols)
+
+        bar_cols = self.bar_cols[since[2]: self.num_bars]
+        is_clamped = bar_cols[:, 3] > max_col
+        bar_cols[is_clamped, 3] = max_col
+        bar_cols[is_clamped, 1] = np.minimum(bar_cols[is_clamped, 1], max_col)
+        self.version += 1
+
+        return
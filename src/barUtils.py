@@ -3,25 +3,91 @@ import traceback
 import numpy as np
 
 from window_filters import ALL_FILTERS_DICT
+from annotationStore import AnnotationStore
 
 
 class Bar:
 
+    # --------------------------------------------------------------------------
+    # A view into an `AnnotationStore` (see `Stave`); the four cols live in
+    # the store's `bar_cols` array, in this order
+    # --------------------------------------------------------------------------
+
+    __slots__ = ("annotation_store", "bar_idx", "parent_sg")
+
     def __init__(self,
                  inner_left_col, inner_right_col,
                  outer_left_col, outer_right_col,
                  parent_sg=None):
 
-        self.inner_left_col = inner_left_col
-        self.inner_right_col = inner_right_col
-        self.outer_left_col = outer_left_col
-        self.outer_right_col = outer_right_col
+        if parent_sg is not None:
+            self.annotation_store = parent_sg.annotation_store
+        else:
+            self.annotation_store = AnnotationStore(initial_capacity=1)
+
+        self.bar_idx = self.annotation_store.add_bar_cols(inner_left_col, inner_right_col,
+                                                          outer_left_col, outer_right_col)
 
         self.assign_parent_sg(parent_sg)
 
         return
 
 
+    @property
+    def inner_left_col(self):
+        return int(self.annotation_store.bar_cols[self.bar_idx, 0])
+
+
+    @inner_left_col.setter
+    def inner_left_col(self, col):
+        self.annotation_store.bar_cols[self.bar_idx, 0] = col
+        self.annotation_store.version += 1
+
+
+    @property
+    def inner_right_col(self):
+        return int(self.annotation_store.bar_cols[self.bar_idx, 1])
+
+
+    @inner_right_col.setter
+    def inner_right_col(self, col):
+        self.annotation_store.bar_cols[self.bar_idx, 1] = col
+        self.annotation_store.version += 1
+
+
+    @property
+    def outer_left_col(self):
+        return int(self.annotation_store.bar_cols[self.bar_idx, 2])
+
+
+    @outer_left_col.setter
+    def outer_left_col(self, col):
+        self.annotation_store.bar_cols[self.bar_idx, 2] = col
+        self.annotation_store.version += 1
+
+
+    @property
+    def outer_right_col(self):
+        return int(self.annotation_store.bar_cols[self.bar_idx, 3])
+
+
+    @outer_right_col.setter
+    def outer_right_col(self, col):
+        self.annotation_store.bar_cols[self.bar_idx, 3] = col
+        self.annotation_store.version += 1
+
+
+    def move_to_store(self, annotation_store):
+
+        if annotation_store is self.annotation_store:
+            return
+
+        self.bar_idx = annotation_store.add_bar_cols(*self.annotation_store.bar_cols[self.bar_idx])
+        self.annotation_store = annotation_store
+
+        return
+
+
     @classmethod
     def make_object_from_dict(cls, sg_obj, bar_dict):
         try:
@@ -65,6 +131,8 @@ class Bar:
 
     def assign_parent_sg(self, parent_sg):
         self.parent_sg = parent_sg
+        if parent_sg is not None:
+            self.move_to_store(parent_sg.annotation_store)
         return
 
 
@@ -101,6 +169,14 @@ class Bar:
 
 class VizBar:
 
+    __slots__ = ("parent_sg", "orig_bar",
+                 "musical_start_frame", "musical_end_frame",
+                 "actual_start_frame", "actual_end_frame",
+                 "left_lim", "right_lim",
+                 "bar_left_col", "bar_right_col", "bar_width",
+                 "bar_top_row", "bar_bottom_row", "bar_height",
+                 "filter_obj_list")
+
     def __init__(self,
                  orig_bar,
                  musical_start_frame, musical_end_frame,
@@ -167,7 +243,8 @@ class VizBar:
         if (frame_number > self.actual_start_frame) and (frame_number < self.actual_end_frame):
 
             for filter_obj in self.filter_obj_list:
-                filter_obj.apply_filter(output_color_image, output_opacity_mask, frame_number)
+                if filter_obj.is_active_at_frame(frame_number):
+                    filter_obj.apply_filter(output_color_image, output_opacity_mask, frame_number)
 
 
         return output_color_image, output_opacity_mask
@@ -0,0 +1,484 @@
+import numpy as np
+
+
+DEFAULT_COL_CHECKPOINT_ROWS = 64
+
+
+class PackedBinaryImage:
+
+    # --------------------------------------------------------------------------
+    # A compact, read-only version of a binary page image:
+    #     - The pixels are bit-packed along the rows (8 pixels per byte)
+    #     - The row projection (number of TRUE pixels in each row) is stored
+    #       as a prefix sum; so the count over ANY range of rows is O(1)
+    #     - The column projection is stored as prefix sums over rows, but only
+    #       at every `col_checkpoint_rows`-th row (to keep it small); so the
+    #       per-column counts over any range of rows need at most
+    #       2 * `col_checkpoint_rows` packed rows to be unpacked, no matter
+    #       how tall the range is
+    # --------------------------------------------------------------------------
+
+    def __init__(self,
+                 bin_image,
+                 col_checkpoint_rows=DEFAULT_COL_CHECKPOINT_ROWS):
+
+        bin_image = np.asarray(bin_image, dtype="bool")
+
+        self.shape = bin_image.shape
+        self.img_height = self.shape[0]
+        self.img_width = self.shape[1]
+
+        self.packed_image = np.packbits(bin_image, axis=1)
+
+        row_count_arr = np.count_nonzero(bin_image, axis=1)
+        self.row_count_cumsum = np.zeros(self.img_height + 1, dtype="int64")
+        np.cumsum(row_count_arr, out=self.row_count_cumsum[1:])
+
+        # Checkpoint `i` holds the per-column counts over rows [0, i*K)
+        self.col_checkpoint_rows = col_checkpoint_rows
+        num_full_blocks = self.img_height // self.col_checkpoint_rows
+
+        self.col_count_checkpoints = np.zeros((num_full_blocks + 1, self.img_width), dtype="int32")
+        if num_full_blocks > 0:
+            block_col_counts = bin_image[:num_full_blocks * self.col_checkpoint_rows].reshape(
+                (num_full_blocks, self.col_checkpoint_rows, self.img_width)
+            ).sum(axis=1, dtype="int32")
+            np.cumsum(block_col_counts, axis=0, out=self.col_count_checkpoints[1:])
+
+        return
+
+
+    @classmethod
+    def make_object_from_packed(cls, packed_image, shape,
+                                col_checkpoint_rows=DEFAULT_COL_CHECKPOINT_ROWS):
+
+        # From the `packed_image` bits (and `shape`) of another object, e.g.
+        # one sent from another process; the projections are rebuilt
+        bin_image = np.unpackbits(packed_image, axis=1, count=shape[1]).astype("bool")
+
+        return cls(bin_image.reshape(shape), col_checkpoint_rows=col_checkpoint_rows)
+
+
+    def unpack_rows(self, start_row, end_row):
+
+        # Rows [start_row, end_row], inclusive, as a bool array
+        return np.unpackbits(self.packed_image[start_row: end_row + 1], axis=1,
+                             count=self.img_width).astype("bool")
+
+
+    def row_counts(self, start_row=0, end_row=None):
+
+        if end_row is None:
+            end_row = self.img_height - 1
+
+        return np.diff(self.row_count_cumsum[start_row: end_row + 2])
+
+
+    def count_in_rows(self, start_row, end_row):
+
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        return int(self.row_count_cumsum[end_row + 1] - self.row_count_cumsum[start_row])
+
+
+    def row_counts_at(self, row_arr):
+
+        # Counts of only the rows in `row_arr`
+        return self.row_count_cumsum[row_arr + 1] - self.row_count_cumsum[row_arr]
+
+
+    def longest_row_runs(self, start_row=0, end_row=None):
+
+        # Length of the longest horizontal run in each row (0 if none); the
+        # rows are unpacked for this, so it is meant for a few rows only
+        if end_row is None:
+            end_row = self.img_height - 1
+
+        return get_longest_row_runs(self.unpack_rows(start_row, end_row))
+
+
+    def longest_row_runs_at(self, row_arr):
+        return get_longest_row_runs(np.unpackbits(self.packed_image[row_arr], axis=1,
+                                                  count=self.img_width).astype("bool"))
+
+
+    def col_counts_before_row(self, row):
+
+        # Per-column counts over rows [0, row)
+        block_idx = row // self.col_checkpoint_rows
+        block_start_row = block_idx * self.col_checkpoint_rows
+
+        col_count_arr = self.col_count_checkpoints[block_idx].astype("int64")
+        if row > block_start_row:
+            col_count_arr += np.count_nonzero(self.unpack_rows(block_start_row, row - 1), axis=0)
+
+        return col_count_arr
+
+
+    def col_counts(self, start_row, end_row):
+
+        # Per-column counts over rows [start_row, end_row], inclusive
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        return self.col_counts_before_row(end_row + 1) - self.col_counts_before_row(start_row)
+
+
+    def col_count_before_row(self, col, row):
+
+        block_idx = row // self.col_checkpoint_rows
+        block_start_row = block_idx * self.col_checkpoint_rows
+
+        byte_col = self.packed_image[block_start_row: row, col // 8]
+        bit_col = (byte_col >> (7 - (col % 8))) & 1
+
+        return int(self.col_count_checkpoints[block_idx, col]) + int(np.count_nonzero(bit_col))
+
+
+    def count_in_col(self, col, start_row, end_row):
+
+        # Number of TRUE pixels in a single column, over rows
+        # [start_row, end_row], inclusive
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        return self.col_count_before_row(col, end_row + 1) - self.col_count_before_row(col, start_row)
+
+
+    def col_counts_at(self, col_arr, start_row, end_row):
+
+        # Per-column counts over rows [start_row, end_row], inclusive, of only
+        # the columns in `col_arr`
+        return np.array([self.count_in_col(col, start_row, end_row) for col in col_arr], dtype="int64")
+
+
+    def fully_covered_cols(self, start_row, end_row):
+
+        # Boolean array of the columns that are TRUE in every row of
+        # [start_row, end_row]
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        return self.col_counts(start_row, end_row) == (end_row - start_row + 1)
+
+
+
+class RunLengthIndex:
+
+    # --------------------------------------------------------------------------
+    # Horizontal and vertical run-length encodings of a binary page image, in
+    # CSR form:
+    #     - Row `r` has the horizontal runs
+    #       [h_run_start_cols[i], h_run_end_cols[i]] (inclusive), for i in
+    #       [h_row_ptr[r], h_row_ptr[r+1])
+    #     - Col `c` has the vertical runs
+    #       [v_run_start_rows[i], v_run_end_rows[i]] (inclusive), for i in
+    #       [v_col_ptr[c], v_col_ptr[c+1])
+    # Score pages are mostly empty, so there are far fewer runs than pixels;
+    # and all the queries below take time proportional to the number of runs
+    # they look at, not to the number of pixels.
+    # --------------------------------------------------------------------------
+
+    def __init__(self, bin_image):
+
+        bin_image = np.asarray(bin_image, dtype="bool")
+
+        self.shape = bin_image.shape
+        self.img_height = self.shape[0]
+        self.img_width = self.shape[1]
+
+        (self.h_run_rows,
+         self.h_run_start_cols, self.h_run_end_cols) = self.encode_row_runs(bin_image)
+        (self.v_run_cols,
+         self.v_run_start_rows, self.v_run_end_rows) = self.encode_row_runs(np.ascontiguousarray(bin_image.T))
+
+        self.h_row_ptr = self.make_csr_ptr(self.h_run_rows, self.img_height)
+        self.v_col_ptr = self.make_csr_ptr(self.v_run_cols, self.img_width)
+
+        # The row projection, as a prefix sum (as in `PackedBinaryImage`)
+        row_count_arr = np.bincount(self.h_run_rows, weights=self.h_run_end_cols - self.h_run_start_cols + 1,
+                                    minlength=self.img_height).astype("int64")
+        self.row_count_cumsum = np.zeros(self.img_height + 1, dtype="int64")
+        np.cumsum(row_count_arr, out=self.row_count_cumsum[1:])
+
+        # The longest horizontal run of every row (0 if it has none); the runs
+        # of a row are next to each other
+        self.longest_h_run_arr = np.zeros(self.img_height, dtype="int64")
+        rows_with_runs = np.nonzero(self.h_row_ptr[1:] > self.h_row_ptr[:-1])[0]
+        if len(rows_with_runs) > 0:
+            self.longest_h_run_arr[rows_with_runs] = np.maximum.reduceat(self.h_run_end_cols - self.h_run_start_cols + 1,
+                                                                         self.h_row_ptr[rows_with_runs])
+
+        # ----------------------------------------------------------------------
+        # For the per-column queries over a range of rows:
+        #     - Every vertical run gets the sort key (col * height + start row);
+        #       the runs are already in this order, so the last run of each
+        #       col starting before a given row is one binary search away
+        #     - The prefix sum of the run lengths (in the same order) then
+        #       gives the count of each col before that row
+        # ----------------------------------------------------------------------
+        self.v_run_keys = (self.v_run_cols.astype("int64") * self.img_height) + self.v_run_start_rows
+        self.v_run_len_cumsum = np.zeros(len(self.v_run_keys) + 1, dtype="int64")
+        np.cumsum(self.v_run_end_rows - self.v_run_start_rows + 1, out=self.v_run_len_cumsum[1:])
+
+        return
+
+
+    @staticmethod
+    def encode_row_runs(bin_image):
+
+        # ----------------------------------------------------------------------
+        # Runs of TRUE pixels along the rows (the vertical runs are the row
+        # runs of the transposed image): with a FALSE pixel padded on either
+        # side of every row, the pixels where the value changes are a run
+        # start, its end + 1, the next run start, and so on.
+        # Returns (the row of each run, its start col and its end col
+        # (inclusive)), sorted by row first
+        # ----------------------------------------------------------------------
+        padded_image = np.zeros((bin_image.shape[0], bin_image.shape[1] + 2), dtype="bool")
+        padded_image[:, 1:-1] = bin_image
+
+        edge_rows, edge_cols = np.nonzero(padded_image[:, 1:] != padded_image[:, :-1])
+
+        return edge_rows[0::2], edge_cols[0::2], edge_cols[1::2] - 1
+
+
+    @staticmethod
+    def make_csr_ptr(run_line_arr, num_lines):
+
+        line_ptr = np.zeros(num_lines + 1, dtype="int64")
+        np.cumsum(np.bincount(run_line_arr, minlength=num_lines), out=line_ptr[1:])
+
+        return line_ptr
+
+
+    @property
+    def num_h_runs(self):
+        return len(self.h_run_start_cols)
+
+
+    @property
+    def num_v_runs(self):
+        return len(self.v_run_start_rows)
+
+
+    def row_counts(self, start_row=0, end_row=None):
+
+        if end_row is None:
+            end_row = self.img_height - 1
+
+        return np.diff(self.row_count_cumsum[start_row: end_row + 2])
+
+
+    def count_in_rows(self, start_row, end_row):
+
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        return int(self.row_count_cumsum[end_row + 1] - self.row_count_cumsum[start_row])
+
+
+    def row_counts_at(self, row_arr):
+
+        # Counts of only the rows in `row_arr`
+        return self.row_count_cumsum[row_arr + 1] - self.row_count_cumsum[row_arr]
+
+
+    def longest_row_runs(self, start_row=0, end_row=None):
+
+        # Length of the longest horizontal run in each row (0 if none)
+        if end_row is None:
+            end_row = self.img_height - 1
+
+        return self.longest_h_run_arr[start_row: end_row + 1].copy()
+
+
+    def longest_row_runs_at(self, row_arr):
+        return self.longest_h_run_arr[row_arr]
+
+
+    def clipped_v_run_lens(self, start_row, end_row, run_slice=slice(None)):
+
+        # Length of the part of each vertical run inside rows
+        # [start_row, end_row] (0 if it is outside)
+        clipped_start_rows = np.maximum(self.v_run_start_rows[run_slice], start_row)
+        clipped_end_rows = np.minimum(self.v_run_end_rows[run_slice], end_row)
+
+        return np.maximum(clipped_end_rows - clipped_start_rows + 1, 0)
+
+
+    def col_counts_before_row(self, row):
+
+        # Per-column counts over rows [0, row): the lengths of all the runs
+        # of the col starting before `row`, minus the part of the last one
+        # that reaches `row` or beyond
+        if self.num_v_runs == 0:
+            return np.zeros(self.img_width, dtype="int64")
+
+        col_arr = np.arange(self.img_width, dtype="int64")
+        last_run_idx = np.searchsorted(self.v_run_keys, (col_arr * self.img_height) + row,
+                                       side="left") - 1
+
+        has_run = last_run_idx >= self.v_col_ptr[:-1]
+        last_run_idx = np.maximum(last_run_idx, 0)
+
+        col_count_arr = self.v_run_len_cumsum[last_run_idx + 1] - self.v_run_len_cumsum[self.v_col_ptr[:-1]]
+        col_count_arr -= np.maximum(self.v_run_end_rows[last_run_idx] + 1 - row, 0)
+
+        return np.where(has_run, col_count_arr, 0)
+
+
+    def col_counts(self, start_row, end_row):
+
+        # Per-column counts over rows [start_row, end_row], inclusive
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        return self.col_counts_before_row(end_row + 1) - self.col_counts_before_row(start_row)
+
+
+    def count_in_col(self, col, start_row, end_row):
+
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        run_slice = slice(self.v_col_ptr[col], self.v_col_ptr[col + 1])
+
+        return int(np.sum(self.clipped_v_run_lens(start_row, end_row, run_slice)))
+
+
+    def col_counts_at(self, col_arr, start_row, end_row):
+
+        # Per-column counts over rows [start_row, end_row], inclusive, of only
+        # the columns in `col_arr`
+        return np.array([self.count_in_col(col, start_row, end_row) for col in col_arr], dtype="int64")
+
+
+    def fully_covered_cols(self, start_row, end_row):
+
+        # Boolean array of the columns that are TRUE in every row of
+        # [start_row, end_row]; i.e. whose last run starting at or before
+        # `start_row` reaches `end_row` (e.g. bar lines, over a stave)
+        start_row = max(0, start_row)
+        end_row = min(self.img_height - 1, end_row)
+
+        if self.num_v_runs == 0:
+            return np.zeros(self.img_width, dtype="bool")
+
+        col_arr = np.arange(self.img_width, dtype="int64")
+        last_run_idx = np.searchsorted(self.v_run_keys, (col_arr * self.img_height) + start_row,
+                                       side="right") - 1
+
+        has_run = last_run_idx >= self.v_col_ptr[:-1]
+
+        return np.logical_and(has_run,
+                              self.v_run_end_rows[np.maximum(last_run_idx, 0)] >= end_row)
+
+
+
+# ------------------------------------------------------------------------------
+# The detection code can work either on a plain binary ndarray, or on one of
+# the binary image indices above; these functions hide the difference
+# ------------------------------------------------------------------------------
+
+def get_row_counts(bin_img, row_arr=None):
+
+    # Counts of all the rows, or of only the rows in `row_arr`
+    if isinstance(bin_img, np.ndarray):
+        if row_arr is None:
+            return np.count_nonzero(bin_img, axis=1)
+        return np.count_nonzero(bin_img[row_arr], axis=1)
+
+    if row_arr is None:
+        return bin_img.row_counts()
+    return bin_img.row_counts_at(np.asarray(row_arr))
+
+
+def get_pooled_row_counts(bin_img, row_pool_factor, col_step):
+
+    # --------------------------------------------------------------------------
+    # A cheap, coarse look at the image for long horizontal lines: the row
+    # counts, max-pooled over every `row_pool_factor` rows; i.e. entry [i]
+    # is the largest count among rows
+    # [i * row_pool_factor, (i+1) * row_pool_factor).
+    # The binary image indices have all the row counts at hand; on a plain
+    # ndarray, they are counted on every `col_step`-th column only (long
+    # lines survive the sampling), so the scale is different.
+    # The last, partial pool of rows (if any) is left out
+    # --------------------------------------------------------------------------
+    num_pooled_rows = (bin_img.shape[0] // row_pool_factor) * row_pool_factor
+
+    if isinstance(bin_img, np.ndarray):
+        # (the sampled columns are copied out first; summing the short,
+        # contiguous rows is much faster than counting along a strided view)
+        sample_image = np.ascontiguousarray(bin_img[:num_pooled_rows, ::col_step])
+        count_arr = sample_image.sum(axis=1, dtype="int64")
+    else:
+        count_arr = bin_img.row_counts(0, num_pooled_rows - 1)
+
+    pooled_count_arr = count_arr[::row_pool_factor]
+    for offset in range(1, row_pool_factor):
+        pooled_count_arr = np.maximum(pooled_count_arr, count_arr[offset::row_pool_factor])
+
+    return pooled_count_arr
+
+
+def get_longest_row_runs(bin_img, row_arr=None):
+
+    # Length of the longest run of TRUE pixels in each row (0 if none), of
+    # all the rows, or of only the rows in `row_arr`
+    if not isinstance(bin_img, np.ndarray):
+        if row_arr is None:
+            return bin_img.longest_row_runs()
+        return bin_img.longest_row_runs_at(np.asarray(row_arr))
+
+    if row_arr is not None:
+        bin_img = bin_img[row_arr]
+
+    run_rows, run_start_cols, run_end_cols = RunLengthIndex.encode_row_runs(bin_img)
+
+    longest_run_arr = np.zeros(bin_img.shape[0], dtype="int64")
+    np.maximum.at(longest_run_arr, run_rows, run_end_cols - run_start_cols + 1)
+
+    return longest_run_arr
+
+
+def get_col_counts(bin_img, start_row, end_row):
+
+    if isinstance(bin_img, np.ndarray):
+        return np.count_nonzero(bin_img[start_row: end_row+1, :], axis=0)
+
+    return bin_img.col_counts(start_row, end_row)
+
+
+def get_col_counts_at(bin_img, col_arr, start_row, end_row):
+
+    # Like `get_col_counts`, of only the columns in `col_arr`
+    col_arr = np.asarray(col_arr, dtype="int64")
+
+    if isinstance(bin_img, np.ndarray):
+        return np.count_nonzero(bin_img[start_row: end_row+1, col_arr], axis=0)
+
+    return bin_img.col_counts_at(col_arr, start_row, end_row)
+
+
+def get_fully_covered_cols(bin_img, start_row, end_row):
+
+    # The columns that are TRUE in every row of [start_row, end_row] (clipped
+    # to the image, like slicing would)
+    if isinstance(bin_img, np.ndarray):
+        return np.all(bin_img[max(start_row, 0): end_row+1, :], axis=0)
+
+    return bin_img.fully_covered_cols(start_row, end_row)
+
+
+def get_count_in_col(bin_img, col, start_row, end_row):
+
+    # Like numpy, a negative column counts from the right
+    col = col % bin_img.shape[1]
+
+    if isinstance(bin_img, np.ndarray):
+        return np.count_nonzero(bin_img[start_row: end_row+1, col])
+
+    return bin_img.count_in_col(col, start_row, end_row)
@@ -0,0 +1,166 @@
+import numpy as np
+
+
+# ------------------------------------------------------------------------------
+# HSLuv <-> RGB for whole arrays of colors at once; a NumPy port of the
+# reference `hsluv` package (5.0.4), with the same constants and the same
+# order of operations, so both give the same values (to the last few bits).
+# Colors are along the last axis of the arrays, i.e. shape (..., 3):
+#     - RGB:   [r, g, b] in [0, 1]
+#     - HSLuv: [h, s, l] with h in [0, 360), and s, l in [0, 100]
+# ------------------------------------------------------------------------------
+
+# XYZ-to-sRGB matrix
+M = np.array([[3.240969941904521, -1.537383177570093, -0.498610760293],
+              [-0.96924363628087, 1.87596750150772, 0.041555057407175],
+              [0.055630079696993, -0.20397695888897, 1.056971514242878]])
+# sRGB-to-XYZ matrix
+M_INV = np.array([[0.41239079926595, 0.35758433938387, 0.18048078840183],
+                  [0.21263900587151, 0.71516867876775, 0.072192315360733],
+                  [0.019330818715591, 0.11919477979462, 0.95053215224966]])
+
+REF_Y = 1.0
+REF_U = 0.19783000664283
+REF_V = 0.46831999493879
+KAPPA = 903.2962962
+EPSILON = 0.0088564516
+
+# `hsluv_to_rgb` of the reference package rounds its outputs to this many
+# decimals
+RGB_OUTPUT_DECIMALS = 10
+
+
+def dot_with_matrix_rows(matrix, a, b, c):
+
+    # Each row of the matrix dotted with [a, b, c], summed in the same order
+    # as the reference (rather than with a matmul)
+    return [(matrix[row_idx, 0] * a) + (matrix[row_idx, 1] * b) + (matrix[row_idx, 2] * c)
+            for row_idx in range(3)]
+
+
+def from_linear(c):
+    return np.where(c <= 0.0031308,
+                    12.92 * c,
+                    1.055 * np.power(np.maximum(c, 0.0031308), 5 / 12) - 0.055)
+
+
+def to_linear(c):
+    return np.where(c > 0.04045,
+                    np.power((np.maximum(c, 0.04045) + 0.055) / 1.055, 2.4),
+                    c / 12.92)
+
+
+def y_to_l(y):
+    return np.where(y <= EPSILON,
+                    y / REF_Y * KAPPA,
+                    116 * np.power(np.maximum(y, EPSILON) / REF_Y, 1 / 3) - 16)
+
+
+def l_to_y(l):
+    return np.where(l <= 8,
+                    REF_Y * l / KAPPA,
+                    REF_Y * (((l + 16) / 116) ** 3))
+
+
+def max_chroma_for_lh(l, h):
+
+    # --------------------------------------------------------------------------
+    # The largest chroma (at lightness `l` and hue `h`) that is still inside
+    # the RGB gamut: the gamut boundary at a lightness is 6 lines in the
+    # (u, v) plane, and this is the distance along the hue ray to the nearest
+    # one in front of it
+    # --------------------------------------------------------------------------
+    hrad = np.radians(h)
+    sin_h = np.sin(hrad)
+    cos_h = np.cos(hrad)
+
+    sub1 = ((l + 16) ** 3) / 1560896
+    sub2 = np.where(sub1 > EPSILON, sub1, l / KAPPA)
+
+    max_chroma = np.full(np.shape(l), np.inf)
+    for c in range(3):
+        m1, m2, m3 = M[c]
+
+        for t in range(2):
+            top1 = (284517 * m1 - 94839 * m3) * sub2
+            top2 = (838422 * m3 + 769860 * m2 + 731718 * m1) * l * sub2 - (769860 * t) * l
+            bottom = (632260 * m3 - 126452 * m2) * sub2 + 126452 * t
+
+            slope = top1 / bottom
+            intercept = top2 / bottom
+            length = intercept / (sin_h - slope * cos_h)
+
+            max_chroma = np.where(length >= 0, np.minimum(max_chroma, length), max_chroma)
+
+    return max_chroma
+
+
+def rgb_array_to_hsluv_array(rgb_arr):
+
+    rgb_arr = np.asarray(rgb_arr, dtype="float")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+
+        # RGB -> XYZ
+        x, y, z = dot_with_matrix_rows(M_INV,
+                                       to_linear(rgb_arr[..., 0]),
+                                       to_linear(rgb_arr[..., 1]),
+                                       to_linear(rgb_arr[..., 2]))
+
+        # XYZ -> LUV
+        l = y_to_l(y)
+        is_black = l == 0
+        divider = x + 15 * y + 3 * z
+        u = np.where(is_black, 0.0, 13 * l * ((4 * x / divider) - REF_U))
+        v = np.where(is_black, 0.0, 13 * l * ((9 * y / divider) - REF_V))
+
+        # LUV -> LCH
+        c = np.hypot(u, v)
+        h = np.degrees(np.arctan2(v, u))
+        h = np.where(h < 0, h + 360, h)
+        h = np.where(c < 1e-08, 0.0, h)
+
+        # LCH -> HSLuv; lightness at the very ends has no saturation
+        s = c / max_chroma_for_lh(l, h) * 100
+        s = np.where(l > 100 - 1e-7, 0.0, s)
+        l = np.where(l > 100 - 1e-7, 100.0, l)
+        s = np.where(l < 1e-08, 0.0, s)
+        l = np.where(l < 1e-08, 0.0, l)
+
+    return np.stack([h, s, l], axis=-1)
+
+
+def hsluv_array_to_rgb_array(hsluv_arr):
+
+    hsluv_arr = np.asarray(hsluv_arr, dtype="float")
+    h = hsluv_arr[..., 0]
+    s = hsluv_arr[..., 1]
+    l = hsluv_arr[..., 2]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+
+        # HSLuv -> LCH; lightness at the very ends has no chroma
+        is_white = l > 100 - 1e-7
+        is_black = np.logical_and(l < 1e-08, np.invert(is_white))
+        c = max_chroma_for_lh(l, h) / 100 * s
+        c = np.where(np.logical_or(is_white, is_black), 0.0, c)
+        l = np.where(is_white, 100.0, np.where(is_black, 0.0, l))
+
+        # LCH -> LUV
+        hrad = np.radians(h)
+        u = np.cos(hrad) * c
+        v = np.sin(hrad) * c
+
+        # LUV -> XYZ
+        is_zero_l = l == 0
+        var_u = u / (13 * l) + REF_U
+        var_v = v / (13 * l) + REF_V
+        y = l_to_y(l)
+        x = np.where(is_zero_l, 0.0, y * 9 * var_u / (4 * var_v))
+        z = np.where(is_zero_l, 0.0, y * (12 - 3 * var_u - 20 * var_v) / (4 * var_v))
+        y = np.where(is_zero_l, 0.0, y)
+
+        # XYZ -> RGB
+        rgb_list = [from_linear(linear_c) for linear_c in dot_with_matrix_rows(M, x, y, z)]
+
+    return np.round(np.stack(rgb_list, axis=-1), RGB_OUTPUT_DECIMALS)
@@ -0,0 +1,76 @@
+import numpy as np
+
+
+# Levels are halved until they are no larger than this (in either direction)
+PYRAMID_MIN_LEVEL_SIZE = 512
+
+
+def downsample_image_by_two(image):
+
+    # --------------------------------------------------------------------------
+    # Every 2x2 block of pixels is averaged into one. For odd sizes, the last
+    # row/col is just sampled, so the result is always ceil(H/2) x ceil(W/2)
+    # --------------------------------------------------------------------------
+    img_height = image.shape[0]
+    img_width = image.shape[1]
+    even_height = img_height - (img_height % 2)
+    even_width = img_width - (img_width % 2)
+
+    block_sum = image[0:even_height:2, 0:even_width:2].astype("uint16")
+    block_sum += image[1:even_height:2, 0:even_width:2]
+    block_sum += image[0:even_height:2, 1:even_width:2]
+    block_sum += image[1:even_height:2, 1:even_width:2]
+
+    half_image = np.empty(((img_height + 1) // 2, (img_width + 1) // 2) + image.shape[2:],
+                          dtype=image.dtype)
+    half_image[:even_height // 2, :even_width // 2] = (block_sum + 2) // 4
+
+    if img_height % 2:
+        half_image[-1, :even_width // 2] = image[-1, 0:even_width:2]
+    if img_width % 2:
+        half_image[:, -1] = image[::2, -1]
+
+    return half_image
+
+
+class ImagePyramid:
+
+    # --------------------------------------------------------------------------
+    # The page image at every power of two downscale factor: level `k` has
+    # one pixel for every (2^k x 2^k) block of the full resolution image
+    # (level 0 IS the full resolution image, not a copy).
+    # All the levels together take a third of the memory of the full image.
+    # Displays use the coarsest level that still has a pixel for every screen
+    # pixel, so the amount of pixel data drawn depends on the screen, and not
+    # on the page size
+    # --------------------------------------------------------------------------
+
+    def __init__(self, image, min_level_size=PYRAMID_MIN_LEVEL_SIZE):
+
+        self.full_height = image.shape[0]
+        self.full_width = image.shape[1]
+
+        self.level_list = [image]
+        while max(self.level_list[-1].shape[:2]) > min_level_size:
+            self.level_list.append(downsample_image_by_two(self.level_list[-1]))
+
+        return
+
+
+    @property
+    def num_levels(self):
+        return len(self.level_list)
+
+
+    def get_level(self, level_idx):
+        return self.level_list[level_idx]
+
+
+    def get_level_idx_for_scale(self, full_pixels_per_screen_pixel):
+
+        # The coarsest level whose downscale factor is not above the given one
+        if full_pixels_per_screen_pixel < 2:
+            return 0
+
+        level_idx = int(np.floor(np.log2(full_pixels_per_screen_pixel)))
+        return min(level_idx, self.num_levels - 1)
@@ -0,0 +1,143 @@
+from bisect import bisect_right
+
+
+class IntervalIndex:
+
+    # --------------------------------------------------------------------------
+    # A list of non-overlapping items, each covering a closed interval
+    # [start, end] (e.g. the rows of a stave group, or the cols of a bar),
+    # kept sorted by start; so overlap checks, insertions and point lookups
+    # are binary searches instead of linear scans.
+    #
+    # The limits are read from the items with `get_lims_func(item)`. Since
+    # they can change after the item was inserted (e.g. the page-wide
+    # offsets of the annotation store), the cached limits are re-read when
+    # `get_version_func()` (if given) returns something new
+    # --------------------------------------------------------------------------
+
+    def __init__(self, get_lims_func,
+                 item_list=None,
+                 get_version_func=None):
+
+        self.get_lims_func = get_lims_func
+        self.get_version_func = get_version_func
+
+        self.item_list = []
+        self.start_list = []
+        self.end_list = []
+        self.cached_version = None
+
+        if item_list is not None:
+            self.item_list = sorted(item_list, key=lambda item: self.get_lims_func(item)[0])
+            self.refresh(force=True)
+
+        return
+
+
+    def __len__(self):
+        return len(self.item_list)
+
+
+    def get_version(self):
+
+        if self.get_version_func is None:
+            return None
+
+        return self.get_version_func()
+
+
+    def refresh(self, force=False):
+
+        curr_version = self.get_version()
+        if (not force) and (curr_version == self.cached_version):
+            return
+
+        lims_list = [self.get_lims_func(item) for item in self.item_list]
+        self.start_list = [lims[0] for lims in lims_list]
+        self.end_list = [lims[1] for lims in lims_list]
+        self.cached_version = curr_version
+
+        return
+
+
+    def clear(self):
+
+        self.item_list = []
+        self.start_list = []
+        self.end_list = []
+
+        return
+
+
+    def find_overlapping_index(self, start, end):
+
+        # Since the existing intervals are disjoint and sorted, only the last
+        # one starting at or before `start`, and the first one starting after
+        # it can overlap [start, end]
+        self.refresh()
+
+        pos = bisect_right(self.start_list, start)
+        if (pos > 0) and (self.end_list[pos - 1] >= start):
+            return pos - 1
+        if (pos < len(self.start_list)) and (self.start_list[pos] <= end):
+            return pos
+
+        return None
+
+
+    def find_overlapping(self, start, end):
+
+        idx = self.find_overlapping_index(start, end)
+        if idx is None:
+            return None
+
+        return self.item_list[idx]
+
+
+    def find_all_overlapping(self, start, end):
+
+        # Every item overlapping [start, end], in order
+        self.refresh()
+
+        start_pos = bisect_right(self.start_list, start) - 1
+        if (start_pos < 0) or (self.end_list[start_pos] < start):
+            start_pos += 1
+        end_pos = bisect_right(self.start_list, end)
+
+        return self.item_list[start_pos: end_pos]
+
+
+    def insert(self, item):
+
+        # Returns the position of the new item; the caller is expected to
+        # have checked for overlaps
+        self.refresh()
+
+        start, end = self.get_lims_func(item)
+        pos = bisect_right(self.start_list, start)
+
+        self.item_list.insert(pos, item)
+        self.start_list.insert(pos, start)
+        self.end_list.insert(pos, end)
+
+        return pos
+
+
+    def find_index_at(self, point):
+
+        self.refresh()
+
+        pos = bisect_right(self.start_list, point) - 1
+        if (pos >= 0) and (point <= self.end_list[pos]):
+            return pos
+
+        return None
+
+
+    def find_at(self, point):
+
+        idx = self.find_index_at(point)
+        if idx is None:
+            return None
+
+        return self.item_list[idx]
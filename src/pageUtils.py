@@ -5,9 +5,14 @@ import numpy as np
 from skimage.color import rgb2gray
 from imageio import imread, imwrite
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+from matplotlib.colors import to_rgb
 
 from staveUtils import StaveGroup
+from annotationStore import AnnotationStore
+from intervalIndex import IntervalIndex
+from binaryImageUtils import PackedBinaryImage, RunLengthIndex
+from imagePyramid import ImagePyramid
+from pdf_to_image import get_png_image_shape
 
 
 SG_OVERLAY_COLOR = "teal"
@@ -17,29 +22,162 @@ BAR_OVERLAY_EVEN_COLOR = "mediumorchid"
 BAR_OVERLAY_ODD_COLOR = "seagreen"
 BAR_OVERLAY_ALPHA = 0.25
 
+# Overlay labels, and the (RGB, alpha) each of them is blended with
+OVERLAY_LABEL_SG = 1
+OVERLAY_LABEL_BAR_EVEN = 2
+OVERLAY_LABEL_BAR_ODD = 3
+OVERLAY_LABEL_RGB_ALPHA_DICT = {
+    OVERLAY_LABEL_SG: (to_rgb(SG_OVERLAY_COLOR), SG_OVERLAY_ALPHA),
+    OVERLAY_LABEL_BAR_EVEN: (to_rgb(BAR_OVERLAY_EVEN_COLOR), BAR_OVERLAY_ALPHA),
+    OVERLAY_LABEL_BAR_ODD: (to_rgb(BAR_OVERLAY_ODD_COLOR), BAR_OVERLAY_ALPHA),
+}
+
+# skimage's `rgb2gray` weights (0.2125, 0.7154, 0.0721), as integer multiples
+# of 1 / RGB2GRAY_FIXED_POINT_SCALE
+RGB2GRAY_FIXED_POINT_WEIGHTS = (2125, 7154, 721)
+RGB2GRAY_FIXED_POINT_SCALE = 10000
+BINARIZE_CHUNK_ROWS = 256
+
 
 
 class Page:
 
     def __init__(self, orig_image_filepath=None,
-                 sg_list=None):
+                 sg_list=None,
+                 orig_image=None,
+                 bin_image=None,
+                 orig_image_filename=None,
+                 page_height=None,
+                 page_width=None,
+                 image_loader=None):
+
+        # ----------------------------------------------------------------------
+        # The page image is either given directly as `orig_image` (along with
+        # its `bin_image`, if it is already available), or read from
+        # `orig_image_filepath`.
+        # Reading is lazy: the image is only read (and binarized) when
+        # `orig_image`/`bin_image` are first accessed, so pages that are only
+        # needed for their annotations never touch the pixel data. The page
+        # size comes from `page_height`/`page_width` if given, else from the
+        # PNG header.
+        # If `image_loader` is given, it is called (instead of reading
+        # `orig_image_filepath`) to get the page image, e.g. from a project
+        # file.
+        # ----------------------------------------------------------------------
+        self.orig_image_filepath = orig_image_filepath
+        self.image_loader = image_loader
+
+        if orig_image_filename is not None:
+            self.orig_image_filename = orig_image_filename
+        else:
+            self.orig_image_filename = os.path.basename(orig_image_filepath)
 
-        self.orig_image_filename = os.path.basename(orig_image_filepath)
-        self.orig_image = imread(orig_image_filepath)
-        self.bin_image = binarize_image(self.orig_image, thresh=254)
+        self._orig_image = orig_image
+        self._bin_image = bin_image
+        self.packed_bin_image = None
+        self.run_length_index = None
+        self.display_pyramid = None
+        self.is_image_data_modified = False
 
-        self.page_height = self.orig_image.shape[0]
-        self.page_width = self.orig_image.shape[1]
+        if orig_image is not None:
+            self.page_height = orig_image.shape[0]
+            self.page_width = orig_image.shape[1]
+
+        elif (page_height is not None) and (page_width is not None):
+            self.page_height = page_height
+            self.page_width = page_width
 
-        if sg_list is None:
-            self.sg_list = []
         else:
-            self.sg_list = sg_list
+            image_shape = get_png_image_shape(orig_image_filepath)
+            if image_shape is None:
+                image_shape = self.orig_image.shape
+
+            self.page_height = image_shape[0]
+            self.page_width = image_shape[1]
+
+        # All the staves/bars of the page live in one store, so page-wide
+        # edits of their rows/cols are vectorized
+        self.annotation_store = AnnotationStore()
+
+        # The stave groups, sorted by rows, in an interval index (which also
+        # holds the `sg_list`)
+        self.sg_index = IntervalIndex(get_sg_row_lims, sg_list,
+                                      get_version_func=self.get_annotation_store_version)
 
         self.num_sg = len(self.sg_list)
+        for sg in self.sg_list:
+            sg.assign_parent_page(self)
+
+        self.low_res_detection_image = None
+
+        # Auto-detection results (e.g. the stave/bar line candidates of the
+        # selector GUIs), by key; they depend on the image, so any change of
+        # the image data (or of the detection image) drops them
+        self.detection_candidate_cache = {}
 
         return
 
+
+    @property
+    def sg_list(self):
+        return self.sg_index.item_list
+
+
+    def get_annotation_store_version(self):
+        return self.annotation_store, self.annotation_store.version
+
+
+    @property
+    def orig_image(self):
+        if self._orig_image is None:
+            if self.image_loader is not None:
+                self._orig_image = self.image_loader()
+            else:
+                self._orig_image = imread(self.orig_image_filepath)
+        return self._orig_image
+
+
+    @orig_image.setter
+    def orig_image(self, image):
+        self._orig_image = image
+        self.display_pyramid = None
+
+
+    @property
+    def bin_image(self):
+        if self._bin_image is None:
+            self._bin_image = binarize_image(self.orig_image, thresh=254)
+        return self._bin_image
+
+
+    @bin_image.setter
+    def bin_image(self, image):
+        self._bin_image = image
+
+
+    def is_image_data_loaded(self):
+        return (self._orig_image is not None) or (self._bin_image is not None)
+
+
+    def release_image_data(self):
+
+        # Drop the pixel data; it is read again from disk on the next access.
+        # Pages that only live in memory (no image file, or modified since
+        # they were read) can not be released
+        has_image_source = (self.orig_image_filepath is not None) or (self.image_loader is not None)
+        if (not has_image_source) or self.is_image_data_modified:
+            print("Page {} has no up-to-date image file; not releasing its image data".format(self.orig_image_filename))
+            return False
+
+        self._orig_image = None
+        self._bin_image = None
+        self.packed_bin_image = None
+        self.run_length_index = None
+        self.display_pyramid = None
+
+        return True
+
+
     @classmethod
     def make_object_from_dict(cls, input_dir, page_dict):
         try:
@@ -53,7 +191,9 @@ class Page:
                 print("Image {} not found".format(orig_image_filepath))
                 return None
 
-            page_obj = cls(orig_image_filepath)
+            page_obj = cls(orig_image_filepath,
+                           page_height=page_dict.get("page_height", None),
+                           page_width=page_dict.get("page_width", None))
 
             for sg_dict in page_dict["sg_list"]:
                 sg_obj = StaveGroup.make_object_from_dict(page_obj, sg_dict)
@@ -117,43 +257,105 @@ class Page:
 
     def add_stave_group(self, new_sg):
 
-        if self.num_sg == 0:
-            insert_pos = 0
-
-        else:
-            existing_sg_top_rows = [ex_sg.top_lim_row for ex_sg in self.sg_list]
-            existing_sg_bottom_rows = [ex_sg.bottom_lim_row for ex_sg in self.sg_list]
-
-            new_sg_top_row = new_sg.top_lim_row
-            new_sg_bottom_row = new_sg.bottom_lim_row
-
-            # Check that the new stave does not overlap with existing staves!
-            for ex_top, ex_bottom in zip(existing_sg_top_rows, existing_sg_bottom_rows):
-                if ((ex_top <= new_sg_top_row <= ex_bottom) or
-                    (ex_top <= new_sg_bottom_row <= ex_bottom)):
-                    raise Exception("New stave group ({}, {}) overlaps existing stave group ({}, {})!".format(
-                        new_sg_top_row, new_sg_bottom_row,
-                        ex_top, ex_bottom
-                    ))
-
-            insert_pos = 0
-            for ex_top in existing_sg_top_rows:
-                if new_sg_top_row < ex_top:
-                    break
-                else:
-                    insert_pos += 1
+        new_sg_top_row = new_sg.top_lim_row
+        new_sg_bottom_row = new_sg.bottom_lim_row
 
+        # Check that the new stave group does not overlap with existing ones!
+        ex_sg = self.sg_index.find_overlapping(new_sg_top_row, new_sg_bottom_row)
+        if ex_sg is not None:
+            raise Exception("New stave group ({}, {}) overlaps existing stave group ({}, {})!".format(
+                new_sg_top_row, new_sg_bottom_row,
+                ex_sg.top_lim_row, ex_sg.bottom_lim_row
+            ))
 
-        self.sg_list.insert(insert_pos, new_sg)
         new_sg.assign_parent_page(self)
+        self.sg_index.insert(new_sg)
         self.num_sg += 1
 
         return
 
 
+    def find_stave_group_at_row(self, row):
+        return self.sg_index.find_at(row)
+
+
+    def set_detection_image(self, detection_image, thresh=254):
+
+        # ----------------------------------------------------------------------
+        # Stave and bar detection only need a binary image; so they can run on
+        # a cheap, reduced resolution (grayscale) render of this page, e.g.
+        # from `iterate_pdf_page_images(..., grayscale=True)`.
+        # The detected rows/cols are mapped back to this page's (full)
+        # resolution by the `DetectionImage`
+        # ----------------------------------------------------------------------
+        detection_bin_image = binarize_image(detection_image, thresh=thresh)
+        self.set_packed_detection_image(PackedBinaryImage(detection_bin_image))
+
+        return
+
+
+    def set_packed_detection_image(self, packed_detection_image):
+
+        # Same as `set_detection_image`, from an already binarized (and
+        # packed) render; e.g. the one of this page in another process
+        self.low_res_detection_image = DetectionImage(packed_detection_image,
+                                                      self.page_height, self.page_width)
+        self.detection_candidate_cache = {}
+
+        return
+
+
+    def get_packed_bin_image(self):
+
+        # Built on first use, and then reused by every detection pass
+        if self.packed_bin_image is None:
+            self.packed_bin_image = PackedBinaryImage(self.bin_image)
+
+        return self.packed_bin_image
+
+
+    def get_run_length_index(self):
+
+        # Built on first use, and then reused (e.g. every time a GUI reopens)
+        if self.run_length_index is None:
+            self.run_length_index = RunLengthIndex(self.bin_image)
+
+        return self.run_length_index
+
+
+    def get_display_pyramid(self):
+
+        # Built on first use, and then reused every time a GUI (re)opens
+        if self.display_pyramid is None:
+            self.display_pyramid = ImagePyramid(self.orig_image)
+
+        return self.display_pyramid
+
+
+    def get_detection_image(self, use_run_length_index=True):
+
+        # Without a low resolution render, detection runs on the full
+        # resolution binary image itself; indexed as run lengths (which also
+        # answer the run queries of the detection directly), or bit-packed
+        if self.low_res_detection_image is not None:
+            return self.low_res_detection_image
+
+        if use_run_length_index:
+            detection_bin_image = self.get_run_length_index()
+        else:
+            detection_bin_image = self.get_packed_bin_image()
+
+        return DetectionImage(detection_bin_image,
+                              self.page_height, self.page_width)
+
+
     def delete_sg_list(self):
-        self.sg_list = []
+
+        # The deleted groups keep the old store; new ones start a fresh one
+        self.sg_index.clear()
         self.num_sg = 0
+        self.annotation_store = AnnotationStore()
+
         return
 
 
@@ -164,6 +366,9 @@ class Page:
         elif self.page_width < target_page_width:
             self.increase_page_width(target_page_width)
 
+        if self.page_width != target_page_width:
+            self.is_image_data_modified = True
+
         self.page_width = target_page_width
 
         return
@@ -178,6 +383,9 @@ class Page:
 
         excess_bin_array = np.zeros((self.page_height, width_diff), dtype="bool")
         self.bin_image = np.concatenate([self.bin_image, excess_bin_array], axis=1)
+        self.packed_bin_image = None
+        self.run_length_index = None
+        self.detection_candidate_cache = {}
 
         return
 
@@ -186,6 +394,9 @@ class Page:
 
         self.orig_image = self.orig_image[:, :target_page_width, :]
         self.bin_image = self.bin_image[:, :target_page_width]
+        self.packed_bin_image = None
+        self.run_length_index = None
+        self.detection_candidate_cache = {}
 
         self.adjust_lims_for_new_page_width(target_page_width)
 
@@ -194,27 +405,24 @@ class Page:
 
     def adjust_lims_for_new_page_width(self, target_page_width):
 
-        for sg in self.sg_list:
-            sg.adjust_lims_for_new_page_width(target_page_width)
+        self.annotation_store.clamp_right_cols(target_page_width)
 
         return
 
 
     def offset_row_lims(self, offset):
 
-        for sg in self.sg_list:
-            sg.offset_row_lims(offset)
+        self.annotation_store.offset_rows(offset)
 
         return
 
 
-    def show_overlays(self):
-
-        overlay_image = self.orig_image.copy()
+    def get_overlay_rect_list(self):
 
-        figure = plt.figure()
-        ax = plt.gca()
-        ax.imshow(overlay_image)
+        # (top_row, bottom_row, left_col, right_col, label) of every overlay
+        # rectangle, inclusive; the bars of each stave group, or the whole
+        # stave group if it has no bars
+        rect_list = []
 
         for sg in self.sg_list:
 
@@ -223,20 +431,14 @@ class Page:
 
             if sg.num_bars > 0:
                 for bar_idx, bar in enumerate(sg.bar_list):
-                    left_col = bar.inner_left_col
-                    right_col = bar.inner_right_col
-
                     if (bar_idx % 2) == 0:
-                        curr_color = BAR_OVERLAY_EVEN_COLOR
+                        curr_label = OVERLAY_LABEL_BAR_EVEN
                     else:
-                        curr_color = BAR_OVERLAY_ODD_COLOR
+                        curr_label = OVERLAY_LABEL_BAR_ODD
 
-                    curr_bar_overlay = patches.Rectangle((left_col - 1, top_row - 1),
-                                                         right_col - left_col + 1,
-                                                         bottom_row - top_row + 1,
-                                                         color=curr_color,
-                                                         alpha=BAR_OVERLAY_ALPHA)
-                    ax.add_patch(curr_bar_overlay)
+                    rect_list.append((top_row, bottom_row,
+                                      bar.inner_left_col, bar.inner_right_col,
+                                      curr_label))
 
             else:
                 if sg.left_lim_col is None:
@@ -249,12 +451,61 @@ class Page:
                 else:
                     right_col = sg.right_lim_col
 
-                curr_sg_overlay = patches.Rectangle((left_col-1, top_row-1),
-                                                    right_col-left_col + 1,
-                                                    bottom_row-top_row + 1,
-                                                    color=SG_OVERLAY_COLOR,
-                                                    alpha=SG_OVERLAY_ALPHA)
-                ax.add_patch(curr_sg_overlay)
+                rect_list.append((top_row, bottom_row, left_col, right_col,
+                                  OVERLAY_LABEL_SG))
+
+        return rect_list
+
+
+    def render_overlays(self, downscale_factor=1):
+
+        # ----------------------------------------------------------------------
+        # Render the SG/bar overlays straight into (a copy of) the page image,
+        # without matplotlib; so it also works headless, on any number of
+        # bars. The image is downscaled by taking every `downscale_factor`-th
+        # row and col.
+        # The rectangles are first painted as labels into a uint8 label image
+        # (one slice assignment each), and every label is then alpha-blended
+        # in one vectorized pass over its pixels.
+        # ----------------------------------------------------------------------
+        f = downscale_factor
+
+        overlay_image = self.orig_image[::f, ::f]
+        if overlay_image.ndim == 2:
+            overlay_image = np.stack([overlay_image] * 3, axis=2)
+        else:
+            overlay_image = overlay_image[..., :3].copy()
+
+        label_image = np.zeros(overlay_image.shape[:2], dtype="uint8")
+        for (top_row, bottom_row, left_col, right_col, label) in self.get_overlay_rect_list():
+            label_image[top_row // f: (bottom_row // f) + 1,
+                        left_col // f: (right_col // f) + 1] = label
+
+        for label, (rgb, alpha) in OVERLAY_LABEL_RGB_ALPHA_DICT.items():
+            is_label = (label_image == label)
+            if not np.any(is_label):
+                continue
+
+            color = np.array(rgb, dtype="float32") * 255
+            blended = ((1.0 - alpha) * overlay_image[is_label].astype("float32")) + (alpha * color)
+            overlay_image[is_label] = np.round(blended).astype("uint8")
+
+        return overlay_image
+
+
+    def write_overlay_image(self, overlay_image_filepath, downscale_factor=1):
+
+        imwrite(overlay_image_filepath,
+                self.render_overlays(downscale_factor=downscale_factor))
+
+        return
+
+
+    def show_overlays(self):
+
+        figure = plt.figure()
+        ax = plt.gca()
+        ax.imshow(self.render_overlays())
 
         plt.show()
         plt.close()
@@ -263,48 +514,252 @@ class Page:
 
 
 
-def binarize_image(sample_img, thresh):
-    sample_grayscale_img = (rgb2gray(sample_img) * 255).astype("uint8")
-    sample_bin_img = sample_grayscale_img <= thresh
-    return sample_bin_img
+def get_sg_row_lims(sg):
+    return sg.top_lim_row, sg.bottom_lim_row
+
+
+
+class DetectionImage:
+
+    def __init__(self,
+                 bin_image,
+                 full_height, full_width):
+
+        self.bin_image = bin_image
+
+        self.full_height = full_height
+        self.full_width = full_width
+
+        # Number of full resolution rows/cols covered by one detection row/col
+        self.row_scale = full_height / float(self.bin_image.shape[0])
+        self.col_scale = full_width / float(self.bin_image.shape[1])
+
+        self.is_full_resolution = ((self.bin_image.shape[0] == full_height) and
+                                   (self.bin_image.shape[1] == full_width))
+
+        return
+
+
+    def rows_to_detection(self, full_rows):
+
+        full_rows = np.asarray(full_rows, dtype="int")
+        if self.is_full_resolution:
+            return full_rows
+
+        detection_rows = np.floor(full_rows / self.row_scale).astype("int")
+        return np.clip(detection_rows, 0, self.bin_image.shape[0] - 1)
+
+
+    @staticmethod
+    def span_to_full(start_arr, end_arr, scale, full_len):
+
+        # Detection index `i` covers the full resolution indices
+        # [i * scale, (i+1) * scale); so a detected span [start, end] covers
+        # [floor(start * scale), ceil((end+1) * scale) - 1]
+        full_start_arr = np.floor(np.asarray(start_arr) * scale).astype("int")
+        full_end_arr = np.ceil((np.asarray(end_arr) + 1) * scale).astype("int") - 1
+
+        full_start_arr = np.clip(full_start_arr, 0, full_len - 1)
+        full_end_arr = np.clip(full_end_arr, 0, full_len - 1)
+
+        return full_start_arr, full_end_arr
+
+
+    def rows_to_full(self, top_rows, bottom_rows):
 
+        if self.is_full_resolution:
+            return top_rows, bottom_rows
+
+        return self.span_to_full(top_rows, bottom_rows,
+                                 self.row_scale, self.full_height)
+
+
+    def cols_to_full(self, left_cols, right_cols):
+
+        if self.is_full_resolution:
+            return left_cols, right_cols
+
+        return self.span_to_full(left_cols, right_cols,
+                                 self.col_scale, self.full_width)
+
+
+
+def write_overlay_images(page_obj_list,
+                         overlay_image_folder,
+                         downscale_factor=1,
+                         release_image_data=False):
+
+    # --------------------------------------------------------------------------
+    # Headless QA of a batch of pages: write one overlay PNG per page,
+    # "overlay_<page index>.png". With `release_image_data`, each page's
+    # pixels are released once it is written, so only one page is in memory
+    # at a time
+    # --------------------------------------------------------------------------
+    overlay_image_filepath_list = []
+
+    for page_idx, page_obj in enumerate(page_obj_list):
+        overlay_image_filepath = os.path.join(overlay_image_folder,
+                                              "overlay_{:04d}.png".format(page_idx))
+        page_obj.write_overlay_image(overlay_image_filepath,
+                                     downscale_factor=downscale_factor)
+        overlay_image_filepath_list.append(overlay_image_filepath)
+
+        if release_image_data:
+            page_obj.release_image_data()
+
+    return overlay_image_filepath_list
+
+
+def binarize_image(sample_img, thresh,
+                   out=None,
+                   chunk_rows=BINARIZE_CHUNK_ROWS):
+
+    # Grayscale images (e.g. the reduced resolution detection renders) are
+    # used as they are
+    if sample_img.ndim == 2:
+        return np.less_equal(sample_img, thresh, out=out)
+
+    # Anything other than 8-bit RGB(A) goes through skimage
+    if sample_img.dtype != np.uint8:
+        sample_grayscale_img = (rgb2gray(sample_img[..., :3]) * 255).astype("uint8")
+        return np.less_equal(sample_grayscale_img, thresh, out=out)
+
+    # --------------------------------------------------------------------------
+    # Integer path:
+    # skimage's `rgb2gray` weights are exact multiples of 1/10000, so the
+    # grayscale value is (R*2125 + G*7154 + B*721) / 10000, which fits in a
+    # uint32 and needs no float temporaries. A pixel is "ink" if its
+    # grayscale value, truncated to uint8, is <= thresh; i.e. if the fixed
+    # point luma is < (thresh+1) * 10000.
+    # The only pixels where float rounding could make `rgb2gray` disagree are
+    # the ones with a luma of EXACTLY (thresh+1) * 10000; those (very few)
+    # pixels are passed through `rgb2gray` itself, so the result is identical.
+    # The image is processed in chunks of rows, written straight into `out`.
+    # --------------------------------------------------------------------------
+    img_height = sample_img.shape[0]
+    img_width = sample_img.shape[1]
+
+    if out is None:
+        out = np.empty((img_height, img_width), dtype="bool")
+
+    luma_limit = (int(thresh) + 1) * RGB2GRAY_FIXED_POINT_SCALE
+
+    for start_row in range(0, img_height, chunk_rows):
+        end_row = min(start_row + chunk_rows, img_height)
+        chunk = sample_img[start_row: end_row]
+
+        luma = np.multiply(chunk[..., 0], RGB2GRAY_FIXED_POINT_WEIGHTS[0], dtype="uint32")
+        luma += np.multiply(chunk[..., 1], RGB2GRAY_FIXED_POINT_WEIGHTS[1], dtype="uint32")
+        luma += np.multiply(chunk[..., 2], RGB2GRAY_FIXED_POINT_WEIGHTS[2], dtype="uint32")
+
+        out_chunk = out[start_row: end_row]
+        np.less(luma, luma_limit, out=out_chunk)
+
+        boundary_rows, boundary_cols = np.nonzero(luma == luma_limit)
+        if len(boundary_rows) > 0:
+            boundary_pixels = chunk[boundary_rows, boundary_cols, :3][:, np.newaxis, :]
+            boundary_gray = (rgb2gray(boundary_pixels)[:, 0] * 255).astype("uint8")
+            out_chunk[boundary_rows, boundary_cols] = boundary_gray <= thresh
+
+    return out
 
 
 def combine_pages_into_one_page(single_page_obj_list,
                                 target_page_width,
                                 single_page_image_folder,
-                                combined_page_image_folder):
+                                combined_page_image_folder,
+                                write_combined_image=True):
+
+    # --------------------------------------------------------------------------
+    # The combined page is built in memory, from the images and binary images
+    # the single pages have already loaded; nothing is re-read or re-binarized.
+    # Each page is cropped/zero-padded to `target_page_width` (like
+    # `Page.adjust_page_width` does) and written straight into preallocated
+    # combined arrays.
+    # The annotations are copied (so the single pages are left untouched)
+    # straight into the combined page's annotation store, and each single
+    # page's copies are then offset and clamped with one array operation.
+    # The combined image is only written to `combined_page_image_folder` if
+    # `write_combined_image` is set.
+    # NOTE: `single_page_image_folder` is not needed anymore, since the
+    #       single page images are not re-read; it is kept for compatibility
+    # --------------------------------------------------------------------------
+
+    total_height = sum([page_obj.page_height for page_obj in single_page_obj_list])
+    channel_shape = single_page_obj_list[0].orig_image.shape[2:]
+
+    combined_image = np.zeros((total_height, target_page_width) + channel_shape,
+                              dtype=single_page_obj_list[0].orig_image.dtype)
+    # The zero padding is black, i.e. "ink"; so the binary padding is TRUE,
+    # exactly as if the combined image had been binarized as a whole
+    combined_bin_image = np.ones((total_height, target_page_width), dtype="bool")
+
+    combined_image_filename = "combined_page.png"
+
+    combined_page_obj = Page(None,
+                             orig_image=combined_image,
+                             bin_image=combined_bin_image,
+                             orig_image_filename=combined_image_filename)
 
-    new_single_page_image_list = []
-    new_single_page_obj_list = []
     running_height = 0
 
     for page_obj in single_page_obj_list:
-        curr_page_obj = Page.make_object_from_dict(single_page_image_folder,
-                                                   page_obj.to_dict())
-        orig_width = curr_page_obj.page_width
-        orig_height = curr_page_obj.page_height
-
-        if orig_width != target_page_width:
-            curr_page_obj.adjust_page_width(target_page_width)
+        orig_height = page_obj.page_height
+        common_width = min(page_obj.page_width, target_page_width)
 
-        curr_page_obj.offset_row_lims(running_height)
-
-        new_single_page_image_list.append(curr_page_obj.orig_image)
-        new_single_page_obj_list.append(curr_page_obj)
+        combined_image[running_height: running_height + orig_height,
+                       :common_width] = page_obj.orig_image[:, :common_width]
+        combined_bin_image[running_height: running_height + orig_height,
+                           :common_width] = page_obj.bin_image[:, :common_width]
 
         running_height += orig_height
 
 
-    combined_image = np.concatenate(new_single_page_image_list, axis=0)
-    combined_image_filepath = os.path.join(combined_page_image_folder, "combined_page.png")
-    imwrite(combined_image_filepath,
-            combined_image)
+    if write_combined_image:
+        combined_page_obj.orig_image_filepath = os.path.join(combined_page_image_folder,
+                                                             combined_image_filename)
+        imwrite(combined_page_obj.orig_image_filepath,
+                combined_image)
 
-    combined_page_obj = Page(combined_image_filepath)
-    for new_single_page_obj in new_single_page_obj_list:
-        for new_sg in new_single_page_obj.sg_list:
-            combined_page_obj.add_stave_group(new_sg)
+    merge_page_annotations_into_combined_page(single_page_obj_list, combined_page_obj,
+                                              target_page_width)
 
 
     return combined_page_obj
+
+
+def merge_page_annotations_into_combined_page(single_page_obj_list,
+                                              combined_page_obj,
+                                              target_page_width):
+
+    # --------------------------------------------------------------------------
+    # Copy the annotations of the single pages (stacked vertically, in order)
+    # into the combined page, replacing its own: each page's stave groups are
+    # copied straight into the combined page's annotation store, and then
+    # offset by the page's starting row (and clamped to `target_page_width`)
+    # with one array operation per page
+    # --------------------------------------------------------------------------
+    if combined_page_obj.num_sg > 0:
+        combined_page_obj.delete_sg_list()
+
+    annotation_store = combined_page_obj.annotation_store
+
+    new_sg_list = []
+    running_height = 0
+
+    for page_obj in single_page_obj_list:
+
+        page_store_sizes = annotation_store.get_sizes()
+        for sg in page_obj.sg_list:
+            new_sg_list.append(StaveGroup.make_object_from_dict(combined_page_obj, sg.to_dict()))
+
+        if page_obj.page_width > target_page_width:
+            annotation_store.clamp_right_cols(target_page_width, since=page_store_sizes)
+        annotation_store.offset_rows(running_height, since=page_store_sizes)
+
+        running_height += page_obj.page_height
+
+    for new_sg in new_sg_list:
+        combined_page_obj.add_stave_group(new_sg)
+
+    return
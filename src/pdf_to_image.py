@@ -1,5 +1,9 @@
 import subprocess
 import os
+import shutil
+import hashlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import imageio
@@ -16,7 +20,7 @@ def get_page_size(input_pdf_filepath):
                               capture_output=True)
     if proc_obj.returncode != 0:
         print("Error when running `pdfinfo` on given PDF")
-        return width, height
+        return height, width
 
     # Make a list from the `pdfinfo` output lines
     info_list = proc_obj.stdout.decode("utf-8").split("\n")
@@ -45,40 +49,238 @@ def get_page_size(input_pdf_filepath):
     return height, width
 
 
+# `pdfinfo` clamps the last page to the number of pages in the document, so
+# asking for this many pages prints the info of every page in a single call
+PDFINFO_LAST_PAGE_SENTINEL = 999999
+
+
+class PageGeometry:
+
+    def __init__(self,
+                 page_number,
+                 width_pts, height_pts,
+                 rotation=0):
+
+        self.page_number = page_number
+        self.width_pts = width_pts
+        self.height_pts = height_pts
+        self.rotation = rotation % 360
+
+        # Rasterizers honour the page rotation, so a page rotated by 90 or
+        # 270 degrees comes out with its width and height swapped
+        if self.rotation in (90, 270):
+            self.rendered_width_pts = self.height_pts
+            self.rendered_height_pts = self.width_pts
+        else:
+            self.rendered_width_pts = self.width_pts
+            self.rendered_height_pts = self.height_pts
+
+        return
+
+
+    def get_resolution_for_width(self, output_page_width_px):
+
+        # 72 pixels = 1 inch; that's the PDF standard
+        return (output_page_width_px * 72.0) / float(self.rendered_width_pts)
+
+
+def get_page_geometry_list(input_pdf_filepath):
+
+    # --------------------------------------------------------------------------
+    # Build a per-page geometry index from ONE `pdfinfo -f 1 -l <N>` call.
+    # With a page range, `pdfinfo` prints two lines for every page:
+    #     "Page    1 size: 595.276 x 841.89 pts (A4)"
+    #     "Page    1 rot:  0"
+    # Returns a list of `PageGeometry` objects in page order, or None if
+    # there are any errors
+    # --------------------------------------------------------------------------
+
+    proc_obj = subprocess.run(["pdfinfo",
+                               "-f", "1",
+                               "-l", str(PDFINFO_LAST_PAGE_SENTINEL),
+                               input_pdf_filepath],
+                              capture_output=True)
+    if proc_obj.returncode != 0:
+        print("Error when running `pdfinfo` on given PDF")
+        return None
+
+    size_dict = {}
+    rotation_dict = {}
+
+    info_list = proc_obj.stdout.decode("utf-8").split("\n")
+    for line in info_list:
+        tokens = line.split()
+        if (len(tokens) < 4) or (tokens[0] != "Page") or (not tokens[1].isdigit()):
+            continue
+
+        page_number = int(tokens[1])
+
+        if tokens[2] == "size:":
+            # Same "<width> x <height>" pattern as in `get_page_size`
+            x_idx = tokens.index("x")
+            size_dict[page_number] = (float(tokens[x_idx-1]), float(tokens[x_idx+1]))
+
+        elif tokens[2] == "rot:":
+            rotation_dict[page_number] = int(float(tokens[3]))
+
+    if len(size_dict) == 0:
+        print("Could not get page sizes")
+        return None
+
+    page_geometry_list = [PageGeometry(page_number,
+                                       size_dict[page_number][0], size_dict[page_number][1],
+                                       rotation_dict.get(page_number, 0))
+                          for page_number in sorted(size_dict.keys())]
+
+    return page_geometry_list
+
+
+def group_pages_into_ranges(page_number_list,
+                           max_range_len=None,
+                           page_key_dict=None):
+
+    # Group the (sorted, 1-indexed) page numbers into contiguous, inclusive
+    # (first_page, last_page) ranges, each at most `max_range_len` long.
+    # If `page_key_dict` is given, pages are only grouped together if they
+    # have the same key (e.g. the same rasterization resolution)
+    page_range_list = []
+
+    for page_number in page_number_list:
+        if len(page_range_list) > 0:
+            first_page, last_page = page_range_list[-1]
+            is_contiguous = (page_number == last_page + 1)
+            is_full = ((max_range_len is not None) and
+                       ((last_page - first_page + 1) >= max_range_len))
+            is_same_key = ((page_key_dict is None) or
+                           (page_key_dict[page_number] == page_key_dict[last_page]))
+
+            if is_contiguous and is_same_key and not is_full:
+                page_range_list[-1] = (first_page, page_number)
+                continue
+
+        page_range_list.append((page_number, page_number))
+
+    return page_range_list
+
+
+def run_pdftocairo(input_pdf_filepath,
+                   resolution,
+                   output_prefix,
+                   first_page=None,
+                   last_page=None):
+
+    cmd = ["pdftocairo", "-png",
+           "-r", str(resolution)]
+
+    if first_page is not None:
+        cmd += ["-f", str(first_page)]
+    if last_page is not None:
+        cmd += ["-l", str(last_page)]
+
+    cmd += [input_pdf_filepath, output_prefix]
+
+    proc_obj = subprocess.run(cmd, capture_output=True)
+
+    return proc_obj.returncode == 0
+
+
 def convert_pdf_to_single_page_images(input_pdf_filepath,
                                       output_page_width_px,
                                       temp_output_dir,
-                                      single_page_prefix="single_page"):
+                                      single_page_prefix="single_page",
+                                      num_workers=1,
+                                      pages_per_job=None,
+                                      raster_cache=None,
+                                      per_page_resolution=False):
 
     single_page_image_fp_list = None
 
-    # Note: `pdfinfo` returns height and width in points
-    orig_height, orig_width = get_page_size(input_pdf_filepath)
-
-    # Calculate output resolution of pdf-to-image conversion
-    # 72 pixels = 1 inch; that's the PDF standard
-    new_resolution = (output_page_width_px * 72.0) / float(orig_width)
+    output_prefix = os.path.join(temp_output_dir, single_page_prefix)
+
+    # --------------------------------------------------------------------------
+    # Serial mode: a single `pdftocairo` run rasterizes every page.
+    # Parallel mode: the document is split into page ranges (`-f`/`-l`), and
+    # one `pdftocairo` run per range is launched from a thread pool. The heavy
+    # lifting happens in the child processes, so threads are enough here.
+    # Each run writes files with the same prefix and page-number suffix, so
+    # the output folder looks exactly the same in both modes.
+    # Cached mode: pages found in `raster_cache` are copied into the output
+    # folder; only the missing pages are rasterized (and then cached).
+    # Per-page resolution: every page gets its own resolution from the page
+    # geometry index, so pages of different sizes all come out (almost)
+    # exactly `output_page_width_px` wide; pages with the same resolution are
+    # still rasterized together in one range.
+    # --------------------------------------------------------------------------
+    if (num_workers <= 1) and (raster_cache is None) and (not per_page_resolution):
+
+        # Note: `pdfinfo` returns height and width in points
+        orig_height, orig_width = get_page_size(input_pdf_filepath)
+
+        # Calculate output resolution of pdf-to-image conversion
+        # 72 pixels = 1 inch; that's the PDF standard
+        new_resolution = (output_page_width_px * 72.0) / float(orig_width)
+
+        is_success = run_pdftocairo(input_pdf_filepath, new_resolution,
+                                    output_prefix)
 
-    # Run the `pdftocairo` program on the given PDF with the calculated
-    # resolution
-    proc_obj = subprocess.run(["pdftocairo", "-png",
-                               "-r", str(new_resolution),
-                               input_pdf_filepath,
-                               os.path.join(temp_output_dir, single_page_prefix)],
-                              capture_output=True)
+    else:
+        page_geometry_list = get_page_geometry_list(input_pdf_filepath)
+        if page_geometry_list is None:
+            return single_page_image_fp_list
+
+        # Without per-page resolution, every page uses the resolution of the
+        # first page, like the serial mode does
+        page_resolution_dict = {}
+        for page_geometry in page_geometry_list:
+            if per_page_resolution:
+                resolution_source = page_geometry
+            else:
+                resolution_source = page_geometry_list[0]
+            page_resolution_dict[page_geometry.page_number] = resolution_source.get_resolution_for_width(output_page_width_px)
+
+        missing_page_list = [page_geometry.page_number for page_geometry in page_geometry_list]
+
+        if raster_cache is not None:
+            pdf_hash = raster_cache.compute_pdf_hash(input_pdf_filepath)
+            missing_page_list = raster_cache.copy_cached_pages(pdf_hash,
+                                                               page_resolution_dict,
+                                                               output_page_width_px,
+                                                               output_prefix)
+
+        if pages_per_job is None:
+            pages_per_job = -(-len(missing_page_list) // max(1, num_workers))
+
+        page_range_list = group_pages_into_ranges(missing_page_list,
+                                                  max_range_len=pages_per_job,
+                                                  page_key_dict=page_resolution_dict)
+
+        with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+            success_list = list(executor.map(
+                lambda page_range: run_pdftocairo(input_pdf_filepath,
+                                                  page_resolution_dict[page_range[0]],
+                                                  output_prefix,
+                                                  first_page=page_range[0],
+                                                  last_page=page_range[1]),
+                page_range_list
+            ))
+
+        is_success = all(success_list)
+
+        if is_success and (raster_cache is not None):
+            raster_cache.store_rendered_pages(pdf_hash,
+                                              missing_page_list,
+                                              output_page_width_px,
+                                              page_resolution_dict,
+                                              list_single_page_images(temp_output_dir,
+                                                                      single_page_prefix))
 
     # If `pdftocairo` is successful ...
-    if proc_obj.returncode == 0:
-
-        # Get the filenames of the produced images.
-        # `pdftocairo` output filenames are lexicographically ordered as per
-        # the page order of the original PDF, so using Python's regular `sort()`
-        # is sufficient
-        single_page_fn_list = sorted([fn for fn in os.listdir(temp_output_dir)
-                                      if fn.startswith(single_page_prefix)])
+    if is_success:
 
-        single_page_image_fp_list = [os.path.join(temp_output_dir, fn)
-                                     for fn in single_page_fn_list]
+        # Get the filepaths of the produced images, in page order
+        single_page_image_fp_list = [fp for (_, fp) in
+                                     sorted(list_single_page_images(temp_output_dir,
+                                                                    single_page_prefix).items())]
 
     else:
         print("Error when running `pdfcairo` on given PDF")
@@ -87,35 +289,475 @@ def convert_pdf_to_single_page_images(input_pdf_filepath,
     return single_page_image_fp_list
 
 
-def concatenate_single_page_images(image_fp_list,
-                                   output_page_width_px):
+def list_single_page_images(temp_output_dir,
+                            single_page_prefix):
+
+    # `pdftocairo` output filenames look like "<prefix>-<page number>.png",
+    # with the page number zero-padded. Return a {page number: filepath} dict
+    page_fp_dict = {}
+
+    for fn in os.listdir(temp_output_dir):
+        if not fn.startswith(single_page_prefix + "-"):
+            continue
+
+        page_number_str = os.path.splitext(fn[len(single_page_prefix) + 1:])[0]
+        if not page_number_str.isdigit():
+            continue
+
+        page_fp_dict[int(page_number_str)] = os.path.join(temp_output_dir, fn)
+
+    return page_fp_dict
+
+
+class PageRasterCache:
+
+    # --------------------------------------------------------------------------
+    # A persistent, content-addressed, on-disk cache of rasterized PDF pages.
+    # Each entry is keyed on:
+    #     - the SHA-256 hash of the PDF file contents
+    #     - the (1-indexed) page number
+    #     - the output page width, in pixels
+    #     - the resolution the page was rasterized at
+    # so renaming/moving a PDF still hits the cache, while editing it does not.
+    # The same output width can mean different resolutions (e.g. with and
+    # without per-page resolution, on a PDF with pages of different sizes),
+    # so the width alone does not identify the raster.
+    #
+    # Eviction is LRU, bounded by the total size of the cache folder: every
+    # hit refreshes the entry's modification time, and when the folder grows
+    # beyond `max_size_bytes`, the least recently used entries are deleted.
+    # --------------------------------------------------------------------------
+
+    def __init__(self,
+                 cache_dir,
+                 max_size_bytes=2 * (1024 ** 3)):
+
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        return
+
+
+    @staticmethod
+    def compute_pdf_hash(input_pdf_filepath,
+                         chunk_size=(1024 ** 2)):
+
+        hash_obj = hashlib.sha256()
+        with open(input_pdf_filepath, "rb") as fp:
+            for chunk in iter(lambda: fp.read(chunk_size), b""):
+                hash_obj.update(chunk)
+
+        return hash_obj.hexdigest()
+
+
+    def get_entry_filepath(self, pdf_hash, page_number, output_page_width_px,
+                           resolution, ext=".png"):
+
+        entry_fn = "{}_p{:05d}_w{}_r{:.6f}{}".format(pdf_hash, page_number,
+                                                    output_page_width_px,
+                                                    resolution, ext)
+        return os.path.join(self.cache_dir, entry_fn)
+
+
+    def lookup(self, pdf_hash, page_number, output_page_width_px, resolution,
+               ext=".png"):
+
+        entry_fp = self.get_entry_filepath(pdf_hash, page_number,
+                                           output_page_width_px, resolution,
+                                           ext)
+        if not os.path.exists(entry_fp):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(entry_fp)
+        except OSError:
+            return None
+
+        return entry_fp
+
+
+    def store(self, src_filepath, pdf_hash, page_number, output_page_width_px,
+              resolution, ext=".png"):
+
+        entry_fp = self.get_entry_filepath(pdf_hash, page_number,
+                                           output_page_width_px, resolution,
+                                           ext)
+
+        # Copy to a temporary name first, and then rename; that way, a
+        # concurrent reader never sees a half-written entry
+        temp_entry_fp = "{}.{}.tmp".format(entry_fp, os.getpid())
+        shutil.copyfile(src_filepath, temp_entry_fp)
+        os.replace(temp_entry_fp, entry_fp)
+
+        return entry_fp
+
+
+    def copy_cached_pages(self, pdf_hash, page_resolution_dict, output_page_width_px,
+                          output_prefix):
+
+        # Copy every cached page (at its resolution in `page_resolution_dict`)
+        # to "<output_prefix>-<page number>.png", zero-padded like `pdftocairo`
+        # does, and return the list of page numbers that were NOT found in the
+        # cache
+        num_digits = len(str(len(page_resolution_dict)))
+        missing_page_list = []
+
+        for page_number in sorted(page_resolution_dict.keys()):
+            entry_fp = self.lookup(pdf_hash, page_number, output_page_width_px,
+                                   page_resolution_dict[page_number])
+            if entry_fp is None:
+                missing_page_list.append(page_number)
+                continue
+
+            output_fp = "{}-{:0{}d}.png".format(output_prefix, page_number, num_digits)
+            shutil.copyfile(entry_fp, output_fp)
 
-    list_of_images = []
+        return missing_page_list
 
-    # For each image:
-    #     Read it from disk
-    #     Crop/Expand it to conform to the `output_page_width_px` shape
-    #     Add it to the list
-    for fp in image_fp_list:
-        raw_image = imageio.imread(fp)
-        raw_width = raw_image.shape[1]
 
-        # If raw width is larger, crop the rightmost column(s)
-        if raw_width > output_page_width_px:
-            num_extra = raw_width - output_page_width_px
-            raw_image = raw_image[:, :-num_extra, :]
+    def store_rendered_pages(self, pdf_hash, page_number_list, output_page_width_px,
+                             page_resolution_dict, page_fp_dict):
 
-        # If raw width is smaller, replicate the rightmost column(s)
-        if raw_width < output_page_width_px:
-            num_extra = output_page_width_px - raw_width
-            rightmost_col = np.expand_dims(raw_image[:, -1, :], axis=1)
-            replicated_rightmost_col = np.tile(rightmost_col, (1, num_extra, 1))
-            raw_image = np.concatenate([raw_image, replicated_rightmost_col], axis=1)
+        for page_number in page_number_list:
+            if page_number in page_fp_dict:
+                self.store(page_fp_dict[page_number], pdf_hash, page_number,
+                           output_page_width_px, page_resolution_dict[page_number])
 
-        list_of_images.append(raw_image)
+        self.evict()
 
+        return
 
-    # Concatenate the images, vertically, to form one giant image
-    concat_image = np.concatenate(list_of_images, axis=0)
+
+    def evict(self):
+
+        entry_list = []
+        total_size = 0
+
+        for fn in os.listdir(self.cache_dir):
+            fp = os.path.join(self.cache_dir, fn)
+            if fn.endswith(".tmp") or not os.path.isfile(fp):
+                continue
+
+            stat_obj = os.stat(fp)
+            entry_list.append((stat_obj.st_mtime, stat_obj.st_size, fp))
+            total_size += stat_obj.st_size
+
+        # Delete the least recently used entries first
+        for _, size, fp in sorted(entry_list):
+            if total_size <= self.max_size_bytes:
+                break
+
+            try:
+                os.remove(fp)
+                total_size -= size
+            except OSError:
+                continue
+
+        return
+
+
+def read_pnm_image_from_stream(stream):
+
+    # --------------------------------------------------------------------------
+    # Reads one binary PNM image (P6 = RGB, P5 = grayscale) from the stream.
+    # The header is a set of whitespace separated ASCII tokens:
+    #     <magic> <width> <height> <maxval>
+    # followed by exactly one whitespace byte, and then the raw pixel bytes.
+    # Returns None if the stream is exhausted before a new image starts.
+    # --------------------------------------------------------------------------
+
+    token_list = []
+    curr_token = b""
+
+    while len(token_list) < 4:
+        c = stream.read(1)
+
+        # End of stream
+        if c == b"":
+            if (len(token_list) == 0) and (curr_token == b""):
+                return None
+            raise Exception("Stream ended inside a PNM header")
+
+        # Comments run till the end of the line
+        if c == b"#":
+            while c not in (b"\n", b""):
+                c = stream.read(1)
+
+        if c.isspace():
+            if curr_token != b"":
+                token_list.append(curr_token)
+                curr_token = b""
+        else:
+            curr_token += c
+
+    magic = token_list[0]
+    width = int(token_list[1])
+    height = int(token_list[2])
+    maxval = int(token_list[3])
+
+    if magic == b"P6":
+        shape = (height, width, 3)
+    elif magic == b"P5":
+        shape = (height, width)
+    else:
+        raise Exception("Unsupported PNM format {}".format(magic))
+
+    if maxval > 255:
+        raise Exception("Only 8-bit PNM images are supported")
+
+    num_bytes = int(np.prod(shape))
+    raw_bytes = stream.read(num_bytes)
+    if len(raw_bytes) != num_bytes:
+        raise Exception("Stream ended inside PNM pixel data")
+
+    return np.frombuffer(raw_bytes, dtype="uint8").reshape(shape)
+
+
+def iterate_pdftoppm_images(cmd):
+
+    proc_obj = subprocess.Popen(cmd,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+
+    try:
+        while True:
+            page_image = read_pnm_image_from_stream(proc_obj.stdout)
+            if page_image is None:
+                break
+
+            yield page_image
+
+        proc_obj.wait()
+
+    finally:
+        # If the consumer stopped early, don't leave `pdftoppm` hanging
+        if proc_obj.poll() is None:
+            proc_obj.kill()
+            proc_obj.wait()
+        proc_obj.stdout.close()
+
+    if proc_obj.returncode != 0:
+        print("Error when running `pdftoppm` on given PDF")
+
+    return
+
+
+def iterate_pdf_page_images(input_pdf_filepath,
+                            output_page_width_px,
+                            first_page=None,
+                            last_page=None,
+                            per_page_resolution=False,
+                            grayscale=False):
+
+    # --------------------------------------------------------------------------
+    # In-memory counterpart of `convert_pdf_to_single_page_images`:
+    # `pdftoppm` (the PPM-writing sibling of `pdftocairo`) is run without an
+    # output root, which makes it write every page as a raw PPM to stdout.
+    # The pages are decoded straight from the pipe and yielded one by one as
+    # (height, width, 3) uint8 arrays; nothing is written to disk, and there
+    # is no PNG compression/decompression.
+    # With `grayscale`, the pages are rendered as 8-bit grayscale (PGM) and
+    # yielded as (height, width) arrays; together with a small
+    # `output_page_width_px`, this is a cheap render for stave/bar detection
+    # (see `Page.set_detection_image`)
+    # --------------------------------------------------------------------------
+
+    color_flag_list = ["-gray"] if grayscale else []
+
+    if not per_page_resolution:
+
+        # Note: `pdfinfo` returns height and width in points
+        orig_height, orig_width = get_page_size(input_pdf_filepath)
+        if orig_width is None:
+            return
+
+        # 72 pixels = 1 inch; that's the PDF standard
+        new_resolution = (output_page_width_px * 72.0) / float(orig_width)
+
+        cmd = ["pdftoppm",
+               "-r", str(new_resolution)]
+        cmd += color_flag_list
+        if first_page is not None:
+            cmd += ["-f", str(first_page)]
+        if last_page is not None:
+            cmd += ["-l", str(last_page)]
+        cmd += [input_pdf_filepath]
+
+        yield from iterate_pdftoppm_images(cmd)
+
+        return
+
+    # With per-page resolution, run one `pdftoppm` per range of pages that
+    # share the same resolution, one after the other, so that the pages are
+    # still yielded in page order
+    page_geometry_list = get_page_geometry_list(input_pdf_filepath)
+    if page_geometry_list is None:
+        return
+
+    if first_page is None:
+        first_page = 1
+    if last_page is None:
+        last_page = len(page_geometry_list)
+
+    page_resolution_dict = {page_geometry.page_number: page_geometry.get_resolution_for_width(output_page_width_px)
+                            for page_geometry in page_geometry_list}
+
+    page_range_list = group_pages_into_ranges(list(range(first_page, last_page + 1)),
+                                              page_key_dict=page_resolution_dict)
+
+    for range_first_page, range_last_page in page_range_list:
+        cmd = ["pdftoppm",
+               "-r", str(page_resolution_dict[range_first_page]),
+               "-f", str(range_first_page),
+               "-l", str(range_last_page)]
+        cmd += color_flag_list
+        cmd += [input_pdf_filepath]
+
+        yield from iterate_pdftoppm_images(cmd)
+
+    return
+
+
+def fix_page_image_width(raw_image,
+                         output_page_width_px):
+
+    raw_width = raw_image.shape[1]
+
+    # If raw width is larger, crop the rightmost column(s)
+    if raw_width > output_page_width_px:
+        num_extra = raw_width - output_page_width_px
+        raw_image = raw_image[:, :-num_extra, :]
+
+    # If raw width is smaller, replicate the rightmost column(s)
+    if raw_width < output_page_width_px:
+        num_extra = output_page_width_px - raw_width
+        rightmost_col = np.expand_dims(raw_image[:, -1, :], axis=1)
+        replicated_rightmost_col = np.tile(rightmost_col, (1, num_extra, 1))
+        raw_image = np.concatenate([raw_image, replicated_rightmost_col], axis=1)
+
+    return raw_image
+
+
+def write_page_image_into_array(output_image, start_row,
+                                raw_image):
+
+    # Write `raw_image` into the rows of `output_image` starting at
+    # `start_row`, cropping it (or replicating its rightmost column) to fit
+    # the output width; the replication is a broadcasted assignment, so no
+    # temporary tiled array is built
+    raw_height = raw_image.shape[0]
+    output_width = output_image.shape[1]
+    common_width = min(raw_image.shape[1], output_width)
+
+    end_row = start_row + raw_height
+    output_image[start_row: end_row, :common_width] = raw_image[:, :common_width]
+
+    if common_width < output_width:
+        output_image[start_row: end_row, common_width:] = raw_image[:, common_width-1: common_width]
+
+    return end_row
+
+
+def get_png_image_shape(image_fp):
+
+    # --------------------------------------------------------------------------
+    # Read the (height, width, num_channels) of a PNG image from its IHDR
+    # chunk, without decoding the pixel data.
+    # PNG layout: 8 byte signature, then the IHDR chunk:
+    #     4 byte length, "IHDR", 4 byte width, 4 byte height,
+    #     1 byte bit depth, 1 byte color type, ...
+    # Returns None if the file is not a (supported) PNG
+    # --------------------------------------------------------------------------
+    channels_per_color_type = {0: 1, 2: 3, 4: 2, 6: 4}
+
+    with open(image_fp, "rb") as fp:
+        header = fp.read(26)
+
+    if (len(header) < 26) or (header[:8] != b"\x89PNG\r\n\x1a\n") or (header[12:16] != b"IHDR"):
+        return None
+
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", header[16:26])
+    if (bit_depth != 8) or (color_type not in channels_per_color_type):
+        return None
+
+    return height, width, channels_per_color_type[color_type]
+
+
+def concatenate_page_images(page_image_iter,
+                            output_page_width_px,
+                            page_height_list=None,
+                            memmap_filepath=None):
+
+    # Crop/Expand each image to conform to the `output_page_width_px` shape,
+    # and concatenate the images, vertically, to form one giant image.
+    # `page_image_iter` can be any iterable of arrays, e.g. the generator
+    # returned by `iterate_pdf_page_images`
+    if page_height_list is None:
+        list_of_images = [fix_page_image_width(raw_image, output_page_width_px)
+                          for raw_image in page_image_iter]
+
+        concat_image = np.concatenate(list_of_images, axis=0)
+
+        return concat_image
+
+    # --------------------------------------------------------------------------
+    # If the page heights are known beforehand, the output is sized once, and
+    # every page is written straight into it; so the peak memory is the final
+    # image plus ONE page, instead of twice the final image.
+    # With `memmap_filepath`, the output is an `np.memmap` backed by a `.npy`
+    # file, so the final image doesn't even need to fit in memory.
+    # --------------------------------------------------------------------------
+    total_height = int(np.sum(page_height_list))
+    concat_image = None
+    running_height = 0
+
+    for raw_image in page_image_iter:
+
+        # The number of channels (and dtype) is only known at the first page
+        if concat_image is None:
+            output_shape = (total_height, output_page_width_px) + raw_image.shape[2:]
+            if memmap_filepath is None:
+                concat_image = np.empty(output_shape, dtype=raw_image.dtype)
+            else:
+                concat_image = np.lib.format.open_memmap(memmap_filepath, mode="w+",
+                                                         dtype=raw_image.dtype,
+                                                         shape=output_shape)
+
+        running_height = write_page_image_into_array(concat_image, running_height,
+                                                     raw_image)
+
+    if running_height != total_height:
+        raise Exception("Page heights ({}) do not add up to the given total ({})".format(
+            running_height, total_height
+        ))
+
+    if memmap_filepath is not None:
+        concat_image.flush()
 
     return concat_image
+
+
+def concatenate_single_page_images(image_fp_list,
+                                   output_page_width_px,
+                                   preallocate=False,
+                                   memmap_filepath=None):
+
+    # Read each image from disk, lazily, as it is needed
+    page_image_iter = (imageio.imread(fp) for fp in image_fp_list)
+
+    # The page heights are read from the PNG headers, if they are needed for
+    # preallocating the output
+    page_height_list = None
+    if preallocate or (memmap_filepath is not None):
+        page_shape_list = [get_png_image_shape(fp) for fp in image_fp_list]
+        if all([page_shape is not None for page_shape in page_shape_list]):
+            page_height_list = [page_shape[0] for page_shape in page_shape_list]
+        else:
+            print("Could not read all page sizes from PNG headers; not preallocating")
+
+    return concatenate_page_images(page_image_iter, output_page_width_px,
+                                   page_height_list=page_height_list,
+                                   memmap_filepath=memmap_filepath)
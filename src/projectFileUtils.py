@@ -0,0 +1,447 @@
+import os
+import json
+import zlib
+import struct
+import traceback
+
+import numpy as np
+
+from pageUtils import Page
+from staveUtils import StaveGroup
+
+
+PROJECT_FILE_MAGIC = b"SSVPROJ1"
+PROJECT_FILE_FOOTER_MAGIC = b"SSVINDEX"
+# Footer: <index offset (uint64)> <index length (uint64)> <footer magic>
+PROJECT_FILE_FOOTER_FORMAT = "<QQ8s"
+PROJECT_FILE_FOOTER_SIZE = struct.calcsize(PROJECT_FILE_FOOTER_FORMAT)
+
+# How far back (at most) each step of the footer search reads
+FOOTER_SEARCH_BLOCK_SIZE = 1 << 20
+
+PROJECT_FILE_MODE_OPEN = "open"
+PROJECT_FILE_MODE_CREATE = "create"
+
+DEFAULT_COMPRESSION_LEVEL = 3
+DEFAULT_IMAGE_TILE_HEIGHT = 256
+
+# Stave limit columns may be None; they are stored as this value
+MISSING_COL_VALUE = -1
+
+
+class ProjectFile:
+
+    # --------------------------------------------------------------------------
+    # A single-file container of named, zlib-compressed NumPy arrays
+    # ("chunks"), laid out as:
+    #     <magic> <chunk> <chunk> ... <index> <footer> [<chunk> ... <index> <footer>]
+    # The index is a JSON dict of {name: offset, length, dtype, shape}, and
+    # the footer (at the very end of the file) points to the latest index.
+    #
+    # - Any chunk can be read on its own, by seeking to it (random access)
+    # - Saving only APPENDS the new/changed chunks, followed by a new index
+    #   and footer; nothing already in the file is rewritten. If a save is
+    #   cut short, the file just ends in a partial save; reading then
+    #   searches back for the last complete footer, i.e. the previous index
+    #   (and its data) is still there. The next save appends after the
+    #   partial one, which is left as garbage
+    # - Replaced/deleted chunks stay in the file as garbage, until `compact()`
+    #
+    # `mode` is PROJECT_FILE_MODE_OPEN (the file must exist), or
+    # PROJECT_FILE_MODE_CREATE (a new, empty project file; replacing any
+    # existing file at the path)
+    # --------------------------------------------------------------------------
+
+    def __init__(self, filepath,
+                 mode=PROJECT_FILE_MODE_OPEN,
+                 compression_level=DEFAULT_COMPRESSION_LEVEL):
+
+        self.filepath = filepath
+        self.compression_level = compression_level
+        self.chunk_index = {}
+
+        if mode == PROJECT_FILE_MODE_OPEN:
+            if not os.path.exists(self.filepath):
+                raise FileNotFoundError("Project file {} does not exist".format(self.filepath))
+            self.read_index()
+
+        elif mode == PROJECT_FILE_MODE_CREATE:
+            with open(self.filepath, "wb") as fp:
+                fp.write(PROJECT_FILE_MAGIC)
+            self.write_arrays({})
+
+        else:
+            raise ValueError("Unknown project file mode \"{}\"".format(mode))
+
+        return
+
+
+    @staticmethod
+    def read_footer_index(fp, footer_end):
+
+        # The index of the footer ending at `footer_end`, or None if that is
+        # not a complete footer (with its index right before it)
+        footer_start = footer_end - PROJECT_FILE_FOOTER_SIZE
+        fp.seek(footer_start)
+        index_offset, index_length, footer_magic = struct.unpack(PROJECT_FILE_FOOTER_FORMAT,
+                                                                 fp.read(PROJECT_FILE_FOOTER_SIZE))
+
+        if footer_magic != PROJECT_FILE_FOOTER_MAGIC:
+            return None
+        if index_offset + index_length != footer_start:
+            return None
+
+        fp.seek(index_offset)
+        try:
+            return json.loads(fp.read(index_length).decode("utf-8"))
+        except ValueError:
+            return None
+
+
+    def read_index(self):
+
+        with open(self.filepath, "rb") as fp:
+            if fp.read(len(PROJECT_FILE_MAGIC)) != PROJECT_FILE_MAGIC:
+                raise Exception("{} is not a project file".format(self.filepath))
+
+            # ------------------------------------------------------------------
+            # Normally the footer is the last thing in the file; after a save
+            # that was cut short, it is the last complete one before the
+            # partial data. The file is searched backwards, one block at a
+            # time, for the footer magic (the blocks overlap by the size of
+            # the magic, so it is found even across a block boundary)
+            # ------------------------------------------------------------------
+            search_end = fp.seek(0, os.SEEK_END)
+            min_footer_end = len(PROJECT_FILE_MAGIC) + PROJECT_FILE_FOOTER_SIZE
+            magic_len = len(PROJECT_FILE_FOOTER_MAGIC)
+
+            while search_end >= min_footer_end:
+                search_start = max(search_end - FOOTER_SEARCH_BLOCK_SIZE, 0)
+                fp.seek(search_start)
+                block_bytes = fp.read(search_end - search_start)
+
+                magic_pos = block_bytes.rfind(PROJECT_FILE_FOOTER_MAGIC)
+                while magic_pos >= 0:
+                    footer_end = search_start + magic_pos + magic_len
+                    if footer_end >= min_footer_end:
+                        chunk_index = self.read_footer_index(fp, footer_end)
+                        if chunk_index is not None:
+                            self.chunk_index = chunk_index
+                            return
+                    magic_pos = block_bytes.rfind(PROJECT_FILE_FOOTER_MAGIC, 0, magic_pos + magic_len - 1)
+
+                if search_start == 0:
+                    break
+                search_end = search_start + magic_len - 1
+
+        raise Exception("Project file {} has no valid index footer".format(self.filepath))
+
+
+    def has_array(self, name):
+        return name in self.chunk_index
+
+
+    def list_arrays(self, prefix=""):
+        return sorted([name for name in self.chunk_index.keys() if name.startswith(prefix)])
+
+
+    def read_array(self, name):
+
+        if name not in self.chunk_index:
+            raise KeyError("Array \"{}\" not found in project file".format(name))
+
+        chunk_info = self.chunk_index[name]
+        with open(self.filepath, "rb") as fp:
+            fp.seek(chunk_info["offset"])
+            compressed_bytes = fp.read(chunk_info["length"])
+
+        array = np.frombuffer(zlib.decompress(compressed_bytes),
+                              dtype=np.dtype(chunk_info["dtype"]))
+
+        return array.reshape(chunk_info["shape"]).copy()
+
+
+    def write_arrays(self, array_dict, deleted_name_list=None):
+
+        # Append every array, then the updated index and footer; a single
+        # call is a single (incremental) save
+        new_chunk_index = dict(self.chunk_index)
+        if deleted_name_list is not None:
+            for name in deleted_name_list:
+                new_chunk_index.pop(name, None)
+
+        with open(self.filepath, "r+b") as fp:
+            fp.seek(0, os.SEEK_END)
+
+            for name, array in array_dict.items():
+                array = np.ascontiguousarray(array)
+                compressed_bytes = zlib.compress(array.tobytes(), self.compression_level)
+
+                new_chunk_index[name] = {"offset": fp.tell(),
+                                         "length": len(compressed_bytes),
+                                         "dtype": array.dtype.str,
+                                         "shape": list(array.shape)}
+                fp.write(compressed_bytes)
+
+            index_bytes = json.dumps(new_chunk_index).encode("utf-8")
+            index_offset = fp.tell()
+            fp.write(index_bytes)
+            fp.write(struct.pack(PROJECT_FILE_FOOTER_FORMAT,
+                                 index_offset, len(index_bytes), PROJECT_FILE_FOOTER_MAGIC))
+
+        self.chunk_index = new_chunk_index
+
+        return
+
+
+    def delete_arrays(self, name_list):
+        self.write_arrays({}, deleted_name_list=name_list)
+        return
+
+
+    def compact(self):
+
+        # Rewrite the file with only the live chunks, then swap it in
+        temp_filepath = self.filepath + ".compact.tmp"
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+        compacted_obj = ProjectFile(temp_filepath, mode=PROJECT_FILE_MODE_CREATE,
+                                    compression_level=self.compression_level)
+        compacted_obj.write_arrays({name: self.read_array(name) for name in self.list_arrays()})
+
+        os.replace(temp_filepath, self.filepath)
+        self.read_index()
+
+        return
+
+
+
+# ------------------------------------------------------------------------------
+# Page annotations <-> typed arrays
+#
+# Every page is stored under "pages/<page index>/", as:
+#     info:        int64 [page_height, page_width]
+#     filename:    uint8 (the UTF-8 bytes of `orig_image_filename`)
+#     sg:          int64 (num_sg, 4)      [first stave, num staves, first bar, num bars]
+#     staves:      int64 (num_staves, 4)  [first line, num lines, left_lim_col, right_lim_col]
+#     stave_lines: int64 (num_lines, 2)   [top edge row, bottom edge row]
+#     bars:        int64 (num_bars, 4)    [inner_left_col, inner_right_col,
+#                                          outer_left_col, outer_right_col]
+#     image/info:  int64 [height, width, num_channels, tile_height]
+#     image/tile_<index>: uint8 rows of the page image
+# and the timing data under "timing/".
+# ------------------------------------------------------------------------------
+
+def get_page_prefix(page_idx):
+    return "pages/{:05d}/".format(page_idx)
+
+
+def col_to_int(col):
+    return MISSING_COL_VALUE if col is None else int(col)
+
+
+def int_to_col(value):
+    return None if value == MISSING_COL_VALUE else int(value)
+
+
+def page_annotations_to_arrays(page_obj):
+
+    sg_rows = []
+    stave_rows = []
+    line_rows = []
+    bar_rows = []
+
+    for sg in page_obj.sg_list:
+        sg_rows.append([len(stave_rows), sg.num_staves, len(bar_rows), sg.num_bars])
+
+        for stave in sg.stave_list:
+            stave_rows.append([len(line_rows), len(stave.line_top_edge_rows),
+                               col_to_int(stave.left_lim_col), col_to_int(stave.right_lim_col)])
+            line_rows += [[int(t), int(b)] for (t, b) in zip(stave.line_top_edge_rows,
+                                                              stave.line_bottom_edge_rows)]
+
+        bar_rows += [[int(bar.inner_left_col), int(bar.inner_right_col),
+                      int(bar.outer_left_col), int(bar.outer_right_col)]
+                     for bar in sg.bar_list]
+
+    array_dict = {
+        "info": np.array([page_obj.page_height, page_obj.page_width], dtype="int64"),
+        "filename": np.frombuffer(page_obj.orig_image_filename.encode("utf-8"), dtype="uint8"),
+        "sg": np.array(sg_rows, dtype="int64").reshape((-1, 4)),
+        "staves": np.array(stave_rows, dtype="int64").reshape((-1, 4)),
+        "stave_lines": np.array(line_rows, dtype="int64").reshape((-1, 2)),
+        "bars": np.array(bar_rows, dtype="int64").reshape((-1, 4))
+    }
+
+    return array_dict
+
+
+def page_arrays_to_dict(array_dict):
+
+    # Build the same nested dict that `Page.to_dict` makes, so the objects
+    # can be made with the usual `make_object_from_dict` methods
+    sg_dict_list = []
+
+    for first_stave, num_staves, first_bar, num_bars in array_dict["sg"]:
+        stave_dict_list = []
+        for first_line, num_lines, left_lim_col, right_lim_col in array_dict["staves"][first_stave: first_stave + num_staves]:
+            lines = array_dict["stave_lines"][first_line: first_line + num_lines]
+            stave_dict_list.append({"line_top_edge_rows": lines[:, 0],
+                                    "line_bottom_edge_rows": lines[:, 1],
+                                    "left_lim_col": int_to_col(left_lim_col),
+                                    "right_lim_col": int_to_col(right_lim_col)})
+
+        bar_dict_list = [{"inner_left_col": int(b[0]), "inner_right_col": int(b[1]),
+                          "outer_left_col": int(b[2]), "outer_right_col": int(b[3])}
+                         for b in array_dict["bars"][first_bar: first_bar + num_bars]]
+
+        sg_dict_list.append({"stave_list": stave_dict_list,
+                             "bar_list": bar_dict_list})
+
+    page_dict = {"orig_image_filename": array_dict["filename"].tobytes().decode("utf-8"),
+                 "page_height": int(array_dict["info"][0]),
+                 "page_width": int(array_dict["info"][1]),
+                 "sg_list": sg_dict_list}
+
+    return page_dict
+
+
+# ------------------------------------------------------------------------------
+# Project level save/load
+# ------------------------------------------------------------------------------
+
+def save_page_annotations(project_obj, page_idx, page_obj):
+
+    # Only the (small) annotation arrays are written; the page image, if
+    # already saved, is left as it is
+    page_prefix = get_page_prefix(page_idx)
+    array_dict = {page_prefix + name: arr
+                  for (name, arr) in page_annotations_to_arrays(page_obj).items()}
+    project_obj.write_arrays(array_dict)
+
+    return
+
+
+def save_page_image(project_obj, page_idx, page_image,
+                    tile_height=DEFAULT_IMAGE_TILE_HEIGHT):
+
+    image_prefix = get_page_prefix(page_idx) + "image/"
+
+    # Drop the tiles of a previously saved (possibly taller) image
+    old_tile_name_list = project_obj.list_arrays(image_prefix + "tile_")
+
+    num_channels = page_image.shape[2] if page_image.ndim == 3 else 0
+    array_dict = {image_prefix + "info": np.array([page_image.shape[0], page_image.shape[1],
+                                                   num_channels, tile_height], dtype="int64")}
+
+    for tile_idx, start_row in enumerate(range(0, page_image.shape[0], tile_height)):
+        array_dict[image_prefix + "tile_{:05d}".format(tile_idx)] = page_image[start_row: start_row + tile_height]
+
+    project_obj.write_arrays(array_dict,
+                             deleted_name_list=[name for name in old_tile_name_list
+                                                if name not in array_dict])
+
+    return
+
+
+def read_page_image_rows(project_obj, page_idx, start_row=0, end_row=None):
+
+    # Rows [start_row, end_row], inclusive; only the tiles overlapping those
+    # rows are read and decompressed
+    image_prefix = get_page_prefix(page_idx) + "image/"
+    img_height, img_width, num_channels, tile_height = project_obj.read_array(image_prefix + "info")
+
+    if end_row is None:
+        end_row = img_height - 1
+
+    tile_list = [project_obj.read_array(image_prefix + "tile_{:05d}".format(tile_idx))
+                 for tile_idx in range(start_row // tile_height, (end_row // tile_height) + 1)]
+    rows = np.concatenate(tile_list, axis=0)
+
+    first_tile_start_row = (start_row // tile_height) * tile_height
+    return rows[start_row - first_tile_start_row: end_row - first_tile_start_row + 1]
+
+
+def save_timing_data(project_obj, bar_start_timestamp_array):
+    project_obj.write_arrays({"timing/bar_start_timestamps": np.asarray(bar_start_timestamp_array,
+                                                                        dtype="float64")})
+    return
+
+
+def read_timing_data(project_obj):
+
+    if not project_obj.has_array("timing/bar_start_timestamps"):
+        return None
+
+    return project_obj.read_array("timing/bar_start_timestamps")
+
+
+def get_num_pages(project_obj):
+    return len(set([name.split("/")[1] for name in project_obj.list_arrays("pages/")]))
+
+
+def save_project(project_filepath, page_obj_list,
+                 bar_start_timestamp_array=None,
+                 save_images=True):
+
+    # Saving into an existing project appends to it
+    if os.path.exists(project_filepath):
+        project_obj = ProjectFile(project_filepath, mode=PROJECT_FILE_MODE_OPEN)
+    else:
+        project_obj = ProjectFile(project_filepath, mode=PROJECT_FILE_MODE_CREATE)
+
+    for page_idx, page_obj in enumerate(page_obj_list):
+        save_page_annotations(project_obj, page_idx, page_obj)
+        if save_images:
+            save_page_image(project_obj, page_idx, page_obj.orig_image)
+
+    if bar_start_timestamp_array is not None:
+        save_timing_data(project_obj, bar_start_timestamp_array)
+
+    return project_obj
+
+
+def load_page(project_obj, page_idx):
+
+    try:
+        page_prefix = get_page_prefix(page_idx)
+        array_dict = {name: project_obj.read_array(page_prefix + name)
+                      for name in ["info", "filename", "sg", "staves", "stave_lines", "bars"]}
+        page_dict = page_arrays_to_dict(array_dict)
+
+        # The image is only read from the project file, if and when the page
+        # pixels are first needed
+        if project_obj.has_array(page_prefix + "image/info"):
+            image_loader = (lambda: read_page_image_rows(project_obj, page_idx))
+        else:
+            image_loader = None
+
+        page_obj = Page(None,
+                        orig_image_filename=page_dict["orig_image_filename"],
+                        page_height=page_dict["page_height"],
+                        page_width=page_dict["page_width"],
+                        image_loader=image_loader)
+
+        for sg_dict in page_dict["sg_list"]:
+            sg_obj = StaveGroup.make_object_from_dict(page_obj, sg_dict)
+            if sg_obj is not None:
+                page_obj.add_stave_group(sg_obj)
+            else:
+                return None
+
+        return page_obj
+
+    except Exception:
+        print("Error when loading page {} from project file".format(page_idx))
+        print(traceback.format_exc())
+        return None
+
+
+def load_project_pages(project_filepath):
+
+    project_obj = ProjectFile(project_filepath, mode=PROJECT_FILE_MODE_OPEN)
+    page_obj_list = [load_page(project_obj, page_idx)
+                     for page_idx in range(get_num_pages(project_obj))]
+
+    return project_obj, page_obj_list
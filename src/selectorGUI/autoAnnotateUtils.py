@@ -0,0 +1,313 @@
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from pageUtils import Page, merge_page_annotations_into_combined_page
+from binaryImageUtils import PackedBinaryImage
+from staveUtils import StaveGroup
+from staveSelectorUtils import (get_stave_line_candidates, check_stave_line_validity,
+                                add_stave_groups_to_page, interactive_stave_line_process)
+from barSelectorUtils import (get_bar_line_candidates, add_bars_to_stave_group,
+                              interactive_bar_selector_process)
+from detectionPrefetchUtils import DetectionPrefetcher
+
+
+class AutoAnnotationReport:
+
+    # --------------------------------------------------------------------------
+    # What the automatic annotation of one page could not be sure about; the
+    # same detections the GUIs color as "doubtful", as plain data:
+    #     - doubtful_stave_line_list: (top_row, bottom_row) of each line
+    #     - doubtful_bar_line_list:   (sg_idx, left_col, right_col) of each
+    #                                 bar line
+    # If the stave lines can not be split into stave groups, the page gets no
+    # annotations at all, and `are_stave_lines_valid` is False
+    # --------------------------------------------------------------------------
+
+    def __init__(self, page_idx):
+
+        self.page_idx = page_idx
+
+        self.are_stave_lines_valid = False
+        self.num_stave_lines = 0
+        self.num_bars = 0
+
+        self.doubtful_stave_line_list = []
+        self.doubtful_bar_line_list = []
+
+        return
+
+
+    @classmethod
+    def make_object_from_dict(cls, report_dict):
+        try:
+            report_obj = cls(report_dict["page_idx"])
+
+            report_obj.are_stave_lines_valid = report_dict["are_stave_lines_valid"]
+            report_obj.num_stave_lines = report_dict["num_stave_lines"]
+            report_obj.num_bars = report_dict["num_bars"]
+
+            report_obj.doubtful_stave_line_list = [tuple(line) for line in report_dict["doubtful_stave_line_list"]]
+            report_obj.doubtful_bar_line_list = [tuple(line) for line in report_dict["doubtful_bar_line_list"]]
+
+            return report_obj
+
+        except Exception:
+            print("Error when making Auto Annotation Report Object from dict")
+            print(traceback.format_exc())
+            return None
+
+
+    def has_doubtful_stave_lines(self):
+        return (not self.are_stave_lines_valid) or (len(self.doubtful_stave_line_list) > 0)
+
+
+    def has_doubtful_bar_lines(self):
+        return len(self.doubtful_bar_line_list) > 0
+
+
+    def needs_review(self):
+        return self.has_doubtful_stave_lines() or self.has_doubtful_bar_lines()
+
+
+    def to_dict(self):
+
+        self_dict = {}
+
+        self_dict["page_idx"] = int(self.page_idx)
+        self_dict["are_stave_lines_valid"] = bool(self.are_stave_lines_valid)
+        self_dict["num_stave_lines"] = int(self.num_stave_lines)
+        self_dict["num_bars"] = int(self.num_bars)
+
+        self_dict["doubtful_stave_line_list"] = [[int(v) for v in line]
+                                                 for line in self.doubtful_stave_line_list]
+        self_dict["doubtful_bar_line_list"] = [[int(v) for v in line]
+                                               for line in self.doubtful_bar_line_list]
+
+        return self_dict
+
+
+
+def auto_annotate_stave_groups(page_obj, stave_group_size, report,
+                               coarse_to_fine=False):
+
+    # The same (cached) candidates the stave line GUI opens with
+    (top_edge_rows, bottom_edge_rows,
+     confident_indices, doubtful_indices) = get_stave_line_candidates(page_obj, coarse_to_fine=coarse_to_fine)
+    report.num_stave_lines = len(top_edge_rows)
+
+    if report.num_stave_lines == 0:
+        return False
+
+    report.doubtful_stave_line_list = [(top_edge_rows[idx], bottom_edge_rows[idx])
+                                       for idx in doubtful_indices]
+
+    report.are_stave_lines_valid = check_stave_line_validity(top_edge_rows, bottom_edge_rows,
+                                                             stave_group_size)
+    if not report.are_stave_lines_valid:
+        return False
+
+    add_stave_groups_to_page(page_obj, top_edge_rows, bottom_edge_rows,
+                             stave_group_size)
+
+    return True
+
+
+def auto_annotate_bars(page_obj, report):
+
+    report.doubtful_bar_line_list = []
+    report.num_bars = 0
+
+    # The same (cached) candidates the bar GUI opens with
+    for sg_idx, sg in enumerate(page_obj.sg_list):
+        (left_edge_cols, right_edge_cols,
+         confident_lines, doubtful_lines) = get_bar_line_candidates(page_obj, sg)
+
+        add_bars_to_stave_group(sg, left_edge_cols, right_edge_cols)
+        report.num_bars += sg.num_bars
+
+        report.doubtful_bar_line_list += [(sg_idx, left_edge_cols[idx], right_edge_cols[idx])
+                                          for idx in doubtful_lines]
+
+    return
+
+
+def auto_annotate_page(page_obj, stave_group_size=1, page_idx=0,
+                       coarse_to_fine=False):
+
+    # --------------------------------------------------------------------------
+    # Annotate the page's stave groups and bars from the automatic detections
+    # alone, with no GUI or prompts; the detections the GUIs would mark as
+    # doubtful are listed in the returned report. The detections are left in
+    # the page's detection cache; so the GUIs do not detect them again.
+    # With `coarse_to_fine`, the stave lines are first searched for on a
+    # 4x coarser look at the page (see `coarse_to_fine_filter_stave_lines`)
+    # --------------------------------------------------------------------------
+    report = AutoAnnotationReport(page_idx)
+
+    if auto_annotate_stave_groups(page_obj, stave_group_size, report,
+                                  coarse_to_fine=coarse_to_fine):
+        auto_annotate_bars(page_obj, report)
+
+    return report
+
+
+def auto_annotate_pages(page_obj_list, stave_group_size=1, coarse_to_fine=False):
+
+    report_list = [auto_annotate_page(page_obj, stave_group_size, page_idx,
+                                      coarse_to_fine=coarse_to_fine)
+                   for (page_idx, page_obj) in enumerate(page_obj_list)]
+
+    num_review_pages = len([r for r in report_list if r.needs_review()])
+    print("Auto-annotated {} pages; {} of them need review".format(len(report_list), num_review_pages))
+
+    return report_list
+
+
+def auto_annotate_page_worker(worker_args):
+
+    # --------------------------------------------------------------------------
+    # Runs in a worker process: reads/binarizes the page there (from its
+    # file, or from the image itself for pages that only live in memory),
+    # annotates it, and sends back only the (small) annotations, report, and
+    # detection candidates (for the GUIs of the page in the main process).
+    # A page with a low resolution detection render gets it sent along (as
+    # its packed bits and shape), so it is detected on the same render as
+    # in `auto_annotate_pages`
+    # --------------------------------------------------------------------------
+    (orig_image_filepath, orig_image, orig_image_filename,
+     stave_group_size, page_idx, coarse_to_fine,
+     packed_detection_bits, detection_shape) = worker_args
+
+    page_obj = Page(orig_image_filepath,
+                    orig_image=orig_image,
+                    orig_image_filename=orig_image_filename)
+    if packed_detection_bits is not None:
+        page_obj.set_packed_detection_image(
+            PackedBinaryImage.make_object_from_packed(packed_detection_bits, detection_shape)
+        )
+
+    report = auto_annotate_page(page_obj, stave_group_size, page_idx,
+                                coarse_to_fine=coarse_to_fine)
+
+    return page_obj.to_dict(json_compatible=True), report.to_dict(), page_obj.detection_candidate_cache
+
+
+def auto_annotate_pages_in_parallel(page_obj_list, stave_group_size=1,
+                                    num_workers=None,
+                                    combined_page_obj=None, target_page_width=None,
+                                    coarse_to_fine=False):
+
+    # --------------------------------------------------------------------------
+    # Same as `auto_annotate_pages`, but each single page is annotated in its
+    # own worker process (`num_workers` of them; default: one per CPU), so the
+    # detection time scales with the number of cores instead of the total
+    # height of the pages.
+    # If `combined_page_obj` is given (the combination of these pages, as
+    # made by `combine_pages_into_one_page`), the annotations are then merged
+    # into it with the same row offsets, instead of running the detection on
+    # the (huge) combined page itself
+    # --------------------------------------------------------------------------
+    worker_args_list = []
+    for page_idx, page_obj in enumerate(page_obj_list):
+
+        if page_obj.low_res_detection_image is not None:
+            packed_detection_image = page_obj.low_res_detection_image.bin_image
+            detection_render_args = (packed_detection_image.packed_image, packed_detection_image.shape)
+        else:
+            detection_render_args = (None, None)
+
+        has_up_to_date_file = ((page_obj.orig_image_filepath is not None) and
+                               (not page_obj.is_image_data_modified))
+        if has_up_to_date_file:
+            worker_args_list.append((page_obj.orig_image_filepath, None,
+                                     page_obj.orig_image_filename, stave_group_size, page_idx,
+                                     coarse_to_fine) + detection_render_args)
+        else:
+            worker_args_list.append((None, page_obj.orig_image,
+                                     page_obj.orig_image_filename, stave_group_size, page_idx,
+                                     coarse_to_fine) + detection_render_args)
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        result_list = list(executor.map(auto_annotate_page_worker, worker_args_list))
+
+    report_list = []
+    for page_obj, (page_dict, report_dict, detection_candidate_cache) in zip(page_obj_list, result_list):
+
+        if page_obj.num_sg > 0:
+            page_obj.delete_sg_list()
+
+        for sg_dict in page_dict["sg_list"]:
+            page_obj.add_stave_group(StaveGroup.make_object_from_dict(page_obj, sg_dict))
+
+        # Detected on the same image (or render) as this page's own
+        page_obj.detection_candidate_cache.update(detection_candidate_cache)
+
+        report_list.append(AutoAnnotationReport.make_object_from_dict(report_dict))
+
+    num_review_pages = len([r for r in report_list if r.needs_review()])
+    print("Auto-annotated {} pages; {} of them need review".format(len(report_list), num_review_pages))
+
+    if combined_page_obj is not None:
+        if target_page_width is None:
+            target_page_width = combined_page_obj.page_width
+
+        merge_page_annotations_into_combined_page(page_obj_list, combined_page_obj,
+                                                  target_page_width)
+
+    return report_list
+
+
+def annotate_pages(page_obj_list, stave_group_size=1, num_prefetch_pages=None):
+
+    # --------------------------------------------------------------------------
+    # Auto-annotate all the pages, and open the GUIs only for the pages with
+    # doubtful detections: the stave line GUI if the stave lines are doubtful
+    # (followed by the bar GUI, since the stave groups may have changed), or
+    # just the bar GUI if only the bar lines are.
+    # The pages are not all detected up front: their detections are computed
+    # in the background (see `DetectionPrefetcher`; up to
+    # `num_prefetch_pages` pages ahead, default: all of them), and each page
+    # is annotated from them as soon as they are ready. So the GUIs of the
+    # first doubtful page open while the later pages are still detected,
+    # and every GUI opens with its detections (and display pyramid) ready
+    # --------------------------------------------------------------------------
+    if num_prefetch_pages is None:
+        num_prefetch_pages = len(page_obj_list)
+
+    prefetcher = DetectionPrefetcher(page_obj_list,
+                                     stave_group_size=stave_group_size,
+                                     num_prefetch_pages=num_prefetch_pages,
+                                     doubtful_pages_only=True)
+    prefetcher.prefetch_pages_after(-1)
+
+    report_list = []
+    try:
+        for page_idx, page_obj in enumerate(page_obj_list):
+            prefetcher.make_page_ready(page_idx)
+            prefetcher.prefetch_pages_after(page_idx)
+
+            report = auto_annotate_page(page_obj, stave_group_size, page_idx)
+            report_list.append(report)
+
+            if not report.needs_review():
+                continue
+
+            if report.has_doubtful_stave_lines():
+                print("Page {}: Doubtful stave lines; opening the stave line selector".format(report.page_idx))
+                if not interactive_stave_line_process(page_obj, stave_group_size=stave_group_size):
+                    print("Page {}: Stave lines are still not valid; skipping its bars".format(report.page_idx))
+                    continue
+
+                interactive_bar_selector_process(page_obj)
+
+            elif report.has_doubtful_bar_lines():
+                print("Page {}: Doubtful bar lines; opening the bar selector".format(report.page_idx))
+                interactive_bar_selector_process(page_obj)
+
+    finally:
+        prefetcher.shutdown()
+
+    num_review_pages = len([r for r in report_list if r.needs_review()])
+    print("Auto-annotated {} pages; {} of them needed review".format(len(report_list), num_review_pages))
+
+    return report_list
@@ -1,10 +1,11 @@
-from copy import deepcopy
-
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
 from barUtils import Bar
+from binaryImageUtils import get_col_counts_at, get_fully_covered_cols
+from intervalIndex import IntervalIndex
+from guiDisplayUtils import ViewportImageDisplay, LineLabelArray, BlitManager
 
 
 BAR_LINE_GUI_CONFIDENT_COLOR = "mediumblue"
@@ -14,12 +15,14 @@ OVERLAY_GUI_EVEN_COLOR = "mediumorchid"
 OVERLAY_GUI_ODD_COLOR = "seagreen"
 OVERLAY_GUI_ALPHA = 0.25
 
+BAR_LINE_CANDIDATES_KEY = "bar_lines"
+
 
 class StaveGroupWithBarsGUI:
 
     def __init__(self,
                  ax,
-                 page_bin_img,
+                 page_obj,
                  stave_group,
                  existing_obj=None):
 
@@ -29,128 +32,66 @@ class StaveGroupWithBarsGUI:
         self.stave_group_top_row = self.stave_group.top_lim_row
         self.stave_group_bottom_row = self.stave_group.bottom_lim_row
         self.stave_group_height = self.stave_group_bottom_row - self.stave_group_top_row + 1
-        self.page_width = page_bin_img.shape[1]
+        self.page_width = page_obj.page_width
+
+        self.line_patch_dict = {}
 
         if existing_obj is None:
-            self.auto_determine_bar_lines(page_bin_img)
+            self.auto_determine_bar_lines(page_obj)
         else:
-            self.copy_bar_lines_from_existing_obj(page_bin_img, existing_obj)
+            self.copy_bar_lines_from_existing_obj(existing_obj)
 
         self.create_bar_overlays()
 
         return
 
 
-    def auto_determine_bar_lines(self,
-                                 page_bin_img):
-
-        num_staves = self.stave_group.num_staves
-
-        indi_bar_line_left_edge_list = []
-        indi_bar_line_right_edge_list = []
-        indi_bar_line_confident_list = []
-        indi_bar_line_doubtful_list = []
-
-        for stave in self.stave_group.stave_list:
-            left_edge_list, right_edge_list = weak_filter_bar_lines_in_single_stave(
-                page_bin_img,
-                stave.top_lim_row, stave.bottom_lim_row
-            )
-
-            confident_lines, doubtful_lines = get_bar_lines_confidence_in_single_stave(
-                page_bin_img,
-                stave.line_top_edge_rows, stave.line_bottom_edge_rows,
-                left_edge_list, right_edge_list
-            )
-
-            indi_bar_line_left_edge_list.append(left_edge_list)
-            indi_bar_line_right_edge_list.append(right_edge_list)
-            indi_bar_line_confident_list.append(confident_lines)
-            indi_bar_line_doubtful_list.append(doubtful_lines)
-
-        if num_staves == 1:
-            group_bar_line_left_edge_list = indi_bar_line_left_edge_list[0]
-            group_bar_line_right_edge_list = indi_bar_line_right_edge_list[0]
-            group_bar_line_confident_list = indi_bar_line_confident_list[0]
-            group_bar_line_doubtful_list = indi_bar_line_doubtful_list[0]
+    @property
+    def num_lines(self):
+        return len(self.line_labels)
 
-        else:
-            group_bar_line_left_edge_list = []
-            group_bar_line_right_edge_list = []
-            group_bar_line_confident_list = []
-            group_bar_line_doubtful_list = []
-
-            num_indi_bar_lines = [len(ll) for ll in indi_bar_line_left_edge_list]
-            indi_ptr_list = [0 for _ in range(num_staves)]
-            curr_group_bar_idx = 0
-
-            reached_end = False
-            while True:
-
-                # Check if any pointer has gone beyond its individual last "line"
-                for curr_indi_ptr, curr_num_indi_bar_lines in zip(indi_ptr_list, num_indi_bar_lines):
-                    if curr_indi_ptr >= curr_num_indi_bar_lines:
-                        reached_end = True
-                        break
-
-                if reached_end:
-                    break
-
-
-                curr_indi_bar_line_left_edges = [indi_bar_line_left_edge_list[idx][ptr]
-                                                 for (idx, ptr) in enumerate(indi_ptr_list)]
-                curr_indi_bar_line_right_edges = [indi_bar_line_right_edge_list[idx][ptr]
-                                                  for (idx, ptr) in enumerate(indi_ptr_list)]
-
-                (are_overlapping,
-                 overlap_left_edge, overlap_right_edge) = combine_indi_bar_lines(
-                    curr_indi_bar_line_left_edges,
-                    curr_indi_bar_line_right_edges
-                )
-
-                # All indi bar lines overlap; hence this IS a group bar-line
-                if are_overlapping:
-                    curr_left_edge = min(curr_indi_bar_line_left_edges)
-                    curr_right_edge = max(curr_indi_bar_line_right_edges)
-
-                    is_confident = all([(ptr in confident_list)
-                                        for (ptr, confident_list) in zip(indi_ptr_list, indi_bar_line_confident_list)])
-
-                    group_bar_line_left_edge_list.append(curr_left_edge)
-                    group_bar_line_right_edge_list.append(curr_right_edge)
-                    if is_confident:
-                        group_bar_line_confident_list.append(curr_group_bar_idx)
-                    else:
-                        group_bar_line_doubtful_list.append(curr_group_bar_idx)
 
-                    curr_group_bar_idx += 1
+    def add_line_patch(self, label, color):
 
-                    # Increment all indi bar line ptrs
-                    for idx in range(num_staves):
-                        indi_ptr_list[idx] += 1
+        lc, rc = self.line_labels.get_line_lims(label)
+        curr_line = patches.Rectangle((lc-1, self.stave_group_top_row-1), rc-lc+1, self.stave_group_height,
+                                      color=color,
+                                      visible=self.line_labels.is_visible(label))
+        self.ax.add_patch(BlitManager.add_artist(curr_line))
+        self.line_patch_dict[label] = curr_line
 
+        return
 
-                # There is at least one non-overlapping indi bar line.
-                # Just increment the leftmost ptr and continue
-                else:
-                    leftmost_ptr_idx = np.argmin(curr_indi_bar_line_left_edges)
-                    indi_ptr_list[leftmost_ptr_idx] += 1
 
+    def get_patches_in_cols(self, left_col, right_col):
+
+        # The patch of a line [lc, rc] covers the cols [lc-1, rc]; the bar
+        # overlays are few, and just checked one by one
+        line_patch_list = [self.line_patch_dict[label]
+                           for label in self.line_labels.labels_in_range(left_col, right_col + 1)]
+        overlay_patch_list = [bo for bo in self.bar_overlay_list
+                              if (bo.get_x() <= right_col) and (bo.get_x() + bo.get_width() >= left_col)]
 
-        num_bar_lines = len(group_bar_line_left_edge_list)
+        return line_patch_list + overlay_patch_list
 
-        if num_bar_lines < 2:
-            group_bar_line_left_edge_list = [5, self.page_width-7]
-            group_bar_line_right_edge_list = [6, self.page_width-6]
-            group_bar_line_confident_list = []
-            group_bar_line_doubtful_list = [0, 1]
 
+    def remove_line_patch(self, label):
 
-        self.num_lines = len(group_bar_line_left_edge_list)
+        self.line_patch_dict[label].remove()
+        del self.line_patch_dict[label]
+
+        return
 
-        self.visible_col_list = [False] * self.page_width
-        self.valid_line_list = [None] * self.page_width
-        self.line_to_col_map = {}
+
+    def auto_determine_bar_lines(self,
+                                 page_obj):
+
+        (group_bar_line_left_edge_list, group_bar_line_right_edge_list,
+         group_bar_line_confident_list, group_bar_line_doubtful_list) = get_bar_line_candidates(
+            page_obj, self.stave_group
+        )
+
+        self.line_labels = LineLabelArray(self.page_width)
 
         for idx, (lc, rc) in enumerate(zip(group_bar_line_left_edge_list, group_bar_line_right_edge_list)):
             if idx in group_bar_line_confident_list:
@@ -158,46 +99,18 @@ class StaveGroupWithBarsGUI:
             else:
                 curr_color = BAR_LINE_GUI_DOUBTFUL_COLOR
 
-            curr_line = patches.Rectangle((lc-1, self.stave_group_top_row-1), rc-lc+1, self.stave_group_height,
-                                          color=curr_color)
-            self.ax.add_patch(curr_line)
-
-            for c in range(lc, rc + 1):
-                self.visible_col_list[c] = True
-                self.valid_line_list[c] = curr_line
-
-            self.line_to_col_map[curr_line] = [c for c in range(lc, rc + 1)]
+            label = self.line_labels.add_line(lc, rc)
+            self.add_line_patch(label, curr_color)
 
         return
 
 
-    def copy_bar_lines_from_existing_obj(self, page_bin_img, existing_obj):
-
-        self.num_lines = existing_obj.num_lines
-        self.visible_col_list = deepcopy(existing_obj.visible_col_list)
+    def copy_bar_lines_from_existing_obj(self, existing_obj):
 
-        page_width = page_bin_img.shape[1]
-        self.valid_line_list = [None] * page_width
-        self.line_to_col_map = {}
+        self.line_labels = existing_obj.line_labels.copy()
 
-        for existing_line in existing_obj.line_to_col_map.keys():
-            existing_line_x = existing_line.get_x()
-            existing_line_y = existing_line.get_y()
-            existing_line_width = existing_line.get_width()
-            existing_line_height = existing_line.get_height()
-            existing_line_color = existing_line.get_facecolor()
-            existing_visibility = existing_line.get_visible()
-
-            curr_line = patches.Rectangle((existing_line_x, existing_line_y),
-                                          existing_line_width, existing_line_height,
-                                          color=existing_line_color,
-                                          visible=existing_visibility)
-
-            self.line_to_col_map[curr_line] = deepcopy(existing_obj.line_to_col_map[existing_line])
-            for c in self.line_to_col_map[curr_line]:
-                self.valid_line_list[c] = curr_line
-
-            self.ax.add_patch(curr_line)
+        for label, existing_line in existing_obj.line_patch_dict.items():
+            self.add_line_patch(label, existing_line.get_facecolor())
 
         return
 
@@ -242,43 +155,40 @@ class StaveGroupWithBarsGUI:
                                                  color=bar_overlay_color,
                                                  alpha=OVERLAY_GUI_ALPHA)
 
-            self.ax.add_patch(curr_bar_overlay)
+            self.ax.add_patch(BlitManager.add_artist(curr_bar_overlay))
             self.bar_overlay_list.append(curr_bar_overlay)
 
         return
 
 
     def get_bar_line_col_indices(self):
-        visible_col_bool_arr = np.array(self.visible_col_list)
-        line_left_edge_cols = np.nonzero(np.logical_and(visible_col_bool_arr[1:], np.invert(visible_col_bool_arr[:-1])))[0] + 1
-        line_right_edge_cols = np.nonzero(np.logical_and(visible_col_bool_arr[:-1], np.invert(visible_col_bool_arr[1:])))[0]
-
-        return line_left_edge_cols, line_right_edge_cols
+        return self.line_labels.get_visible_line_edges()
 
 
     def process_click_event(self, col_click):
 
-        has_valid_line_curr_col = self.valid_line_list[col_click]
+        col_click = min(max(col_click, 0), self.page_width - 1)
+        has_valid_line_curr_col = self.line_labels.has_line_at(col_click)
 
         if has_valid_line_curr_col:
             self.toggle_line_visibility(col_click)
 
         else:
             if col_click == 0:
-                if self.valid_line_list[col_click + 1] is not None:
+                if self.line_labels.has_line_at(col_click + 1):
                     self.add_to_line(col_click, col_click + 1)
                 else:
                     self.create_new_line(col_click)
 
             elif col_click == (self.page_width - 1):
-                if self.valid_line_list[col_click - 1]:
+                if self.line_labels.has_line_at(col_click - 1):
                     self.add_to_line(col_click, col_click - 1)
                 else:
                     self.create_new_line(col_click)
 
             else:
-                has_valid_prev_line_col = self.valid_line_list[col_click - 1]
-                has_valid_next_line_col = self.valid_line_list[col_click + 1]
+                has_valid_prev_line_col = self.line_labels.has_line_at(col_click - 1)
+                has_valid_next_line_col = self.line_labels.has_line_at(col_click + 1)
 
                 if (not has_valid_prev_line_col) and (not has_valid_next_line_col):
                     self.create_new_line(col_click)
@@ -295,10 +205,9 @@ class StaveGroupWithBarsGUI:
 
     def toggle_line_visibility(self, col_click):
 
-        num_visible_lines = np.count_nonzero([line.get_visible()
-                                              for line in self.line_to_col_map.keys()])
-        curr_line = self.valid_line_list[col_click]
-        curr_visibility = curr_line.get_visible()
+        num_visible_lines = self.line_labels.num_visible_lines()
+        label = self.line_labels.label_at(col_click)
+        curr_visibility = self.line_labels.is_visible(label)
 
         # Do not allow toggling OFF a line, if the number of currently visible
         # lines is <= 2
@@ -306,11 +215,8 @@ class StaveGroupWithBarsGUI:
             return
 
         new_visibility = not curr_visibility
-        curr_line.set_visible(new_visibility)
-
-        line_col_list = self.line_to_col_map[curr_line]
-        for col in line_col_list:
-            self.visible_col_list[col] = new_visibility
+        self.line_labels.set_visible(label, new_visibility)
+        self.line_patch_dict[label].set_visible(new_visibility)
 
         self.update_bar_overlays()
 
@@ -319,19 +225,8 @@ class StaveGroupWithBarsGUI:
 
     def create_new_line(self, col_click):
 
-        lc = col_click
-        rc = col_click
-
-        curr_line = patches.Rectangle((lc - 1, self.stave_group_top_row - 1), rc - lc + 1, self.stave_group_height,
-                                      color=BAR_LINE_GUI_CONFIDENT_COLOR)
-        self.ax.add_patch(curr_line)
-
-        for c in range(lc, rc + 1):
-            self.visible_col_list[c] = True
-            self.valid_line_list[c] = curr_line
-
-        self.line_to_col_map[curr_line] = [col_click]
-        self.num_lines += 1
+        label = self.line_labels.add_line(col_click, col_click)
+        self.add_line_patch(label, BAR_LINE_GUI_CONFIDENT_COLOR)
 
         self.update_bar_overlays()
 
@@ -340,29 +235,15 @@ class StaveGroupWithBarsGUI:
 
     def add_to_line(self, col_click, existing_col):
 
-        curr_line = self.valid_line_list[existing_col]
+        label = self.line_labels.label_at(existing_col)
+        self.line_labels.extend_line(label, col_click)
 
-        prev_width = curr_line.get_width()
-        new_width = prev_width + 1
-
-        prev_x = curr_line.get_x()
-        if col_click < existing_col:
-            new_x = prev_x - 1
-        else:
-            new_x = prev_x
-
-        curr_line.set_width(new_width)
-        curr_line.set_x(new_x)
+        lc, rc = self.line_labels.get_line_lims(label)
+        curr_line = self.line_patch_dict[label]
+        curr_line.set_x(lc - 1)
+        curr_line.set_width(rc - lc + 1)
         curr_line.set_visible(True)
 
-        line_col_list = self.line_to_col_map[curr_line]
-        for col in line_col_list:
-            self.visible_row_list[col] = True
-
-        self.visible_col_list[col_click] = True
-        self.valid_line_list[col_click] = curr_line
-        self.line_to_col_map[curr_line] = sorted(self.line_to_col_map[curr_line] + [col_click])
-
         self.update_bar_overlays()
 
         return
@@ -371,57 +252,188 @@ class StaveGroupWithBarsGUI:
     def merge_two_lines(self, col_click):
 
         # Disallow merge if number of visible lines is <= 2!
-        num_visible_lines = np.count_nonzero([line.get_visible()
-                                              for line in self.line_to_col_map.keys()])
-        if num_visible_lines <= 2:
+        if self.line_labels.num_visible_lines() <= 2:
             return
 
+        label_to_left = self.line_labels.label_at(col_click - 1)
+        label_to_right = self.line_labels.label_at(col_click + 1)
 
-        line_to_left = self.valid_line_list[col_click - 1]
-        line_to_right = self.valid_line_list[col_click + 1]
+        merged_label = self.line_labels.merge_lines(label_to_left, label_to_right)
+        self.add_line_patch(merged_label, BAR_LINE_GUI_CONFIDENT_COLOR)
 
-        merged_lc = self.line_to_col_map[line_to_left][0]
-        merged_rc = self.line_to_col_map[line_to_right][-1]
+        self.remove_line_patch(label_to_left)
+        self.remove_line_patch(label_to_right)
 
-        merged_line = patches.Rectangle((merged_lc-1, self.stave_group_top_row-1), merged_rc-merged_lc+1, self.stave_group_height,
-                                        color=BAR_LINE_GUI_CONFIDENT_COLOR)
-        self.ax.add_patch(merged_line)
+        self.update_bar_overlays()
 
-        for c in range(merged_lc, merged_rc + 1):
-            self.visible_col_list[c] = True
-            self.valid_line_list[c] = merged_line
+        return
 
-        self.line_to_col_map[merged_line] = list(np.arange(merged_lc, merged_rc+1))
-        self.num_lines -= 1
 
-        line_to_left.remove()
-        del self.line_to_col_map[line_to_left]
-        del line_to_left
 
-        line_to_right.remove()
-        del self.line_to_col_map[line_to_right]
-        del line_to_right
+def get_bar_line_candidates(page_obj, stave_group):
 
-        self.update_bar_overlays()
+    # --------------------------------------------------------------------------
+    # Same as `detect_bar_lines_in_stave_group`, but kept in the page's
+    # detection cache. The bar lines only depend on the rows of the stave
+    # lines; so the key is those rows, and a stave group that was remade with
+    # the same lines (e.g. after accepting the auto-detected stave lines)
+    # finds the bar lines detected for the old one, possibly ahead of time
+    # (see `DetectionPrefetcher`)
+    # --------------------------------------------------------------------------
+    candidates_key = (BAR_LINE_CANDIDATES_KEY,)
+    for stave in stave_group.stave_list:
+        candidates_key += (tuple(int(r) for r in stave.line_top_edge_rows) +
+                           tuple(int(r) for r in stave.line_bottom_edge_rows))
 
-        return
+    candidates = page_obj.detection_candidate_cache.get(candidates_key)
+    if candidates is not None:
+        return candidates
 
+    candidates = detect_bar_lines_in_stave_group(page_obj.get_detection_image(), stave_group)
+    page_obj.detection_candidate_cache[candidates_key] = candidates
 
+    return candidates
 
-def combine_indi_bar_lines(left_edges, right_edges):
 
-    min_left_edge = min(left_edges)
-    max_left_edge = max(left_edges)
-    min_right_edge = min(right_edges)
-    max_right_edge = max(right_edges)
+def detect_bar_lines_in_stave_group(detection_image, stave_group):
+
+    # --------------------------------------------------------------------------
+    # Detect the bar lines of each stave in the group, and keep only the ones
+    # that are present (i.e. overlapping) in ALL the staves.
+    # Returns the left/right edge cols of the group bar lines, and the indices
+    # of the confident and doubtful ones. If less than 2 bar lines are found,
+    # two doubtful lines near the page edges are returned instead
+    # --------------------------------------------------------------------------
+    num_staves = stave_group.num_staves
+    page_width = detection_image.full_width
+
+    indi_bar_line_left_edge_list = []
+    indi_bar_line_right_edge_list = []
+    indi_bar_line_confident_list = []
+    indi_bar_line_doubtful_list = []
+
+    for stave in stave_group.stave_list:
+        (left_edge_list, right_edge_list,
+         confident_lines, doubtful_lines) = detect_bar_lines_in_single_stave(detection_image,
+                                                                             stave)
+
+        indi_bar_line_left_edge_list.append(left_edge_list)
+        indi_bar_line_right_edge_list.append(right_edge_list)
+        indi_bar_line_confident_list.append(confident_lines)
+        indi_bar_line_doubtful_list.append(doubtful_lines)
+
+    if num_staves == 1:
+        group_bar_line_left_edge_list = indi_bar_line_left_edge_list[0]
+        group_bar_line_right_edge_list = indi_bar_line_right_edge_list[0]
+        group_bar_line_confident_list = indi_bar_line_confident_list[0]
+        group_bar_line_doubtful_list = indi_bar_line_doubtful_list[0]
 
-    if max_left_edge < min_right_edge:
-        are_overlapping = True
     else:
-        are_overlapping = False
+        (group_bar_line_left_edge_list, group_bar_line_right_edge_list,
+         group_bar_line_confident_list, group_bar_line_doubtful_list) = merge_indi_bar_lines(
+            indi_bar_line_left_edge_list, indi_bar_line_right_edge_list,
+            indi_bar_line_confident_list
+        )
+
+    num_bar_lines = len(group_bar_line_left_edge_list)
+
+    if num_bar_lines < 2:
+        group_bar_line_left_edge_list = [5, page_width-7]
+        group_bar_line_right_edge_list = [6, page_width-6]
+        group_bar_line_confident_list = []
+        group_bar_line_doubtful_list = [0, 1]
+
+    return (group_bar_line_left_edge_list, group_bar_line_right_edge_list,
+            group_bar_line_confident_list, group_bar_line_doubtful_list)
+
+
+def merge_indi_bar_lines(indi_bar_line_left_edge_list, indi_bar_line_right_edge_list,
+                         indi_bar_line_confident_list):
+
+    # --------------------------------------------------------------------------
+    # Merge the bar lines of the individual staves into group bar lines.
+    #
+    # Each stave has a pointer to its current bar line. If the current bar
+    # lines of ALL the staves overlap (i.e. max left edge < min right edge),
+    # they form a group bar line, and all the pointers move on; else the
+    # pointer with the leftmost left edge (the first one, on ties) moves on.
+    # This stops as soon as any pointer runs past its last line.
+    #
+    # The single step moves of the leftmost pointer are done as jumps: while
+    # only that pointer moves, the other staves' edges are fixed, so the
+    # first position where it stops being the leftmost, or where its bar
+    # line overlaps all the others, is found with binary searches on its
+    # (sorted) edge arrays. The result is identical to stepping one by one.
+    # --------------------------------------------------------------------------
+    num_staves = len(indi_bar_line_left_edge_list)
+
+    left_edge_arr_list = [np.asarray(ll) for ll in indi_bar_line_left_edge_list]
+    right_edge_arr_list = [np.asarray(rl) for rl in indi_bar_line_right_edge_list]
+    num_indi_bar_lines = [len(ll) for ll in left_edge_arr_list]
 
-    return are_overlapping, min_left_edge, max_right_edge
+    is_confident_arr_list = []
+    for curr_num_lines, confident_list in zip(num_indi_bar_lines, indi_bar_line_confident_list):
+        is_confident_arr = np.zeros(curr_num_lines, dtype="bool")
+        is_confident_arr[np.asarray(confident_list, dtype="int")] = True
+        is_confident_arr_list.append(is_confident_arr)
 
+    group_bar_line_left_edge_list = []
+    group_bar_line_right_edge_list = []
+    group_bar_line_confident_list = []
+    group_bar_line_doubtful_list = []
+
+    indi_ptr_list = [0 for _ in range(num_staves)]
+
+    while all([ptr < n for (ptr, n) in zip(indi_ptr_list, num_indi_bar_lines)]):
+
+        curr_left_edges = [left_edge_arr_list[idx][ptr] for (idx, ptr) in enumerate(indi_ptr_list)]
+        curr_right_edges = [right_edge_arr_list[idx][ptr] for (idx, ptr) in enumerate(indi_ptr_list)]
+
+        # All indi bar lines overlap; hence this IS a group bar-line
+        if max(curr_left_edges) < min(curr_right_edges):
+            is_confident = all([is_confident_arr_list[idx][ptr]
+                                for (idx, ptr) in enumerate(indi_ptr_list)])
+
+            group_bar_idx = len(group_bar_line_left_edge_list)
+            group_bar_line_left_edge_list.append(min(curr_left_edges))
+            group_bar_line_right_edge_list.append(max(curr_right_edges))
+            if is_confident:
+                group_bar_line_confident_list.append(group_bar_idx)
+            else:
+                group_bar_line_doubtful_list.append(group_bar_idx)
+
+            indi_ptr_list = [ptr + 1 for ptr in indi_ptr_list]
+            continue
+
+        # Else, move the leftmost pointer on, for as long as it stays the
+        # leftmost one without overlapping the others
+        k = int(np.argmin(curr_left_edges))
+        other_left_edges = curr_left_edges[:k] + curr_left_edges[k+1:]
+        other_right_edges = curr_right_edges[:k] + curr_right_edges[k+1:]
+
+        left_arr = left_edge_arr_list[k]
+        right_arr = right_edge_arr_list[k]
+        start_pos = indi_ptr_list[k] + 1
+
+        # It stops being the leftmost one when its left edge reaches the
+        # left edge of a stave before it, or passes one after it
+        stop_pos = num_indi_bar_lines[k]
+        if k > 0:
+            stop_pos = min(stop_pos, np.searchsorted(left_arr, min(curr_left_edges[:k]), side="left"))
+        if k < (num_staves - 1):
+            stop_pos = min(stop_pos, np.searchsorted(left_arr, min(curr_left_edges[k+1:]), side="right"))
+
+        # While it is the leftmost, the max left edge is the others' max; so
+        # it overlaps them when its right edge passes that (if the others
+        # overlap each other at all)
+        max_other_left_edge = max(other_left_edges)
+        if max_other_left_edge < min(other_right_edges):
+            stop_pos = min(stop_pos, np.searchsorted(right_arr, max_other_left_edge, side="right"))
+
+        indi_ptr_list[k] = max(start_pos, int(stop_pos))
+
+    return (group_bar_line_left_edge_list, group_bar_line_right_edge_list,
+            group_bar_line_confident_list, group_bar_line_doubtful_list)
 
 
 class BarSelectorGUI:
@@ -430,20 +442,21 @@ class BarSelectorGUI:
                  page_obj,
                  existing_gui_obj=None):
 
-        self.orig_img = page_obj.orig_image
-        self.bin_img = page_obj.bin_image
-
-        self.img_height = self.bin_img.shape[0]
-        self.img_width = self.bin_img.shape[1]
+        self.img_height = page_obj.page_height
+        self.img_width = page_obj.page_width
 
         self.figure = plt.figure()
         self.ax = plt.gca()
 
-        self.ax.imshow(self.orig_img)
+        # Only the visible part of the page is drawn; see `ViewportImageDisplay`
+        self.image_display = ViewportImageDisplay(self.ax, page_obj.get_display_pyramid())
         self.figure.canvas.mpl_connect("button_press_event", self.on_click)
 
-        self.sg_gui_list = []
-        self.valid_sg_gui_list = [None] * self.img_height
+        # The SG GUI objects, looked up by the clicked row
+        self.sg_gui_index = IntervalIndex(get_sg_gui_row_lims)
+
+        # A click only redraws the stave group it was in
+        self.blit_manager = BlitManager(self.ax, self.get_patches_in_region)
 
         if existing_gui_obj is None:
             self.add_sg_gui_objects(page_obj)
@@ -453,19 +466,20 @@ class BarSelectorGUI:
         return
 
 
+    @property
+    def sg_gui_list(self):
+        return self.sg_gui_index.item_list
+
+
     def add_sg_gui_objects(self, page_obj):
         for sg in page_obj.sg_list:
-            curr_sg_gui_obj = StaveGroupWithBarsGUI(self.ax, self.bin_img, sg)
-            self.sg_gui_list.append(curr_sg_gui_obj)
-            for r in range(curr_sg_gui_obj.stave_group_top_row, curr_sg_gui_obj.stave_group_bottom_row):
-                self.valid_sg_gui_list[r] = curr_sg_gui_obj
+            curr_sg_gui_obj = StaveGroupWithBarsGUI(self.ax, page_obj, sg)
+            self.sg_gui_index.insert(curr_sg_gui_obj)
 
     def copy_sg_gui_objects_from_existing_obj(self, page_obj, existing_gui_obj):
         for sg, existing_sg_gui_obj in zip(page_obj.sg_list, existing_gui_obj.sg_gui_list):
-            new_sg_gui_obj = StaveGroupWithBarsGUI(self.ax, self.bin_img, sg, existing_sg_gui_obj)
-            self.sg_gui_list.append(new_sg_gui_obj)
-            for r in range(new_sg_gui_obj.stave_group_top_row, new_sg_gui_obj.stave_group_bottom_row):
-                self.valid_sg_gui_list[r] = new_sg_gui_obj
+            new_sg_gui_obj = StaveGroupWithBarsGUI(self.ax, page_obj, sg, existing_sg_gui_obj)
+            self.sg_gui_index.insert(new_sg_gui_obj)
 
 
     def get_bar_line_col_indices(self):
@@ -494,25 +508,36 @@ class BarSelectorGUI:
         row_click = int(round(y_pos))
         col_click = int(round(x_pos))
 
-        curr_sg_gui = self.valid_sg_gui_list[row_click]
+        curr_sg_gui = self.sg_gui_index.find_at(row_click)
         if curr_sg_gui is None:
             return
 
         curr_sg_gui.process_click_event(col_click)
 
-        event.canvas.draw()
+        self.blit_manager.redraw_region(curr_sg_gui.stave_group_top_row - 1, curr_sg_gui.stave_group_bottom_row,
+                                        0, self.img_width - 1)
+
         return
 
 
-def weak_filter_bar_lines_in_single_stave(bin_img,
-                                          stave_top_lim_row, stave_bottom_lim_row):
+    def get_patches_in_region(self, top_row, bottom_row, left_col, right_col):
 
-    # Get the cropped image corresponding to the rows of the staff
-    stave_img = bin_img[stave_top_lim_row: stave_bottom_lim_row+1, :]
-    stave_height = stave_img.shape[0]
+        # The patches of a stave group cover the rows [top-1, bottom], i.e.
+        # one more on each side than its (clickable) index limits
+        patch_list = []
+        for sg_gui_obj in self.sg_gui_index.find_all_overlapping(top_row - 1, bottom_row + 1):
+            patch_list += sg_gui_obj.get_patches_in_cols(left_col, right_col)
 
-    # Count the number of TRUE pixels in each column
-    count_arr = np.count_nonzero(stave_img, axis=0)
+        return patch_list
+
+
+def get_sg_gui_row_lims(sg_gui_obj):
+
+    # The bottom row of the stave group is not clickable
+    return sg_gui_obj.stave_group_top_row, sg_gui_obj.stave_group_bottom_row - 1
+
+
+def weak_filter_bar_lines_in_single_stave(bin_img, stave_top_lim_row, stave_bottom_lim_row):
 
     # --------------------------------------------------------------------------
     # Main logic:
@@ -523,8 +548,9 @@ def weak_filter_bar_lines_in_single_stave(bin_img,
     #          it is not perfect.
     # --------------------------------------------------------------------------
 
-    # Find the columns that span the whole height with TRUE pixels
-    valid_bar_line_bool_arr = (count_arr == stave_height)
+    # Find the columns that span the whole height with TRUE pixels (on a
+    # run-length index, the columns with a single vertical run covering it)
+    valid_bar_line_bool_arr = get_fully_covered_cols(bin_img, stave_top_lim_row, stave_bottom_lim_row)
 
     # --------------------------------------------------------------------------
     # A bar line may be "thick" i.e. it may span multiple adjoining columns
@@ -536,14 +562,37 @@ def weak_filter_bar_lines_in_single_stave(bin_img,
     return left_edge_col_indices, right_edge_col_indices
 
 
+def detect_bar_lines_in_single_stave(detection_image, stave):
+
+    # Map the stave line rows onto the (possibly reduced resolution) detection
+    # image, detect the bar lines there, and map their edges back to the full
+    # resolution columns
+    line_top_edge_rows = detection_image.rows_to_detection(stave.line_top_edge_rows)
+    line_bottom_edge_rows = detection_image.rows_to_detection(stave.line_bottom_edge_rows)
+
+    left_edge_cols, right_edge_cols = weak_filter_bar_lines_in_single_stave(
+        detection_image.bin_image,
+        line_top_edge_rows[0], line_bottom_edge_rows[-1]
+    )
+
+    confident_lines, doubtful_lines = get_bar_lines_confidence_in_single_stave(
+        detection_image.bin_image,
+        line_top_edge_rows, line_bottom_edge_rows,
+        left_edge_cols, right_edge_cols
+    )
+
+    left_edge_cols, right_edge_cols = detection_image.cols_to_full(left_edge_cols, right_edge_cols)
+
+    return left_edge_cols, right_edge_cols, confident_lines, doubtful_lines
+
+
 def get_bar_lines_confidence_in_single_stave(bin_img,
                                              stave_line_top_row_indices, stave_line_bottom_row_indices,
                                              bar_line_left_edge_indices, bar_line_right_edge_indices):
 
-    # Get the cropped image corresponding to the rows of the staff
+    # Get the rows of the staff
     stave_top_lim_row = stave_line_top_row_indices[0]
     stave_bottom_lim_row = stave_line_bottom_row_indices[-1]
-    stave_img = bin_img[stave_top_lim_row: stave_bottom_lim_row+1, :]
 
     # Count the number of pixels in the staff image, that belong to the staff
     # lines. Essentially, this is the sum of (bottom-top+1) for all 5 staff lines
@@ -552,51 +601,39 @@ def get_bar_lines_confidence_in_single_stave(bin_img,
     # Get the number of candidate bar lines
     num_candidate_bar_lines = len(bar_line_left_edge_indices)
 
-    # The bar lines will be separated into confident and doubtful candidates
-    confident_candidates = []
-    doubtful_candidates = []
-
-    # Loop over every candidate ...
-    for i in range(num_candidate_bar_lines):
-
-        # Default: Left edge and right edge is invalid
-        is_left_valid = False
-        is_right_valid = False
-
-        # Get the left and right edge of the candidate bar line
-        left_edge_index = bar_line_left_edge_indices[i]
-        right_edge_index = bar_line_right_edge_indices[i]
-
-        # Get the row pixel counts of the columns left of the left edge and
-        # right of the right edge
-        left_minus_one_row_sum = np.count_nonzero(stave_img[:, left_edge_index - 1])
-        right_plus_one_row_sum = np.count_nonzero(stave_img[:, right_edge_index + 1])
-
-        # ----------------------------------------------------------------------
-        # Main logic:
-        # Definite bar lines will have "empty" space on either sides of them,
-        # except for the staff lines themselves;
-        # (Slip-up: What about tie-lines crossing a bar line?)
-        # Also, The first and last bar lines will have their left and right
-        # sides empty, respectively;
-        # So bar edges not meeting these conditions will be considered "doubtful"
-        # ----------------------------------------------------------------------
-
-        # Find if the bar line edges meet the "requirements"
-        if (i == 0) or (left_minus_one_row_sum <= total_staff_line_pixels):
-            is_left_valid = True
-        if (i == (num_candidate_bar_lines - 1)) or (right_plus_one_row_sum <= total_staff_line_pixels):
-            is_right_valid = True
-
-        # Append the id to the respective list
-        if is_left_valid and is_right_valid:
-            confident_candidates.append(i)
-        else:
-            doubtful_candidates.append(i)
+    # Get the row pixel counts, in the rows of the staff, of the columns left
+    # of the left edge and right of the right edge of every candidate (like
+    # numpy indexing, these wrap around the image edges); only these columns
+    # are counted
+    img_width = bin_img.shape[1]
+    left_minus_one_row_sums = get_col_counts_at(bin_img,
+                                                (np.asarray(bar_line_left_edge_indices, dtype="int") - 1) % img_width,
+                                                stave_top_lim_row, stave_bottom_lim_row)
+    right_plus_one_row_sums = get_col_counts_at(bin_img,
+                                                (np.asarray(bar_line_right_edge_indices, dtype="int") + 1) % img_width,
+                                                stave_top_lim_row, stave_bottom_lim_row)
 
-    # Convert the lists to arrays
-    confident_candidates = np.array(confident_candidates)
-    doubtful_candidates = np.array(doubtful_candidates)
+    # --------------------------------------------------------------------------
+    # Main logic:
+    # Definite bar lines will have "empty" space on either sides of them,
+    # except for the staff lines themselves;
+    # (Slip-up: What about tie-lines crossing a bar line?)
+    # Also, The first and last bar lines will have their left and right
+    # sides empty, respectively;
+    # So bar edges not meeting these conditions will be considered "doubtful"
+    # --------------------------------------------------------------------------
+
+    # Find if the bar line edges meet the "requirements"
+    is_left_valid = (left_minus_one_row_sums <= total_staff_line_pixels)
+    is_right_valid = (right_plus_one_row_sums <= total_staff_line_pixels)
+    if num_candidate_bar_lines > 0:
+        is_left_valid[0] = True
+        is_right_valid[-1] = True
+
+    # Separate the ids into confident and doubtful candidates
+    is_confident = np.logical_and(is_left_valid, is_right_valid)
+    confident_candidates = np.nonzero(is_confident)[0]
+    doubtful_candidates = np.nonzero(np.invert(is_confident))[0]
 
     return confident_candidates, doubtful_candidates
 
@@ -621,6 +658,29 @@ def open_and_close_interactive_gui(page_obj,
     return bar_selector_gui
 
 
+def add_bars_to_stave_group(sg, bar_line_left_edge_cols, bar_line_right_edge_cols):
+
+    # Replace the bars of the stave group with the bars between each pair of
+    # consecutive bar lines
+    if sg.num_bars > 0:
+        sg.delete_bar_list()
+
+    num_bars = len(bar_line_left_edge_cols) - 1
+
+    for bar_idx in range(num_bars):
+
+        outer_left_col = bar_line_left_edge_cols[bar_idx]
+        inner_left_col = bar_line_right_edge_cols[bar_idx]
+        inner_right_col = bar_line_left_edge_cols[bar_idx+1]
+        outer_right_col = bar_line_right_edge_cols[bar_idx+1]
+
+        curr_bar = Bar(inner_left_col, inner_right_col,
+                       outer_left_col, outer_right_col)
+        sg.add_bar(curr_bar)
+
+    return
+
+
 def interactive_bar_selector_process(page_obj):
 
     bar_selector_gui = None
@@ -636,25 +696,9 @@ def interactive_bar_selector_process(page_obj):
 
         num_stave_groups = page_obj.num_sg
         for sg_idx in range(num_stave_groups):
-
-            curr_sg = page_obj.sg_list[sg_idx]
-            if curr_sg.num_bars > 0:
-                curr_sg.delete_bar_list()
-
-            curr_left_col_array = list_of_bar_line_left_edge_col_arrays[sg_idx]
-            curr_right_col_array = list_of_bar_line_right_edge_col_arrays[sg_idx]
-            num_bars = len(curr_left_col_array) - 1
-
-            for bar_idx in range(num_bars):
-
-                outer_left_col = curr_left_col_array[bar_idx]
-                inner_left_col = curr_right_col_array[bar_idx]
-                inner_right_col = curr_left_col_array[bar_idx+1]
-                outer_right_col = curr_right_col_array[bar_idx+1]
-
-                curr_bar = Bar(inner_left_col, inner_right_col,
-                               outer_left_col, outer_right_col)
-                curr_sg.add_bar(curr_bar)
+            add_bars_to_stave_group(page_obj.sg_list[sg_idx],
+                                    list_of_bar_line_left_edge_col_arrays[sg_idx],
+                                    list_of_bar_line_right_edge_col_arrays[sg_idx])
 
         page_obj.show_overlays()
 
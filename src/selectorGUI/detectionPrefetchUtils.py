@@ -0,0 +1,116 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from staveSelectorUtils import get_stave_line_candidates, check_stave_line_validity, make_stave_groups
+from barSelectorUtils import get_bar_line_candidates
+
+
+DEFAULT_NUM_PREFETCH_PAGES = 1
+
+
+def prefetch_page_detections(page_obj, stave_group_size, stave_lines_only=False,
+                             doubtful_pages_only=False):
+
+    # --------------------------------------------------------------------------
+    # Everything the selector GUIs of the page compute when they open: the
+    # display pyramid, the stave line candidates, and the bar line candidates
+    # of the stave groups made from those lines (i.e. the ones the page gets,
+    # if the stave lines are accepted as they are). All of it ends up in the
+    # page's own caches.
+    # With `stave_lines_only`, just the stave line candidates.
+    # With `doubtful_pages_only`, the display pyramid is built only if some
+    # of the candidates are doubtful (i.e. only for the pages whose GUIs
+    # `annotate_pages` opens)
+    # --------------------------------------------------------------------------
+    try:
+        top_edge_rows, bottom_edge_rows, _, doubtful_line_indices = get_stave_line_candidates(page_obj)
+        if stave_lines_only:
+            return True
+
+        are_lines_valid = check_stave_line_validity(top_edge_rows, bottom_edge_rows, stave_group_size)
+        is_doubtful = (not are_lines_valid) or (len(doubtful_line_indices) > 0)
+
+        if are_lines_valid:
+            for sg in make_stave_groups(top_edge_rows, bottom_edge_rows,
+                                        stave_group_size, page_obj.page_width):
+                _, _, _, doubtful_bar_lines = get_bar_line_candidates(page_obj, sg)
+                is_doubtful = is_doubtful or (len(doubtful_bar_lines) > 0)
+
+        if is_doubtful or (not doubtful_pages_only):
+            page_obj.get_display_pyramid()
+
+        return True
+
+    except Exception:
+        print("Error when prefetching the detections of page {}".format(page_obj.orig_image_filename))
+        print(traceback.format_exc())
+        return False
+
+
+
+class DetectionPrefetcher:
+
+    # --------------------------------------------------------------------------
+    # Runs `prefetch_page_detections` for the upcoming pages in a background
+    # thread, while the operator works on the current page in the GUIs (so
+    # the page objects are shared, and the results land in their caches).
+    # `page_obj_list` holds the pages in the order they are worked on (e.g.
+    # only the ones that need review; or all of them, to have them detected
+    # ahead of their automatic annotation, as in `annotate_pages`).
+    # A page must not be touched while its prefetch is running: call
+    # `make_page_ready` before annotating it or opening its GUIs
+    # --------------------------------------------------------------------------
+
+    def __init__(self,
+                 page_obj_list,
+                 stave_group_size=1,
+                 num_prefetch_pages=DEFAULT_NUM_PREFETCH_PAGES,
+                 doubtful_pages_only=False):
+
+        self.page_obj_list = page_obj_list
+        self.stave_group_size = stave_group_size
+        self.num_prefetch_pages = num_prefetch_pages
+        self.doubtful_pages_only = doubtful_pages_only
+
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future_dict = {}
+
+        return
+
+
+    def prefetch_pages_after(self, page_idx):
+
+        last_page_idx = min(page_idx + self.num_prefetch_pages, len(self.page_obj_list) - 1)
+
+        for next_page_idx in range(page_idx + 1, last_page_idx + 1):
+            if next_page_idx in self.future_dict:
+                continue
+
+            self.future_dict[next_page_idx] = self.executor.submit(prefetch_page_detections,
+                                                                   self.page_obj_list[next_page_idx],
+                                                                   self.stave_group_size,
+                                                                   doubtful_pages_only=self.doubtful_pages_only)
+
+        return
+
+
+    def make_page_ready(self, page_idx):
+
+        # Wait for the page's prefetch; or, if it was never prefetched, only
+        # get its stave line candidates now. Its bar lines are left to the
+        # bar GUI, since the stave groups may still change in the stave GUI
+        future = self.future_dict.pop(page_idx, None)
+        if future is not None:
+            return future.result()
+
+        return prefetch_page_detections(self.page_obj_list[page_idx], self.stave_group_size,
+                                        stave_lines_only=True)
+
+
+    def shutdown(self):
+
+        # Prefetches that have not started yet are dropped
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.future_dict = {}
+
+        return
@@ -0,0 +1,366 @@
+import numpy as np
+from matplotlib.transforms import Bbox
+
+
+NO_LINE_LABEL = -1
+
+# How far (in screen pixels) a patch can be drawn outside its data limits;
+# its edge line is 1pt wide (about 1.4 pixels at 100 dpi), plus antialiasing
+BLIT_REGION_MARGIN_PIXELS = 4
+
+
+class ViewportImageDisplay:
+
+    # --------------------------------------------------------------------------
+    # Shows a page image (given as an `ImagePyramid`) on a matplotlib axis,
+    # with only the part of it that is inside the current view, at the
+    # coarsest pyramid level that still has a pixel for every screen pixel.
+    # The crop is redone whenever the view limits or the window size change
+    # (zoom, pan, resize), so each draw resamples about a screen's worth of
+    # pixels, however tall the page is.
+    # The axis is in full resolution pixel coordinates, exactly as with
+    # `ax.imshow(full_image)`; so click positions and patches are unaffected
+    # --------------------------------------------------------------------------
+
+    def __init__(self, ax, pyramid):
+
+        self.ax = ax
+        self.pyramid = pyramid
+
+        self.full_height = pyramid.full_height
+        self.full_width = pyramid.full_width
+
+        coarsest_level_idx = pyramid.num_levels - 1
+        self.image_artist = ax.imshow(pyramid.get_level(coarsest_level_idx),
+                                      extent=self.get_extent(coarsest_level_idx, 0, None, 0, None))
+        self.curr_view_key = None
+
+        ax.set_xlim(-0.5, self.full_width - 0.5)
+        ax.set_ylim(self.full_height - 0.5, -0.5)
+
+        # The extent of the image changes with the crop; it must not move the
+        # view limits in turn
+        ax.set_autoscale_on(False)
+
+        ax.callbacks.connect("xlim_changed", self.on_view_changed)
+        ax.callbacks.connect("ylim_changed", self.on_view_changed)
+        ax.figure.canvas.mpl_connect("resize_event", self.on_view_changed)
+
+        self.update_view()
+
+        return
+
+
+    def get_extent(self, level_idx, start_row, end_row, start_col, end_col):
+
+        # Extent (in full resolution pixels) of the crop [start_row, end_row)
+        # x [start_col, end_col) of a level; the last block of a level may be
+        # cut short by the page edge
+        scale = 2 ** level_idx
+        level_shape = self.pyramid.get_level(level_idx).shape
+
+        if end_row is None:
+            end_row = level_shape[0]
+        if end_col is None:
+            end_col = level_shape[1]
+
+        left = (start_col * scale) - 0.5
+        right = min(end_col * scale, self.full_width) - 0.5
+        top = (start_row * scale) - 0.5
+        bottom = min(end_row * scale, self.full_height) - 0.5
+
+        return left, right, bottom, top
+
+
+    def on_view_changed(self, event):
+        self.update_view()
+
+
+    def update_view(self):
+
+        x_min, x_max = sorted(self.ax.get_xlim())
+        y_min, y_max = sorted(self.ax.get_ylim())
+
+        # The (equal aspect) box of the axis is only fitted to the limits at
+        # draw time; it must be fitted before its size is used
+        self.ax.apply_aspect()
+        ax_bbox = self.ax.get_window_extent()
+        if (ax_bbox.width <= 0) or (ax_bbox.height <= 0):
+            return
+
+        full_pixels_per_screen_pixel = min((x_max - x_min) / ax_bbox.width,
+                                           (y_max - y_min) / ax_bbox.height)
+        level_idx = self.pyramid.get_level_idx_for_scale(full_pixels_per_screen_pixel)
+
+        scale = 2 ** level_idx
+        level_image = self.pyramid.get_level(level_idx)
+
+        start_row = int(np.clip(np.floor((y_min + 0.5) / scale), 0, level_image.shape[0] - 1))
+        end_row = int(np.clip(np.ceil((y_max + 0.5) / scale), start_row + 1, level_image.shape[0]))
+        start_col = int(np.clip(np.floor((x_min + 0.5) / scale), 0, level_image.shape[1] - 1))
+        end_col = int(np.clip(np.ceil((x_max + 0.5) / scale), start_col + 1, level_image.shape[1]))
+
+        view_key = (level_idx, start_row, end_row, start_col, end_col)
+        if view_key == self.curr_view_key:
+            return
+
+        self.image_artist.set_data(level_image[start_row: end_row, start_col: end_col])
+        self.image_artist.set_extent(self.get_extent(*view_key))
+        self.curr_view_key = view_key
+
+        return
+
+
+
+class LineLabelArray:
+
+    # --------------------------------------------------------------------------
+    # The lines selected in a GUI along one axis of the page (stave lines
+    # along the rows, bar lines along the cols), as a label array: entry `i`
+    # is the label of the line covering row/col `i` (NO_LINE_LABEL if none).
+    # Each label also has its [start, end] limits and a visibility; toggled
+    # off lines keep their label, so clicking them again toggles them back on.
+    # Labels are never reused, so the GUIs can key their patches by them
+    # --------------------------------------------------------------------------
+
+    def __init__(self, length):
+
+        self.label_arr = np.full(length, NO_LINE_LABEL, dtype="int32")
+        self.line_lims_dict = {}
+        self.line_visibility_dict = {}
+        self.next_label = 0
+
+        return
+
+
+    def __len__(self):
+        return len(self.line_lims_dict)
+
+
+    @property
+    def length(self):
+        return len(self.label_arr)
+
+
+    def copy(self):
+
+        new_obj = LineLabelArray(self.length)
+        new_obj.label_arr = self.label_arr.copy()
+        new_obj.line_lims_dict = {label: list(lims) for (label, lims) in self.line_lims_dict.items()}
+        new_obj.line_visibility_dict = dict(self.line_visibility_dict)
+        new_obj.next_label = self.next_label
+
+        return new_obj
+
+
+    @property
+    def labels(self):
+        return list(self.line_lims_dict.keys())
+
+
+    def label_at(self, idx):
+        return int(self.label_arr[idx])
+
+
+    def has_line_at(self, idx):
+        return self.label_arr[idx] != NO_LINE_LABEL
+
+
+    def get_line_lims(self, label):
+        return self.line_lims_dict[label]
+
+
+    def is_visible(self, label):
+        return self.line_visibility_dict[label]
+
+
+    def set_visible(self, label, visibility):
+        self.line_visibility_dict[label] = visibility
+
+
+    def num_visible_lines(self):
+        return len([v for v in self.line_visibility_dict.values() if v])
+
+
+    def add_line(self, start, end, visibility=True):
+
+        label = self.next_label
+        self.next_label += 1
+
+        self.label_arr[start: end + 1] = label
+        self.line_lims_dict[label] = [int(start), int(end)]
+        self.line_visibility_dict[label] = visibility
+
+        return label
+
+
+    def extend_line(self, label, idx):
+
+        # Grow the line by the (adjacent) `idx`; this also makes it visible
+        lims = self.line_lims_dict[label]
+        lims[0] = min(lims[0], idx)
+        lims[1] = max(lims[1], idx)
+
+        self.label_arr[idx] = label
+        self.line_visibility_dict[label] = True
+
+        return
+
+
+    def remove_line(self, label):
+
+        start, end = self.line_lims_dict.pop(label)
+        del self.line_visibility_dict[label]
+
+        is_curr_label = self.label_arr[start: end + 1] == label
+        self.label_arr[start: end + 1][is_curr_label] = NO_LINE_LABEL
+
+        return
+
+
+    def merge_lines(self, first_label, second_label):
+
+        # One new (visible) line, from the start of the first line to the end
+        # of the second one
+        start = self.line_lims_dict[first_label][0]
+        end = self.line_lims_dict[second_label][1]
+
+        self.remove_line(first_label)
+        self.remove_line(second_label)
+
+        return self.add_line(start, end)
+
+
+    def labels_in_range(self, start, end):
+
+        # Labels of the lines covering any of [start, end], in order
+        start = max(int(np.floor(start)), 0)
+        end = min(int(np.ceil(end)), self.length - 1)
+
+        range_labels = np.unique(self.label_arr[start: end + 1])
+        return [int(label) for label in range_labels if label != NO_LINE_LABEL]
+
+
+    def get_visible_bool_arr(self):
+
+        # The extra (last) entry is for NO_LINE_LABEL (i.e. -1)
+        is_visible_label_arr = np.zeros(self.next_label + 1, dtype="bool")
+        for label, visibility in self.line_visibility_dict.items():
+            is_visible_label_arr[label] = visibility
+
+        return is_visible_label_arr[self.label_arr]
+
+
+    def get_visible_line_edges(self):
+
+        visible_bool_arr = self.get_visible_bool_arr()
+        line_start_edges = np.nonzero(np.logical_and(visible_bool_arr[1:], np.invert(visible_bool_arr[:-1])))[0] + 1
+        line_end_edges = np.nonzero(np.logical_and(visible_bool_arr[:-1], np.invert(visible_bool_arr[1:])))[0]
+
+        return line_start_edges, line_end_edges
+
+
+
+class BlitManager:
+
+    # --------------------------------------------------------------------------
+    # Redraws only the part of a GUI that a click changed.
+    # The GUI's patches are "animated", so a full draw (on opening, zoom, pan
+    # or resize) renders the page image alone; that render is cached as the
+    # background, and the patches in view are then drawn over it.
+    # After a click, `redraw_region` restores the background in just the
+    # changed region, redraws (clipped to it) only the patches there, and
+    # blits that region to the screen. The patches in a region are given by
+    # `get_artists_in_region_func(top_row, bottom_row, left_col, right_col)`
+    # (full resolution pixel coordinates); so the cost of a click depends on
+    # what is around it, and not on the number of lines/bars of the page
+    # --------------------------------------------------------------------------
+
+    def __init__(self, ax, get_artists_in_region_func):
+
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.get_artists_in_region_func = get_artists_in_region_func
+
+        self.background = None
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+        return
+
+
+    @staticmethod
+    def add_artist(artist):
+
+        # Animated artists are left out of full draws; this object draws them
+        artist.set_animated(True)
+
+        return artist
+
+
+    def get_artists_near_display_bbox(self, display_bbox):
+
+        # Every patch spilling into the bbox has to be drawn; i.e. the ones
+        # within the margin of it, in data coords
+        lookup_bbox = display_bbox.padded(BLIT_REGION_MARGIN_PIXELS)
+        lookup_corners = self.ax.transData.inverted().transform(lookup_bbox.corners()[[0, 3]])
+        left_col, right_col = np.sort(lookup_corners[:, 0])
+        top_row, bottom_row = np.sort(lookup_corners[:, 1])
+
+        return self.get_artists_in_region_func(top_row, bottom_row, left_col, right_col)
+
+
+    def on_draw(self, event):
+
+        self.background = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+
+        for artist in self.get_artists_near_display_bbox(self.ax.bbox):
+            self.ax.draw_artist(artist)
+
+        return
+
+
+    def redraw_region(self, top_row, bottom_row, left_col, right_col):
+
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+
+        # The region in display coords, grown by the most a patch can spill
+        # out of its data limits (its edge, and antialiasing), and clipped to
+        # the axis
+        corners = self.ax.transData.transform([[left_col, bottom_row], [right_col, top_row]])
+        x_min, x_max = sorted(corners[:, 0])
+        y_min, y_max = sorted(corners[:, 1])
+        region_bbox = Bbox.from_extents(np.floor(x_min) - BLIT_REGION_MARGIN_PIXELS,
+                                        np.floor(y_min) - BLIT_REGION_MARGIN_PIXELS,
+                                        np.ceil(x_max) + BLIT_REGION_MARGIN_PIXELS,
+                                        np.ceil(y_max) + BLIT_REGION_MARGIN_PIXELS)
+        region_bbox = Bbox.intersection(region_bbox, self.ax.bbox)
+        if region_bbox is None:
+            return
+
+        # `xy` is where the saved background itself goes, i.e. where it came
+        # from
+        self.canvas.restore_region(self.background,
+                                   bbox=self.get_buffer_extents(region_bbox),
+                                   xy=self.background.get_extents()[:2])
+
+        for artist in self.get_artists_near_display_bbox(region_bbox):
+            orig_clip_box = artist.get_clip_box()
+            artist.set_clip_box(region_bbox)
+            self.ax.draw_artist(artist)
+            artist.set_clip_box(orig_clip_box)
+
+        self.canvas.blit(region_bbox)
+        self.canvas.flush_events()
+
+        return
+
+
+    def get_buffer_extents(self, display_bbox):
+
+        # Display coords run bottom-up; the saved buffer runs top-down, and
+        # its extents include the last pixel
+        fig_height = self.ax.figure.bbox.height
+        return (int(display_bbox.x0), int(fig_height - display_bbox.y1),
+                int(display_bbox.x1) - 1, int(fig_height - display_bbox.y0) - 1)
@@ -1,82 +1,107 @@
-from copy import deepcopy
-
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
 from staveUtils import Stave, StaveGroup
+from binaryImageUtils import get_row_counts, get_pooled_row_counts, get_longest_row_runs
+from guiDisplayUtils import ViewportImageDisplay, LineLabelArray, BlitManager
 
 
 INSIDE_STAVE_GAP_DEVIATION = 5
+COARSE_ROW_POOL_FACTOR = 4
+COARSE_COL_STEP = 8
+FINE_THRESH_ROW_SAMPLE_STEP = 16
+MIN_LINE_ROW_LONGEST_RUN_FRACTION = 1 / 8
 GUI_CONFIDENT_COLOR = "C0"
 GUI_DOUBTFUL_COLOR = "C1"
 
+STAVE_LINE_CANDIDATES_KEY = "stave_lines"
+COARSE_TO_FINE_STAVE_LINE_CANDIDATES_KEY = "coarse_to_fine_stave_lines"
+
 
 class StaveLineSelectorGUI:
 
+    # --------------------------------------------------------------------------
+    # The page is shown through a `ViewportImageDisplay` (only the visible
+    # part, at screen resolution), and the selected lines are kept in a
+    # `LineLabelArray` over the rows; so neither opening the GUI nor
+    # clicking in it scales with the page height.
+    # A click only redraws the rows of the line it changed (see
+    # `BlitManager`)
+    # --------------------------------------------------------------------------
+
     def __init__(self,
                  page_obj,
                  existing_gui_obj=None):
 
-        self.orig_img = page_obj.orig_image
-        self.bin_img = page_obj.bin_image
-
-        self.img_height = self.bin_img.shape[0]
-        self.img_width = self.bin_img.shape[1]
+        self.img_height = page_obj.page_height
+        self.img_width = page_obj.page_width
 
         self.figure = plt.figure()
         self.ax = plt.gca()
 
-        self.ax.imshow(self.orig_img)
+        self.image_display = ViewportImageDisplay(self.ax, page_obj.get_display_pyramid())
         self.figure.canvas.mpl_connect("button_press_event", self.on_click)
 
+        self.line_patch_dict = {}
+        self.blit_manager = BlitManager(self.ax, self.get_patches_in_region)
+
         if existing_gui_obj is None:
-            self.auto_determine_lines()
+            self.auto_determine_lines(page_obj)
         else:
             self.copy_lines_from_existing_obj(existing_gui_obj)
 
         return
 
 
+    @property
+    def num_lines(self):
+        return len(self.line_labels)
 
-    def copy_lines_from_existing_obj(self, existing_obj):
 
-        self.num_lines = existing_obj.num_lines
-        self.visible_row_list = deepcopy(existing_obj.visible_row_list)
+    def add_line_patch(self, label, color):
+
+        tr, br = self.line_labels.get_line_lims(label)
+        curr_line = patches.Rectangle((0, tr - 1), self.img_width, br - tr + 1,
+                                      color=color,
+                                      visible=self.line_labels.is_visible(label))
+        self.ax.add_patch(BlitManager.add_artist(curr_line))
+        self.line_patch_dict[label] = curr_line
 
-        self.valid_line_list = [None] * self.img_height
-        self.line_to_row_map = {}
+        return
 
-        for existing_line in existing_obj.line_to_row_map.keys():
-            existing_line_y = existing_line.get_y()
-            existing_line_height = existing_line.get_height()
-            existing_line_color = existing_line.get_facecolor()
-            existing_visibility = existing_line.get_visible()
 
-            curr_line = patches.Rectangle((0, existing_line_y), self.img_width, existing_line_height,
-                                          color=existing_line_color,
-                                          visible=existing_visibility)
+    def get_patches_in_region(self, top_row, bottom_row, left_col, right_col):
 
-            self.line_to_row_map[curr_line] = deepcopy(existing_obj.line_to_row_map[existing_line])
-            for r in self.line_to_row_map[curr_line]:
-                self.valid_line_list[r] = curr_line
+        # The patch of a line [tr, br] covers the rows [tr-1, br]
+        return [self.line_patch_dict[label]
+                for label in self.line_labels.labels_in_range(top_row, bottom_row + 1)]
 
-            self.ax.add_patch(curr_line)
+
+    def remove_line_patch(self, label):
+
+        self.line_patch_dict[label].remove()
+        del self.line_patch_dict[label]
 
         return
 
 
-    def auto_determine_lines(self):
+    def copy_lines_from_existing_obj(self, existing_obj):
+
+        self.line_labels = existing_obj.line_labels.copy()
+
+        for label, existing_line in existing_obj.line_patch_dict.items():
+            self.add_line_patch(label, existing_line.get_facecolor())
+
+        return
 
-        top_edge_row_indices, bottom_edge_row_indices = weak_filter_stave_lines(self.bin_img)
-        self.num_lines = len(top_edge_row_indices)
 
-        confident_indices, doubtful_indices = get_stave_lines_confidence(top_edge_row_indices,
-                                                                         bottom_edge_row_indices)
+    def auto_determine_lines(self, page_obj):
 
-        self.visible_row_list = [False] * self.img_height
-        self.valid_line_list = [None] * self.img_height
-        self.line_to_row_map = {}
+        (top_edge_row_indices, bottom_edge_row_indices,
+         confident_indices, doubtful_indices) = get_stave_line_candidates(page_obj)
+
+        self.line_labels = LineLabelArray(self.img_height)
 
         for idx, (tr, br) in enumerate(zip(top_edge_row_indices, bottom_edge_row_indices)):
             if idx in confident_indices:
@@ -84,26 +109,14 @@ class StaveLineSelectorGUI:
             else:
                 curr_color = GUI_DOUBTFUL_COLOR
 
-            curr_line = patches.Rectangle((0, tr - 1), self.img_width, br - tr + 1,
-                                          color=curr_color)
-            self.ax.add_patch(curr_line)
-
-            for r in range(tr, br + 1):
-                self.visible_row_list[r] = True
-                self.valid_line_list[r] = curr_line
-
-            self.line_to_row_map[curr_line] = [r for r in range(tr, br + 1)]
+            label = self.line_labels.add_line(tr, br)
+            self.add_line_patch(label, curr_color)
 
         return
 
 
     def get_line_row_indices(self):
-
-        visible_row_bool_arr = np.array(self.visible_row_list)
-        line_top_edge_rows = np.nonzero(np.logical_and(visible_row_bool_arr[1:], np.invert(visible_row_bool_arr[:-1])))[0] + 1
-        line_bottom_edge_rows = np.nonzero(np.logical_and(visible_row_bool_arr[:-1], np.invert(visible_row_bool_arr[1:])))[0]
-
-        return line_top_edge_rows, line_bottom_edge_rows
+        return self.line_labels.get_visible_line_edges()
 
 
 
@@ -117,28 +130,28 @@ class StaveLineSelectorGUI:
         if (x_pos is None) or (y_pos is None):
             return
 
-        row_click = int(round(y_pos))
-        has_valid_line_curr_row = self.valid_line_list[row_click]
+        row_click = min(max(int(round(y_pos)), 0), self.img_height - 1)
+        has_valid_line_curr_row = self.line_labels.has_line_at(row_click)
 
         if has_valid_line_curr_row:
             self.toggle_line_visibility(row_click)
 
         else:
             if row_click == 0:
-                if self.valid_line_list[row_click + 1] is not None:
+                if self.line_labels.has_line_at(row_click + 1):
                     self.add_to_line(row_click, row_click + 1)
                 else:
                     self.create_new_line(row_click)
 
             elif row_click == (self.img_height-1):
-                if self.valid_line_list[row_click - 1]:
+                if self.line_labels.has_line_at(row_click - 1):
                     self.add_to_line(row_click, row_click - 1)
                 else:
                     self.create_new_line(row_click)
 
             else:
-                has_valid_prev_line_row = self.valid_line_list[row_click - 1]
-                has_valid_next_line_row = self.valid_line_list[row_click + 1]
+                has_valid_prev_line_row = self.line_labels.has_line_at(row_click - 1)
+                has_valid_next_line_row = self.line_labels.has_line_at(row_click + 1)
 
                 if (not has_valid_prev_line_row) and (not has_valid_next_line_row):
                     self.create_new_line(row_click)
@@ -150,101 +163,61 @@ class StaveLineSelectorGUI:
                     else:
                         self.add_to_line(row_click, row_click + 1)
 
-        event.canvas.draw()
+        # Whatever the click did, the changed line now covers the clicked row
+        tr, br = self.line_labels.get_line_lims(self.line_labels.label_at(row_click))
+        self.blit_manager.redraw_region(tr - 1, br, 0, self.img_width - 1)
+
         return
 
 
     def toggle_line_visibility(self, row_click):
 
-        curr_line = self.valid_line_list[row_click]
-        curr_visibility = curr_line.get_visible()
-        new_visibility = not curr_visibility
-        curr_line.set_visible(new_visibility)
+        label = self.line_labels.label_at(row_click)
+        new_visibility = not self.line_labels.is_visible(label)
 
-        line_row_list = self.line_to_row_map[curr_line]
-        for row in line_row_list:
-            self.visible_row_list[row] = new_visibility
+        self.line_labels.set_visible(label, new_visibility)
+        self.line_patch_dict[label].set_visible(new_visibility)
 
         return
 
 
     def create_new_line(self, row_click):
 
-        tr = row_click
-        br = row_click
-
-        curr_line = patches.Rectangle((0, tr - 1), self.img_width, br - tr + 1,
-                                      color=GUI_CONFIDENT_COLOR)
-        self.ax.add_patch(curr_line)
-
-        for r in range(tr, br + 1):
-            self.visible_row_list[r] = True
-            self.valid_line_list[r] = curr_line
-
-        self.line_to_row_map[curr_line] = [row_click]
-        self.num_lines += 1
+        label = self.line_labels.add_line(row_click, row_click)
+        self.add_line_patch(label, GUI_CONFIDENT_COLOR)
 
         return
 
 
     def add_to_line(self, row_click, existing_row):
 
-        curr_line = self.valid_line_list[existing_row]
+        label = self.line_labels.label_at(existing_row)
+        self.line_labels.extend_line(label, row_click)
 
-        prev_height = curr_line.get_height()
-        new_height = prev_height + 1
-
-        prev_y = curr_line.get_y()
-        if row_click < existing_row:
-            new_y = prev_y - 1
-        else:
-            new_y = prev_y
-
-        curr_line.set_height(new_height)
-        curr_line.set_y(new_y)
+        tr, br = self.line_labels.get_line_lims(label)
+        curr_line = self.line_patch_dict[label]
+        curr_line.set_y(tr - 1)
+        curr_line.set_height(br - tr + 1)
         curr_line.set_visible(True)
 
-        line_row_list = self.line_to_row_map[curr_line]
-        for row in line_row_list:
-            self.visible_row_list[row] = True
-
-        self.visible_row_list[row_click] = True
-        self.valid_line_list[row_click] = curr_line
-        self.line_to_row_map[curr_line] = sorted(self.line_to_row_map[curr_line] + [row_click])
-
         return
 
 
     def merge_two_lines(self, row_click):
 
-        line_above = self.valid_line_list[row_click - 1]
-        line_below = self.valid_line_list[row_click + 1]
-
-        merged_tr = self.line_to_row_map[line_above][0]
-        merged_br = self.line_to_row_map[line_below][-1]
-
-        merged_line = patches.Rectangle((0, merged_tr - 1), self.img_width, merged_br - merged_tr + 1,
-                                        color=GUI_CONFIDENT_COLOR)
-        self.ax.add_patch(merged_line)
+        label_above = self.line_labels.label_at(row_click - 1)
+        label_below = self.line_labels.label_at(row_click + 1)
 
-        for r in range(merged_tr, merged_br + 1):
-            self.visible_row_list[r] = True
-            self.valid_line_list[r] = merged_line
+        merged_label = self.line_labels.merge_lines(label_above, label_below)
+        self.add_line_patch(merged_label, GUI_CONFIDENT_COLOR)
 
-        self.line_to_row_map[merged_line] = list(np.arange(merged_tr, merged_br+1))
-        self.num_lines -= 1
-
-        line_above.remove()
-        del self.line_to_row_map[line_above]
-        del line_above
-
-        line_below.remove()
-        del self.line_to_row_map[line_below]
-        del line_below
+        self.remove_line_patch(label_above)
+        self.remove_line_patch(label_below)
 
         return
 
 
+
 def weak_filter_stave_lines(bin_img):
 
     # --------------------------------------------------------------------------
@@ -254,10 +227,8 @@ def weak_filter_stave_lines(bin_img):
     # the score page!
     # --------------------------------------------------------------------------
 
-    # Count the number of TRUE pixels in each row, and make a sorted array of
-    # those counts
-    count_arr = np.count_nonzero(bin_img, axis=1)
-    sorted_count_arr = np.sort(count_arr)
+    # Count the number of TRUE pixels in each row
+    count_arr = get_row_counts(bin_img)
 
     # --------------------------------------------------------------------------
     # Main logic:
@@ -274,14 +245,13 @@ def weak_filter_stave_lines(bin_img):
     # to the jump between the length smallest "long" line, and some other line.
     # --------------------------------------------------------------------------
 
-    # Find the jumps between each item in the sorted array, and find where the
-    # maximum jump occurs; that becomes the count threshold
-    diff_arr = sorted_count_arr[1:] - sorted_count_arr[:-1]
-    max_diff_ind = np.argmax(diff_arr)
-    min_count_thresh = sorted_count_arr[max_diff_ind]
-
     # Any line that has a count above this threshold, is a staff line!
-    raw_valid_row_bool_arr = count_arr > min_count_thresh
+    # (unless its ink is scattered in short runs; see `drop_scattered_rows`)
+    is_long_line_row = count_arr > get_long_line_count_thresh(count_arr)
+    line_rows = drop_scattered_rows(bin_img, np.nonzero(is_long_line_row)[0], count_arr[is_long_line_row])
+
+    raw_valid_row_bool_arr = np.zeros(len(count_arr), dtype="bool")
+    raw_valid_row_bool_arr[line_rows] = True
 
     # --------------------------------------------------------------------------
     # Due to the nature of the binary image, a single staff line may be "thick",
@@ -289,13 +259,153 @@ def weak_filter_stave_lines(bin_img):
     # we need to find the top and bottom rows corresponding to each staff line
     # --------------------------------------------------------------------------
 
+    return get_line_edge_rows(raw_valid_row_bool_arr)
+
+
+def get_long_line_count_thresh(count_arr):
+
+    # Sort the counts, find the jumps between each item in the sorted array,
+    # and find where the maximum jump occurs; that becomes the count threshold
+    sorted_count_arr = np.sort(count_arr)
+    diff_arr = sorted_count_arr[1:] - sorted_count_arr[:-1]
+    max_diff_ind = np.argmax(diff_arr)
+
+    return sorted_count_arr[max_diff_ind]
+
+
+def drop_scattered_rows(bin_img, row_arr, count_arr):
+
+    # --------------------------------------------------------------------------
+    # The ink of a staff line row is in a few long runs (the line itself;
+    # maybe broken in places, or split over a few rows by a skewed scan);
+    # while a row of text, or of dashes, can have as much ink, but only in
+    # short runs. So, of the rows in `row_arr` (with counts `count_arr`),
+    # the ones whose longest run is less than
+    # `MIN_LINE_ROW_LONGEST_RUN_FRACTION` of their count are dropped
+    # --------------------------------------------------------------------------
+    longest_run_arr = get_longest_row_runs(bin_img, row_arr)
+
+    return row_arr[longest_run_arr >= MIN_LINE_ROW_LONGEST_RUN_FRACTION * count_arr]
+
+
+def get_line_edge_rows(valid_row_bool_arr):
+
     # Find the top and bottom edges of each staff line
-    line_top_edge_rows = np.nonzero(np.logical_and(raw_valid_row_bool_arr[1:], np.invert(raw_valid_row_bool_arr[:-1])))[0] + 1
-    line_bottom_edge_rows = np.nonzero(np.logical_and(raw_valid_row_bool_arr[:-1], np.invert(raw_valid_row_bool_arr[1:])))[0]
+    line_top_edge_rows = np.nonzero(np.logical_and(valid_row_bool_arr[1:], np.invert(valid_row_bool_arr[:-1])))[0] + 1
+    line_bottom_edge_rows = np.nonzero(np.logical_and(valid_row_bool_arr[:-1], np.invert(valid_row_bool_arr[1:])))[0]
 
     return line_top_edge_rows, line_bottom_edge_rows
 
 
+def get_coarse_bands(bin_img,
+                     row_pool_factor=COARSE_ROW_POOL_FACTOR,
+                     col_step=COARSE_COL_STEP):
+
+    # --------------------------------------------------------------------------
+    # Where the staff lines can be, from a 4x (`row_pool_factor`) coarser
+    # look at the page: the "largest jump" count threshold, on the max-pooled
+    # row counts (see `get_pooled_row_counts`), picks the pools with long
+    # lines in them.
+    # Returns which pools are bands, and the rows in the bands; the last
+    # (partial) pool is not in the coarse pass, and its rows are always band
+    # rows
+    # --------------------------------------------------------------------------
+    img_height = bin_img.shape[0]
+
+    pooled_count_arr = get_pooled_row_counts(bin_img, row_pool_factor, col_step)
+    num_pooled_rows = len(pooled_count_arr) * row_pool_factor
+
+    if len(pooled_count_arr) > 1:
+        is_band_pool = pooled_count_arr > get_long_line_count_thresh(pooled_count_arr)
+    else:
+        is_band_pool = np.ones(len(pooled_count_arr), dtype="bool")
+
+    band_rows = ((np.nonzero(is_band_pool)[0][:, np.newaxis] * row_pool_factor) +
+                 np.arange(row_pool_factor)).ravel()
+    band_rows = np.concatenate([band_rows, np.arange(num_pooled_rows, img_height)])
+
+    return is_band_pool, band_rows
+
+
+def coarse_to_fine_filter_stave_lines(bin_img,
+                                      row_pool_factor=COARSE_ROW_POOL_FACTOR,
+                                      col_step=COARSE_COL_STEP,
+                                      row_sample_step=FINE_THRESH_ROW_SAMPLE_STEP):
+
+    # --------------------------------------------------------------------------
+    # Like `weak_filter_stave_lines`, in two passes:
+    #     - Coarse: the candidate bands of rows (see `get_coarse_bands`)
+    #     - Fine: only the rows inside the bands are tested against the
+    #       "largest jump" count threshold. Inside the bands, there are mostly
+    #       staff line rows, and very few of the other rows; so the threshold
+    #       is taken over the band rows together with a sample of the rest of
+    #       the page (every `row_sample_step`-th row outside the bands)
+    # Only the band rows and the sample are counted (which, on a plain
+    # ndarray, is most of the work) and sorted. On unskewed pages, the result
+    # is the single pass result; on skewed pages, the two can differ in the
+    # rows that a line is split over.
+    # --------------------------------------------------------------------------
+    img_height = bin_img.shape[0]
+
+    is_band_pool, band_rows = get_coarse_bands(bin_img, row_pool_factor, col_step)
+
+    sample_pool_indices = np.arange(0, len(is_band_pool), max(1, row_sample_step // row_pool_factor))
+    sample_rows = sample_pool_indices[np.invert(is_band_pool[sample_pool_indices])] * row_pool_factor
+
+    count_arr = get_row_counts(bin_img, np.concatenate([band_rows, sample_rows]))
+    band_count_arr = count_arr[:len(band_rows)]
+
+    # (a tiny image can have too few rows counted to find a jump in)
+    raw_valid_row_bool_arr = np.zeros(img_height, dtype="bool")
+    if len(count_arr) > 1:
+        is_long_line_row = band_count_arr > get_long_line_count_thresh(count_arr)
+        line_rows = drop_scattered_rows(bin_img, band_rows[is_long_line_row], band_count_arr[is_long_line_row])
+        raw_valid_row_bool_arr[line_rows] = True
+
+    return get_line_edge_rows(raw_valid_row_bool_arr)
+
+
+def detect_stave_lines(detection_image, coarse_to_fine=False):
+
+    # Detect the lines on the (possibly reduced resolution) detection image,
+    # and map their edges back to the full resolution rows
+    if coarse_to_fine:
+        top_edge_rows, bottom_edge_rows = coarse_to_fine_filter_stave_lines(detection_image.bin_image)
+    else:
+        top_edge_rows, bottom_edge_rows = weak_filter_stave_lines(detection_image.bin_image)
+
+    return detection_image.rows_to_full(top_edge_rows, bottom_edge_rows)
+
+
+def get_stave_line_candidates(page_obj, coarse_to_fine=False):
+
+    # --------------------------------------------------------------------------
+    # The auto-detected stave lines of the page, and which of them are
+    # confident/doubtful. They are kept in the page's detection cache; so
+    # they are detected only once per page, possibly ahead of time (see
+    # `DetectionPrefetcher`), or by the automatic annotation.
+    # The lines found by `coarse_to_fine_filter_stave_lines` are kept apart;
+    # they may differ from the ones the GUIs show
+    # --------------------------------------------------------------------------
+    if coarse_to_fine:
+        candidates_key = COARSE_TO_FINE_STAVE_LINE_CANDIDATES_KEY
+    else:
+        candidates_key = STAVE_LINE_CANDIDATES_KEY
+
+    candidates = page_obj.detection_candidate_cache.get(candidates_key)
+    if candidates is not None:
+        return candidates
+
+    top_edge_rows, bottom_edge_rows = detect_stave_lines(page_obj.get_detection_image(),
+                                                         coarse_to_fine=coarse_to_fine)
+    confident_indices, doubtful_indices = get_stave_lines_confidence(top_edge_rows, bottom_edge_rows)
+
+    candidates = (top_edge_rows, bottom_edge_rows, confident_indices, doubtful_indices)
+    page_obj.detection_candidate_cache[candidates_key] = candidates
+
+    return candidates
+
+
 def get_stave_lines_confidence(line_top_edge_rows, line_bottom_edge_rows):
 
     # --------------------------------------------------------------------------
@@ -312,8 +422,13 @@ def get_stave_lines_confidence(line_top_edge_rows, line_bottom_edge_rows):
     # a doubtful line; the others are "confident" lines
     # --------------------------------------------------------------------------
 
-    # Make a sorted list of line gaps
+    # With fewer than three lines, there are too few gaps to find the usual
+    # one from; so none of the lines (if any) are confident
     num_lines = len(line_top_edge_rows)
+    if num_lines < 3:
+        return np.array([], dtype="int"), np.arange(num_lines)
+
+    # Make a sorted list of line gaps
     line_gaps = line_top_edge_rows[1:] - line_bottom_edge_rows[:-1]
     sorted_line_gaps = np.sort(line_gaps)
 
@@ -390,6 +505,47 @@ def check_stave_line_validity(line_top_edge_rows, line_bottom_edge_rows,
 
 
 
+def make_stave_groups(line_top_edge_rows, line_bottom_edge_rows,
+                      stave_group_size, page_width,
+                      parent_page=None):
+
+    # Stave groups made from every 5 consecutive lines (a stave) and every
+    # `stave_group_size` staves
+    num_lines = len(line_top_edge_rows)
+    num_staves = int(num_lines / 5)
+    num_sg = int(num_staves / stave_group_size)
+
+    list_staves = []
+    for stave_idx in range(num_staves):
+        curr_stave_top_row_list = line_top_edge_rows[stave_idx*5: (stave_idx+1)*5]
+        curr_stave_bottom_row_list = line_bottom_edge_rows[stave_idx*5: (stave_idx+1) * 5]
+        list_staves.append(Stave(curr_stave_top_row_list, curr_stave_bottom_row_list,
+                                 left_lim_col=0, right_lim_col=page_width))
+
+    sg_list = []
+    for sg_idx in range(num_sg):
+        curr_stave_list = list_staves[sg_idx*stave_group_size: (sg_idx+1)*stave_group_size]
+        sg_list.append(StaveGroup(curr_stave_list,
+                                  parent_page=parent_page))
+
+    return sg_list
+
+
+def add_stave_groups_to_page(page_obj, line_top_edge_rows, line_bottom_edge_rows,
+                             stave_group_size):
+
+    # Replace the stave groups of the page with new ones
+    if page_obj.num_sg > 0:
+        page_obj.delete_sg_list()
+
+    for sg in make_stave_groups(line_top_edge_rows, line_bottom_edge_rows,
+                                stave_group_size, page_obj.page_width,
+                                parent_page=page_obj):
+        page_obj.add_stave_group(sg)
+
+    return
+
+
 def interactive_stave_line_process(page_obj, stave_group_size=1):
 
     stave_gui = None
@@ -408,24 +564,8 @@ def interactive_stave_line_process(page_obj, stave_group_size=1):
                 break
 
 
-        num_lines = len(line_top_edge_rows)
-        num_staves = int(num_lines / 5)
-        num_sg = int(num_staves / stave_group_size)
-
-        list_staves = []
-        for stave_idx in range(num_staves):
-            curr_stave_top_row_list = line_top_edge_rows[stave_idx*5: (stave_idx+1)*5]
-            curr_stave_bottom_row_list = line_bottom_edge_rows[stave_idx*5: (stave_idx+1) * 5]
-            list_staves.append(Stave(curr_stave_top_row_list, curr_stave_bottom_row_list,
-                                     left_lim_col=0, right_lim_col=page_obj.page_width))
-
-        if page_obj.num_sg > 0:
-            page_obj.delete_sg_list()
-
-        for sg_idx in range(num_sg):
-            curr_stave_list = list_staves[sg_idx*stave_group_size: (sg_idx+1)*stave_group_size]
-            page_obj.add_stave_group(StaveGroup(curr_stave_list,
-                                                parent_page=page_obj))
+        add_stave_groups_to_page(page_obj, line_top_edge_rows, line_bottom_edge_rows,
+                                 stave_group_size)
 
         page_obj.show_overlays()
 
@@ -3,26 +3,101 @@ import traceback
 import numpy as np
 
 from barUtils import Bar
+from annotationStore import AnnotationStore
+from intervalIndex import IntervalIndex
 
 
 class Stave:
 
+    # --------------------------------------------------------------------------
+    # A view into an `AnnotationStore`: the line rows and the col limits live
+    # in the store's arrays, and this object only holds their indices.
+    # A stave made without a parent group gets a small store of its own, and
+    # is moved into its group's store when it is added to one
+    # --------------------------------------------------------------------------
+
+    __slots__ = ("annotation_store", "line_start_idx", "num_lines", "stave_idx",
+                 "parent_group")
+
     def __init__(self,
                  line_top_edge_rows, line_bottom_edge_rows,
                  left_lim_col=None, right_lim_col=None,
                  parent_group=None):
 
-        self.line_top_edge_rows = np.array(line_top_edge_rows, dtype="int")
-        self.line_bottom_edge_rows = np.array(line_bottom_edge_rows, dtype="int")
+        if parent_group is not None:
+            self.annotation_store = parent_group.annotation_store
+        else:
+            self.annotation_store = AnnotationStore(initial_capacity=len(line_top_edge_rows))
+
+        self.line_start_idx = self.annotation_store.add_lines(np.asarray(line_top_edge_rows, dtype="int"),
+                                                              np.asarray(line_bottom_edge_rows, dtype="int"))
+        self.num_lines = len(line_top_edge_rows)
+        self.stave_idx = self.annotation_store.add_stave_cols(left_lim_col, right_lim_col)
 
         self.assign_parent_group(parent_group)
 
+        return
+
+
+    # --------------------------------------------------------------------------
+    # NOTE: The line row arrays are copies of the store's rows (a view would
+    #       follow later edits only until the store grows); edit the rows
+    #       through the stave, e.g. with `offset_row_lims`
+    # --------------------------------------------------------------------------
+    @property
+    def line_top_edge_rows(self):
+        return self.annotation_store.line_rows[self.line_start_idx: self.line_start_idx + self.num_lines, 0].copy()
+
+
+    @property
+    def line_bottom_edge_rows(self):
+        return self.annotation_store.line_rows[self.line_start_idx: self.line_start_idx + self.num_lines, 1].copy()
+
+
+    @property
+    def top_lim_row(self):
+        return self.annotation_store.line_rows[self.line_start_idx, 0]
+
+
+    @property
+    def bottom_lim_row(self):
+        return self.annotation_store.line_rows[self.line_start_idx + self.num_lines - 1, 1]
+
+
+    @property
+    def left_lim_col(self):
+        return AnnotationStore.stored_to_col(self.annotation_store.stave_cols[self.stave_idx, 0])
+
+
+    @left_lim_col.setter
+    def left_lim_col(self, col):
+        self.annotation_store.stave_cols[self.stave_idx, 0] = AnnotationStore.col_to_stored(col)
+        self.annotation_store.version += 1
+
+
+    @property
+    def right_lim_col(self):
+        return AnnotationStore.stored_to_col(self.annotation_store.stave_cols[self.stave_idx, 1])
+
 
-        self.top_lim_row = self.line_top_edge_rows[0]
-        self.bottom_lim_row = self.line_bottom_edge_rows[-1]
+    @right_lim_col.setter
+    def right_lim_col(self, col):
+        self.annotation_store.stave_cols[self.stave_idx, 1] = AnnotationStore.col_to_stored(col)
+        self.annotation_store.version += 1
 
-        self.left_lim_col = left_lim_col
-        self.right_lim_col = right_lim_col
+
+    def move_to_store(self, annotation_store):
+
+        if annotation_store is self.annotation_store:
+            return
+
+        line_rows = self.annotation_store.line_rows[self.line_start_idx: self.line_start_idx + self.num_lines]
+        stave_cols = self.annotation_store.stave_cols[self.stave_idx]
+
+        self.line_start_idx = annotation_store.add_lines(line_rows[:, 0], line_rows[:, 1])
+        self.stave_idx = annotation_store.add_stave_cols(None, None)
+        annotation_store.stave_cols[self.stave_idx] = stave_cols
+        self.annotation_store = annotation_store
 
         return
 
@@ -70,6 +145,8 @@ class Stave:
 
     def assign_parent_group(self, pg):
         self.parent_group = pg
+        if pg is not None:
+            self.move_to_store(pg.annotation_store)
         return
 
 
@@ -94,13 +171,9 @@ class Stave:
 
     def offset_row_lims(self, offset):
 
-        # Offset each line's row lims
-        self.line_top_edge_rows = [r+offset for r in self.line_top_edge_rows]
-        self.line_bottom_edge_rows = [r+offset for r in self.line_bottom_edge_rows]
-
-        # Update overall limits
-        self.top_lim_row = self.line_top_edge_rows[0]
-        self.bottom_lim_row = self.line_bottom_edge_rows[-1]
+        # Offset each line's row lims (the overall limits follow from them)
+        self.annotation_store.line_rows[self.line_start_idx: self.line_start_idx + self.num_lines] += offset
+        self.annotation_store.version += 1
 
         return
 
@@ -117,30 +190,41 @@ class Stave:
 
 class StaveGroup:
 
+    # --------------------------------------------------------------------------
+    # The staves and bars of a group share its `AnnotationStore`, which is
+    # the store of its parent page (or a store of its own, for a group
+    # without a page). The group limits are derived from the staves/bars
+    # each time, so they stay correct after page-wide edits of the store.
+    # The staves (by rows) and bars (by inner cols) are kept in interval
+    # indices, which also hold the `stave_list`/`bar_list`
+    # --------------------------------------------------------------------------
+
+    __slots__ = ("annotation_store", "parent_page", "stave_index", "bar_index",
+                 "num_staves", "num_bars")
+
     def __init__(self,
                  stave_list=None,
                  bar_list=None,
                  parent_page=None):
 
-        self.assign_parent_page(parent_page)
-
-        if stave_list is None:
-            self.stave_list = []
+        if parent_page is not None:
+            self.annotation_store = parent_page.annotation_store
         else:
-            self.stave_list = stave_list
+            self.annotation_store = AnnotationStore()
 
-        if bar_list is None:
-            self.bar_list = []
-        else:
-            self.bar_list = bar_list
+        self.parent_page = parent_page
+
+        self.stave_index = IntervalIndex(get_stave_row_lims, stave_list,
+                                         get_version_func=self.get_annotation_store_version)
+        self.bar_index = IntervalIndex(get_bar_inner_col_lims, bar_list,
+                                       get_version_func=self.get_annotation_store_version)
 
         self.num_staves = len(self.stave_list)
         self.num_bars = len(self.bar_list)
 
         self.assign_parent_to_all_child_staves()
-        self.determine_left_right_cols()
-        self.determine_top_bottom_rows()
-
+        for bar in self.bar_list:
+            bar.assign_parent_sg(self)
 
         return
 
@@ -236,22 +320,17 @@ class StaveGroup:
 
     def offset_row_lims(self, offset):
 
-        # Offset the individual staves
+        # Offset the individual staves (own limits follow from them)
         for stave in self.stave_list:
             stave.offset_row_lims(offset)
 
-        # Update own limits
-        self.determine_top_bottom_rows()
-
         return
 
 
     def delete_bar_list(self):
 
-        self.bar_list = []
+        self.bar_index.clear()
         self.num_bars = 0
-        self.determine_top_bottom_rows()
-        self.determine_left_right_cols()
 
         return
 
@@ -263,76 +342,99 @@ class StaveGroup:
         return
 
 
-    def determine_top_bottom_rows(self):
+    @property
+    def stave_list(self):
+        return self.stave_index.item_list
+
+
+    @property
+    def bar_list(self):
+        return self.bar_index.item_list
 
+
+    def get_annotation_store_version(self):
+        return self.annotation_store, self.annotation_store.version
+
+
+    @property
+    def top_lim_row(self):
         if self.num_staves > 0:
-            self.top_lim_row = self.stave_list[0].top_lim_row
-            self.bottom_lim_row = self.stave_list[-1].bottom_lim_row
-        else:
-            self.top_lim_row = None
-            self.bottom_lim_row = None
+            return self.stave_list[0].top_lim_row
+        return None
 
-        return
+
+    @property
+    def bottom_lim_row(self):
+        if self.num_staves > 0:
+            return self.stave_list[-1].bottom_lim_row
+        return None
 
 
-    def determine_left_right_cols(self):
+    @property
+    def left_lim_col(self):
 
         # If bars are available, use them
         if self.num_bars > 0:
-            self.left_lim_col = self.bar_list[0].outer_left_col
-            self.right_lim_col = self.bar_list[-1].outer_right_col
+            return self.bar_list[0].outer_left_col
 
         # Else, if staves are available, use them
         elif self.num_staves > 0:
-            self.left_lim_col = self.stave_list[0].left_lim_col
-            self.right_lim_col = self.stave_list[-1].right_lim_col
+            return self.stave_list[0].left_lim_col
 
         # Else, use the defaults
-        else:
-            self.left_lim_col = None
-            self.right_lim_col = None
+        return None
 
-        return
+
+    @property
+    def right_lim_col(self):
+
+        if self.num_bars > 0:
+            return self.bar_list[-1].outer_right_col
+
+        elif self.num_staves > 0:
+            return self.stave_list[-1].right_lim_col
+
+        return None
 
 
     def assign_parent_page(self, page):
+
         self.parent_page = page
+        if page is not None:
+            self.move_to_store(page.annotation_store)
+
         return
 
 
-    def add_stave(self, new_stave):
+    def move_to_store(self, annotation_store):
 
-        if self.num_staves == 0:
-            insert_pos = 0
+        if annotation_store is self.annotation_store:
+            return
 
-        else:
-            existing_stave_top_rows = [ex_stave.top_lim_row for ex_stave in self.stave_list]
-            existing_stave_bottom_rows = [ex_stave.bottom_lim_row for ex_stave in self.stave_list]
-
-            new_stave_top_row = new_stave.top_lim_row
-            new_stave_bottom_row = new_stave.bottom_lim_row
-
-            # Check that the new stave does not overlap with existing staves!
-            for ex_top, ex_bottom in zip(existing_stave_top_rows, existing_stave_bottom_rows):
-                if ((ex_top <= new_stave_top_row <= ex_bottom) or
-                    (ex_top <= new_stave_bottom_row <= ex_bottom)):
-                    raise Exception("New stave ({}, {}) overlaps existing stave ({}, {})!".format(
-                        new_stave_top_row, new_stave_bottom_row,
-                        ex_top, ex_bottom
-                    ))
-
-            insert_pos = 0
-            for ex_top in existing_stave_top_rows:
-                if new_stave_top_row < ex_top:
-                    break
-                else:
-                    insert_pos += 1
+        self.annotation_store = annotation_store
+        for stave in self.stave_list:
+            stave.move_to_store(annotation_store)
+        for bar in self.bar_list:
+            bar.move_to_store(annotation_store)
+
+        return
+
+
+    def add_stave(self, new_stave):
+
+        new_stave_top_row = new_stave.top_lim_row
+        new_stave_bottom_row = new_stave.bottom_lim_row
 
+        # Check that the new stave does not overlap with existing staves!
+        ex_stave = self.stave_index.find_overlapping(new_stave_top_row, new_stave_bottom_row)
+        if ex_stave is not None:
+            raise Exception("New stave ({}, {}) overlaps existing stave ({}, {})!".format(
+                new_stave_top_row, new_stave_bottom_row,
+                ex_stave.top_lim_row, ex_stave.bottom_lim_row
+            ))
 
-        self.stave_list.insert(insert_pos, new_stave)
         new_stave.assign_parent_group(self)
-        self.determine_left_right_cols()
-        self.determine_top_bottom_rows()
+        self.stave_index.insert(new_stave)
         self.num_staves += 1
 
         return
@@ -340,42 +442,34 @@ class StaveGroup:
 
     def add_bar(self, new_bar):
 
-        if self.num_bars == 0:
-            insert_pos = 0
-
-        else:
-            existing_bar_inner_left_cols = [ex_bar.inner_left_col for ex_bar in self.bar_list]
-            existing_bar_inner_right_cols = [ex_bar.inner_right_col for ex_bar in self.bar_list]
-
-            new_bar_inner_left_col = new_bar.inner_left_col
-            new_bar_inner_right_col = new_bar.inner_right_col
-
-            # Check that the new bar does not overlap with existing bar!
-            for ex_inner_left, ex_inner_right in zip(existing_bar_inner_left_cols, existing_bar_inner_right_cols):
-                if ((ex_inner_left <= new_bar_inner_left_col <= ex_inner_right) or
-                    (ex_inner_left <= new_bar_inner_right_col <= ex_inner_right)):
-                    raise Exception("New bar ({}, {}) overlaps existing bar ({}, {})!".format(
-                        new_bar_inner_left_col, new_bar_inner_right_col,
-                        ex_inner_left, ex_inner_right
-                    ))
-
-            insert_pos = 0
-            for ex_inner_left in existing_bar_inner_left_cols:
-                if new_bar_inner_left_col < ex_inner_left:
-                    break
-                else:
-                    insert_pos += 1
+        new_bar_inner_left_col = new_bar.inner_left_col
+        new_bar_inner_right_col = new_bar.inner_right_col
 
+        # Check that the new bar does not overlap with existing bar!
+        ex_bar = self.bar_index.find_overlapping(new_bar_inner_left_col, new_bar_inner_right_col)
+        if ex_bar is not None:
+            raise Exception("New bar ({}, {}) overlaps existing bar ({}, {})!".format(
+                new_bar_inner_left_col, new_bar_inner_right_col,
+                ex_bar.inner_left_col, ex_bar.inner_right_col
+            ))
 
-        self.bar_list.insert(insert_pos, new_bar)
         new_bar.assign_parent_sg(self)
-        self.determine_left_right_cols()
-        self.determine_top_bottom_rows()
+        self.bar_index.insert(new_bar)
         self.num_bars += 1
 
         return
 
 
+    def find_stave_at_row(self, row):
+        return self.stave_index.find_at(row)
+
+
+    def find_bar_at_col(self, col):
+
+        # The bar whose inner cols contain `col`, if any
+        return self.bar_index.find_at(col)
+
+
     def adjust_lims_for_new_page_width(self, target_page_width):
 
         for stave in self.stave_list:
@@ -384,13 +478,24 @@ class StaveGroup:
         for bar in self.bar_list:
             bar.adjust_lims_for_new_page_width(target_page_width)
 
-        self.determine_left_right_cols()
         return
 
 
 
+def get_stave_row_lims(stave):
+    return stave.top_lim_row, stave.bottom_lim_row
+
+
+def get_bar_inner_col_lims(bar):
+    return bar.inner_left_col, bar.inner_right_col
+
+
+
 class VizStaveGroup:
 
+    __slots__ = ("orig_sg", "offset_top_row", "offset_bottom_row",
+                 "top_row", "bottom_row", "viz_bar_list")
+
     def __init__(self,
                  orig_sg,
                  offset_top_row,
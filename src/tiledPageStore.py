@@ -0,0 +1,279 @@
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from pdf_to_image import fix_page_image_width
+
+
+DEFAULT_TILE_HEIGHT = 512
+DEFAULT_MAX_TILES_IN_MEMORY = 16
+
+
+class TiledPageStore:
+
+    # --------------------------------------------------------------------------
+    # A very tall image (e.g. the combined page of a long score), stored on
+    # disk as fixed-height row tiles ("tile_<index>.npy"), with only the most
+    # recently used tiles kept in memory.
+    #
+    # It can be sliced like the equivalent ndarray; the first index selects
+    # rows, and only the tiles overlapping those rows are loaded:
+    #     store[tr: br+1, lc: rc+1]          -> ndarray (a copy, not a view)
+    #     store[tr: br+1, lc: rc+1] = value  -> written into the tiles
+    #
+    # Tiles that were never written are all zeros, and are not stored on disk.
+    # Modified tiles are written back when they are evicted, or on `flush()`.
+    # --------------------------------------------------------------------------
+
+    def __init__(self,
+                 store_dir,
+                 shape,
+                 dtype="uint8",
+                 tile_height=DEFAULT_TILE_HEIGHT,
+                 max_tiles_in_memory=DEFAULT_MAX_TILES_IN_MEMORY):
+
+        self.store_dir = store_dir
+        self.shape = tuple(int(d) for d in shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = len(self.shape)
+
+        self.tile_height = tile_height
+        self.max_tiles_in_memory = max(1, max_tiles_in_memory)
+        self.num_tiles = -(-self.shape[0] // self.tile_height)
+
+        self.tile_cache = OrderedDict()
+        self.dirty_tile_set = set()
+
+        os.makedirs(self.store_dir, exist_ok=True)
+
+        return
+
+
+    @classmethod
+    def from_array(cls, image, store_dir,
+                   tile_height=DEFAULT_TILE_HEIGHT,
+                   max_tiles_in_memory=DEFAULT_MAX_TILES_IN_MEMORY):
+
+        store_obj = cls(store_dir, image.shape, image.dtype,
+                        tile_height=tile_height,
+                        max_tiles_in_memory=max_tiles_in_memory)
+
+        for tile_idx in range(store_obj.num_tiles):
+            tile_top_row, tile_bottom_row = store_obj.get_tile_row_lims(tile_idx)
+            np.save(store_obj.get_tile_filepath(tile_idx),
+                    np.ascontiguousarray(image[tile_top_row: tile_bottom_row]))
+
+        return store_obj
+
+
+    @classmethod
+    def from_page_images(cls, page_image_iter, output_page_width_px, store_dir,
+                         tile_height=DEFAULT_TILE_HEIGHT,
+                         max_tiles_in_memory=DEFAULT_MAX_TILES_IN_MEMORY):
+
+        # ----------------------------------------------------------------------
+        # Stack the pages vertically, like `concatenate_page_images`, but
+        # write the rows out tile by tile as they come in; so at most one
+        # page and one tile are ever in memory
+        # ----------------------------------------------------------------------
+        pending_row_list = []
+        num_pending_rows = 0
+        num_written_tiles = 0
+        total_height = 0
+        tile_shape = None
+        tile_dtype = None
+
+        def write_tile(tile):
+            np.save(os.path.join(store_dir, "tile_{:06d}.npy".format(num_written_tiles)),
+                    tile)
+            return num_written_tiles + 1
+
+        os.makedirs(store_dir, exist_ok=True)
+
+        for raw_image in page_image_iter:
+            page_image = fix_page_image_width(raw_image, output_page_width_px)
+            tile_shape = page_image.shape[1:]
+            tile_dtype = page_image.dtype
+            total_height += page_image.shape[0]
+
+            pending_row_list.append(page_image)
+            num_pending_rows += page_image.shape[0]
+
+            while num_pending_rows >= tile_height:
+                pending_rows = np.concatenate(pending_row_list, axis=0)
+                num_written_tiles = write_tile(pending_rows[:tile_height])
+                pending_row_list = [pending_rows[tile_height:]]
+                num_pending_rows -= tile_height
+
+        if num_pending_rows > 0:
+            num_written_tiles = write_tile(np.concatenate(pending_row_list, axis=0))
+
+        if tile_shape is None:
+            raise Exception("No page images given")
+
+        return cls(store_dir, (total_height,) + tile_shape, tile_dtype,
+                   tile_height=tile_height,
+                   max_tiles_in_memory=max_tiles_in_memory)
+
+
+    def __len__(self):
+        return self.shape[0]
+
+
+    def get_tile_filepath(self, tile_idx):
+        return os.path.join(self.store_dir, "tile_{:06d}.npy".format(tile_idx))
+
+
+    def get_tile_row_lims(self, tile_idx):
+
+        tile_top_row = tile_idx * self.tile_height
+        tile_bottom_row = min(tile_top_row + self.tile_height, self.shape[0])
+
+        return tile_top_row, tile_bottom_row
+
+
+    def get_tile(self, tile_idx):
+
+        # Most recently used tiles are at the end of the ordered dict
+        if tile_idx in self.tile_cache:
+            self.tile_cache.move_to_end(tile_idx)
+            return self.tile_cache[tile_idx]
+
+        tile_fp = self.get_tile_filepath(tile_idx)
+        if os.path.exists(tile_fp):
+            tile = np.load(tile_fp)
+        else:
+            tile_top_row, tile_bottom_row = self.get_tile_row_lims(tile_idx)
+            tile = np.zeros((tile_bottom_row - tile_top_row,) + self.shape[1:],
+                            dtype=self.dtype)
+
+        self.tile_cache[tile_idx] = tile
+
+        while len(self.tile_cache) > self.max_tiles_in_memory:
+            evicted_tile_idx, evicted_tile = self.tile_cache.popitem(last=False)
+            if evicted_tile_idx in self.dirty_tile_set:
+                np.save(self.get_tile_filepath(evicted_tile_idx), evicted_tile)
+                self.dirty_tile_set.discard(evicted_tile_idx)
+
+        return tile
+
+
+    def flush(self):
+
+        for tile_idx in sorted(self.dirty_tile_set):
+            np.save(self.get_tile_filepath(tile_idx), self.tile_cache[tile_idx])
+        self.dirty_tile_set = set()
+
+        return
+
+
+    def split_key(self, key):
+
+        # Separate the row index from the rest of the index
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        row_key = key[0] if len(key) > 0 else slice(None)
+        rest_key = key[1:]
+
+        if isinstance(row_key, (int, np.integer)):
+            row = int(row_key)
+            if row < 0:
+                row += self.shape[0]
+            if not (0 <= row < self.shape[0]):
+                raise IndexError("Row {} out of range for {} rows".format(row_key, self.shape[0]))
+            return row, row + 1, 1, True, rest_key
+
+        if isinstance(row_key, slice):
+            start, stop, step = row_key.indices(self.shape[0])
+            if step < 0:
+                raise IndexError("Negative row steps are not supported")
+            return start, max(start, stop), step, False, rest_key
+
+        raise IndexError("Rows can only be indexed with an int or a slice")
+
+
+    def iter_tile_parts(self, start_row, stop_row):
+
+        # Yield (tile_idx, rows in the tile, rows in the requested range)
+        # for every tile overlapping [start_row, stop_row)
+        for tile_idx in range(start_row // self.tile_height,
+                              -(-stop_row // self.tile_height)):
+            tile_top_row, tile_bottom_row = self.get_tile_row_lims(tile_idx)
+            part_top_row = max(start_row, tile_top_row)
+            part_bottom_row = min(stop_row, tile_bottom_row)
+
+            yield (tile_idx,
+                   slice(part_top_row - tile_top_row, part_bottom_row - tile_top_row),
+                   slice(part_top_row - start_row, part_bottom_row - start_row))
+
+        return
+
+
+    def __getitem__(self, key):
+
+        start_row, stop_row, step, is_single_row, rest_key = self.split_key(key)
+
+        part_list = [self.get_tile(tile_idx)[tile_rows]
+                     for (tile_idx, tile_rows, _) in self.iter_tile_parts(start_row, stop_row)]
+
+        if len(part_list) == 0:
+            rows = np.zeros((0,) + self.shape[1:], dtype=self.dtype)
+        elif len(part_list) == 1:
+            rows = part_list[0].copy()
+        else:
+            rows = np.concatenate(part_list, axis=0)
+
+        rows = rows[::step]
+        if is_single_row:
+            return rows[0][rest_key]
+
+        return rows[(slice(None),) + rest_key]
+
+
+    def __setitem__(self, key, value):
+
+        start_row, stop_row, step, is_single_row, rest_key = self.split_key(key)
+        if step != 1:
+            raise IndexError("Row steps are not supported when writing")
+
+        # Broadcast the value to the full shape of the target region; a zero
+        # strided dummy gives that shape without allocating anything
+        dummy = np.broadcast_to(np.zeros((), dtype=bool),
+                                (stop_row - start_row,) + self.shape[1:])
+        if is_single_row:
+            target_shape = dummy[0][rest_key].shape
+            value = np.broadcast_to(value, target_shape)[np.newaxis]
+        else:
+            target_shape = dummy[(slice(None),) + rest_key].shape
+            value = np.broadcast_to(value, target_shape)
+
+        for tile_idx, tile_rows, value_rows in self.iter_tile_parts(start_row, stop_row):
+            tile = self.get_tile(tile_idx)
+            tile[(tile_rows,) + rest_key] = value[value_rows]
+            self.dirty_tile_set.add(tile_idx)
+
+        return
+
+
+    def copy_to(self, store_dir):
+
+        # Make a copy of the store (the in-memory changes included) in a new
+        # folder; tiles that were never written stay implicit
+        self.flush()
+
+        new_store_obj = TiledPageStore(store_dir, self.shape, self.dtype,
+                                       tile_height=self.tile_height,
+                                       max_tiles_in_memory=self.max_tiles_in_memory)
+
+        for tile_idx in range(self.num_tiles):
+            tile_fp = self.get_tile_filepath(tile_idx)
+            if os.path.exists(tile_fp):
+                np.save(new_store_obj.get_tile_filepath(tile_idx), np.load(tile_fp))
+
+        return new_store_obj
+
+
+    def to_array(self):
+        return self[:]
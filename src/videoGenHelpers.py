@@ -1,4 +1,6 @@
+import os
 import json
+import tempfile
 
 import numpy as np
 import scipy.interpolate as spinterp
@@ -6,6 +8,7 @@ import skimage.color as skcolor
 
 from staveUtils import VizStaveGroup
 from barUtils import VizBar
+from tiledPageStore import TiledPageStore
 
 
 class CurrPagePosition:
@@ -34,7 +37,8 @@ class FullSizeImageIterator:
     def __init__(self,
                  full_page_image,
                  viz_bar_list,
-                 start_frame, end_frame):
+                 start_frame, end_frame,
+                 tiled_work_dir=None):
 
         self.viz_bar_list = viz_bar_list
         self.num_bars = len(self.viz_bar_list)
@@ -45,6 +49,46 @@ class FullSizeImageIterator:
         self.curr_valid_bar_indices = []
         self.update_curr_valid_bar_indices(self.start_frame, search_all=True)
 
+        self.temp_work_dir_obj = None
+
+        # ----------------------------------------------------------------------
+        # If the page is a `TiledPageStore`, all the full-size images are
+        # tiled stores as well, and only the rows of the bars being drawn are
+        # ever loaded. The overlay images start out as (implicit) zero tiles,
+        # and the "black portions" are computed per bar, when it is first
+        # drawn, instead of for the whole page; and only kept while the bar
+        # is being drawn.
+        # Without a `tiled_work_dir`, the stores go in a temporary folder that
+        # belongs to the iterator, and is deleted by `close()` (or on leaving
+        # a `with` block)
+        # ----------------------------------------------------------------------
+        self.is_tiled = isinstance(full_page_image, TiledPageStore)
+
+        if self.is_tiled:
+            if tiled_work_dir is None:
+                self.temp_work_dir_obj = tempfile.TemporaryDirectory(prefix="full_size_image_iterator_")
+                tiled_work_dir = self.temp_work_dir_obj.name
+
+            self.full_background_image = full_page_image
+            self.black_portions_bool_image = None
+            self.bar_black_portions_dict = {}
+
+            page_height = full_page_image.shape[0]
+            page_width = full_page_image.shape[1]
+            tile_height = full_page_image.tile_height
+
+            self.full_overlay_color_image = TiledPageStore(os.path.join(tiled_work_dir, "overlay_color"),
+                                                           full_page_image.shape, "uint8",
+                                                           tile_height=tile_height)
+            self.full_overlay_opacity_image = TiledPageStore(os.path.join(tiled_work_dir, "overlay_opacity"),
+                                                             (page_height, page_width, 1), "float",
+                                                             tile_height=tile_height)
+
+            # With zero opacity everywhere, the output is the background itself
+            self.full_output_image = full_page_image.copy_to(os.path.join(tiled_work_dir, "output"))
+
+            return
+
         self.full_background_image = full_page_image.copy()
 
         self.black_portions_bool_image = (skcolor.rgb2gray(self.full_background_image) * 255) < 32
@@ -62,6 +106,38 @@ class FullSizeImageIterator:
         return
 
 
+    def close(self):
+
+        # The tiled images are not usable after this
+        if self.temp_work_dir_obj is not None:
+            self.temp_work_dir_obj.cleanup()
+            self.temp_work_dir_obj = None
+
+        return
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def get_bar_black_portions(self, b_idx, corresponding_bg_image):
+
+        if not self.is_tiled:
+            b = self.viz_bar_list[b_idx]
+            return self.black_portions_bool_image[b.bar_top_row: b.bar_bottom_row+1,
+                                                  b.bar_left_col: b.bar_right_col+1]
+
+        if b_idx not in self.bar_black_portions_dict:
+            self.bar_black_portions_dict[b_idx] = (skcolor.rgb2gray(corresponding_bg_image) * 255) < 32
+
+        return self.bar_black_portions_dict[b_idx]
+
+
     def update_curr_valid_bar_indices(self, frame_index,
                                       search_all=False):
 
@@ -97,6 +173,12 @@ class FullSizeImageIterator:
 
     def update_images(self, frame_index):
 
+        # Forget the black portions of the bars that are done being drawn
+        if self.is_tiled:
+            for b_idx in list(self.bar_black_portions_dict.keys()):
+                if b_idx not in self.curr_valid_bar_indices:
+                    del self.bar_black_portions_dict[b_idx]
+
         for b_idx in self.curr_valid_bar_indices:
             b = self.viz_bar_list[b_idx]
 
@@ -108,8 +190,8 @@ class FullSizeImageIterator:
             corresponding_bg_image = self.full_background_image[tr: br+1,
                                                                 lc: rc+1]
 
-            corresponding_black_portions_bool_image = self.black_portions_bool_image[tr: br+1,
-                                                                                     lc: rc+1]
+            corresponding_black_portions_bool_image = self.get_bar_black_portions(b_idx,
+                                                                                  corresponding_bg_image)
 
             bar_color_image, bar_opacity_image = b.get_bar_image_at_frame(frame_index)
 
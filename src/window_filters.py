@@ -1,15 +1,25 @@
 import time
 
 import numpy as np
-import scipy.interpolate as spinterp
 import skimage.draw as skdraw
 
-from hsluv import rgb_to_hsluv, hsluv_to_rgb
+from hsluvUtils import rgb_array_to_hsluv_array, hsluv_array_to_rgb_array
 
 
 
 class BaseFilter:
 
+    # --------------------------------------------------------------------------
+    # The parameters of a filter at each frame only depend on the frame; so
+    # they are computed up front for every frame the parent bar is drawn in
+    # ([actual_start_frame, actual_end_frame]), as one array per parameter
+    # (`compute_timeline`), and `apply_filter` just looks them up.
+    # The first array of every timeline says whether the filter does anything
+    # at that frame; inactive frames are skipped altogether.
+    # The bar's frame range grows as filters are added to it, so the
+    # timeline is compiled on first use, and again if the range changed
+    # --------------------------------------------------------------------------
+
     def __init__(self,
                  parent_viz_bar,
                  relative_beat_str_list):
@@ -22,6 +32,11 @@ class BaseFilter:
 
         self.frame_anchor_list = sorted([self.frame_from_relative_beat_string(b_str)
                                          for b_str in self.relative_beat_str_list])
+        self.frame_anchor_arr = np.array(self.frame_anchor_list, dtype="int64")
+
+        self.timeline_start_frame = None
+        self.timeline_end_frame = None
+        self.timeline = None
 
         return
 
@@ -38,6 +53,65 @@ class BaseFilter:
         return absolute_frame
 
 
+    def interp_previous(self, frame_arr, value_list, fill_value_before):
+
+        # Value of the last anchor at or before each frame (the same as
+        # `interp1d(..., kind="previous")`); `fill_value_before` before the
+        # first anchor, and the last value after the last one
+        value_arr = np.asarray(value_list)
+        anchor_idx_arr = np.searchsorted(self.frame_anchor_arr, frame_arr, side="right") - 1
+
+        return np.where(anchor_idx_arr >= 0,
+                        value_arr[np.maximum(anchor_idx_arr, 0)],
+                        fill_value_before)
+
+
+    def interp_linear(self, frame_arr, value_list):
+
+        # Linear interpolation between the anchors; the first/last value
+        # before/after them
+        return np.interp(frame_arr, self.frame_anchor_arr, np.asarray(value_list, dtype="float"))
+
+
+    def compute_timeline(self, frame_arr):
+        # NOTE:
+        # Since this is the base class, this function does nothing; it just
+        # serves as a placeholder for the function definition. In practice,
+        # it should be overridden by the actual child class, and return a
+        # tuple of (is_active_arr, <one array per parameter>...)
+        return (np.zeros(len(frame_arr), dtype="bool"),)
+
+
+    def compile_timeline(self):
+
+        self.timeline_start_frame = self.parent_viz_bar.actual_start_frame
+        self.timeline_end_frame = self.parent_viz_bar.actual_end_frame
+
+        frame_arr = np.arange(self.timeline_start_frame, self.timeline_end_frame + 1)
+        self.timeline = self.compute_timeline(frame_arr)
+
+        return
+
+
+    def get_timeline_values(self, frame_number):
+
+        if ((self.timeline_start_frame != self.parent_viz_bar.actual_start_frame) or
+            (self.timeline_end_frame != self.parent_viz_bar.actual_end_frame)):
+            self.compile_timeline()
+
+        # Frames outside of the bar's range are not compiled; they are just
+        # computed on their own
+        if (frame_number < self.timeline_start_frame) or (frame_number > self.timeline_end_frame):
+            return tuple(arr[0] for arr in self.compute_timeline(np.array([frame_number])))
+
+        frame_idx = frame_number - self.timeline_start_frame
+        return tuple(arr[frame_idx] for arr in self.timeline)
+
+
+    def is_active_at_frame(self, frame_number):
+        return bool(self.get_timeline_values(frame_number)[0])
+
+
     def apply_filter(self, color_image, opacity_image, frame_number):
         # NOTE:
         # Since this is the base class, this function does nothing; it just
@@ -63,7 +137,6 @@ class FilterOpacityRoundedRectangle(BaseFilter):
 
 
         self.mask = self.configure_mask()
-        self.is_filter_active_func = self.configure_filter_valid_func()
 
         return
 
@@ -94,8 +167,10 @@ class FilterOpacityRoundedRectangle(BaseFilter):
         return mask
 
 
-    def configure_filter_valid_func(self):
+    def compute_timeline(self, frame_arr):
 
+        # The filter is switched on at every even anchor, and off at every
+        # odd one
         bool_array = []
         for idx in range(len(self.frame_anchor_list)):
             if (idx % 2) == 0:
@@ -103,17 +178,15 @@ class FilterOpacityRoundedRectangle(BaseFilter):
             else:
                 bool_array.append(False)
 
-        func = spinterp.interp1d(self.frame_anchor_list, bool_array,
-                                 kind="previous",
-                                 bounds_error=False,
-                                 fill_value=(False, bool_array[-1]))
+        is_active_arr = self.interp_previous(frame_arr, bool_array, False).astype("bool")
 
-        return func
+        return (is_active_arr,)
 
 
     def apply_filter(self, color_image, opacity_image, frame_number):
 
-        if bool(self.is_filter_active_func(frame_number)):
+        is_active, = self.get_timeline_values(frame_number)
+        if is_active:
             opacity_image[self.mask] = 0.0
 
         return
@@ -137,14 +210,7 @@ class FilterSmoothColorAndOpacity(BaseFilter):
 
         self.rgb_array_list, self.hsluv_array_list = self.convert_hex_color_strings_to_rgb_and_hsluv_arrays(color_hex_str_list)
 
-        (self.color_h_interp_func,
-         self.color_s_interp_func,
-         self.color_l_interp_func) = self.configure_color_interp_func()
-
-
-
         self.opacity_list = opacity_list
-        self.opacity_interp_func = self.configure_opacity_interp_func()
 
         return
 
@@ -153,7 +219,6 @@ class FilterSmoothColorAndOpacity(BaseFilter):
     def convert_hex_color_strings_to_rgb_and_hsluv_arrays(color_hex_str_list):
 
         rgb_array_list = []
-        hsluv_array_list = []
 
         for hex_color_str in color_hex_str_list:
 
@@ -167,59 +232,38 @@ class FilterSmoothColorAndOpacity(BaseFilter):
             rgb_array = np.array([r, g, b], dtype="uint8").reshape((1, 1, 3))
             rgb_array_list.append(rgb_array)
 
-            hsluv_tuple = rgb_to_hsluv((r/255.0, g/255.0, b/255.0))
-            hsluv_array = np.array([hsluv_tuple[0], hsluv_tuple[1], hsluv_tuple[2]], dtype="float").reshape((1, 1, 3))
-            hsluv_array_list.append(hsluv_array)
-
+        # All the colors are converted at once
+        all_hsluv_array = rgb_array_to_hsluv_array(np.array(rgb_array_list, dtype="float").reshape((-1, 3)) / 255.0)
+        hsluv_array_list = [hsluv_array.reshape((1, 1, 3)) for hsluv_array in all_hsluv_array]
 
         return rgb_array_list, hsluv_array_list
 
 
-    def configure_color_interp_func(self):
-
-        h_func = spinterp.interp1d(self.frame_anchor_list, [c[0, 0, 0] for c in self.hsluv_array_list],
-                                   kind="linear",
-                                   bounds_error=False,
-                                   fill_value=(self.hsluv_array_list[0][0, 0, 0], self.hsluv_array_list[-1][0, 0, 0]))
-
-        s_func = spinterp.interp1d(self.frame_anchor_list, [c[0, 0, 1] for c in self.hsluv_array_list],
-                                   kind="linear",
-                                   bounds_error=False,
-                                   fill_value=(self.hsluv_array_list[0][0, 0, 1], self.hsluv_array_list[-1][0, 0, 1]))
+    def compute_timeline(self, frame_arr):
 
-        l_func = spinterp.interp1d(self.frame_anchor_list, [c[0, 0, 2] for c in self.hsluv_array_list],
-                                   kind="linear",
-                                   bounds_error=False,
-                                   fill_value=(self.hsluv_array_list[0][0, 0, 2], self.hsluv_array_list[-1][0, 0, 2]))
+        # The color is interpolated in HSLuv, and the colors of all the
+        # frames are converted to RGB at once
+        curr_h_arr = self.interp_linear(frame_arr, [c[0, 0, 0] for c in self.hsluv_array_list])
+        curr_s_arr = self.interp_linear(frame_arr, [c[0, 0, 1] for c in self.hsluv_array_list])
+        curr_l_arr = self.interp_linear(frame_arr, [c[0, 0, 2] for c in self.hsluv_array_list])
 
-        return h_func, s_func, l_func
+        curr_rgb_arr = hsluv_array_to_rgb_array(np.stack([curr_h_arr, curr_s_arr, curr_l_arr], axis=-1))
+        curr_rgb_arr = np.clip(curr_rgb_arr * 255, 0, 255).astype("uint8")
 
+        curr_opacity_arr = self.interp_linear(frame_arr, self.opacity_list)
 
-    def configure_opacity_interp_func(self):
+        # It sets the whole bar, at every frame
+        is_active_arr = np.ones(len(frame_arr), dtype="bool")
 
-        func = spinterp.interp1d(self.frame_anchor_list, self.opacity_list,
-                                 kind="linear",
-                                 bounds_error=False,
-                                 fill_value=(self.opacity_list[0], self.opacity_list[-1]))
-
-        return func
+        return is_active_arr, curr_rgb_arr, curr_opacity_arr
 
 
     def apply_filter(self, color_image, opacity_image, frame_number):
 
-        curr_opacity = self.opacity_interp_func(frame_number)
-
-        curr_h = self.color_h_interp_func(frame_number)
-        curr_s = self.color_s_interp_func(frame_number)
-        curr_l = self.color_l_interp_func(frame_number)
-
-        curr_rgb_tuple = hsluv_to_rgb((curr_h, curr_s, curr_l))
-        curr_rgb_array = np.clip(np.array([curr_rgb_tuple[0], curr_rgb_tuple[1], curr_rgb_tuple[2]]) * 255, 0, 255).astype("uint8").reshape((1, 1, 3))
+        _, curr_rgb, curr_opacity = self.get_timeline_values(frame_number)
 
         opacity_image[:, :] = curr_opacity
-        color_image[:, :, 0] = curr_rgb_array[0, 0, 0]
-        color_image[:, :, 1] = curr_rgb_array[0, 0, 1]
-        color_image[:, :, 2] = curr_rgb_array[0, 0, 2]
+        color_image[:, :, :] = curr_rgb
 
         return
 
@@ -250,24 +294,21 @@ class FilterRandomOpacityHoles(BaseFilter):
         else:
             self.random_seed = random_seed
 
-        self.hole_index_func = self.configure_hole_index_func()
         self.hole_mask_list = self.configure_hole_mask_list()
 
-
-
         return
 
 
-    def configure_hole_index_func(self):
+    def compute_timeline(self, frame_arr):
 
+        # Hole `i` is there from anchor `i` to anchor `i+1`; there is none
+        # before the first anchor, or after the last one
         hole_index_list = list(range(self.num_holes + 1))
+        hole_index_arr = self.interp_previous(frame_arr, hole_index_list, -1)
 
-        index_func = spinterp.interp1d(self.frame_anchor_list, hole_index_list,
-                                       kind="previous",
-                                       bounds_error=False,
-                                       fill_value=(-1, self.num_holes))
+        is_active_arr = np.logical_and(hole_index_arr >= 0, hole_index_arr < self.num_holes)
 
-        return index_func
+        return is_active_arr, hole_index_arr
 
 
     def configure_hole_mask_list(self):
@@ -293,11 +334,8 @@ class FilterRandomOpacityHoles(BaseFilter):
 
     def apply_filter(self, color_image, opacity_image, frame_number):
 
-        curr_hole_index = int(np.floor(self.hole_index_func(frame_number)))
-
-        if curr_hole_index < 0:
-            return
-        if curr_hole_index >= self.num_holes:
+        is_active, curr_hole_index = self.get_timeline_values(frame_number)
+        if not is_active:
             return
 
         curr_hole_opacity_mult = self.opacity_list[curr_hole_index]
@@ -0,0 +1,138 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import skimage.draw as skdraw
+
+# The modules import each other by their plain names (as when run from src/)
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "src"))
+sys.path.insert(0, os.path.join(REPO_DIR, "src", "selectorGUI"))
+
+import matplotlib
+matplotlib.use("Agg")
+
+
+def make_score_page_image(page_height=600, page_width=800, num_staves=4, seed=0):
+
+    # A white page with `num_staves` 5 line staves, bar lines across each
+    # stave, and some random "notes" in between
+    rng = np.random.default_rng(seed)
+    page_image = np.full((page_height, page_width, 3), 255, dtype="uint8")
+
+    row = 40
+    for _ in range(num_staves):
+        top_row = row
+        for _ in range(5):
+            page_image[row: row + 2, 30: page_width - 30] = 0
+            row += 12
+        bottom_row = row - 11
+
+        for col in (30, 200, 420, 610, page_width - 32):
+            page_image[top_row: bottom_row + 1, col: col + 2] = 0
+
+        for _ in range(20):
+            note_row = rng.integers(top_row, bottom_row)
+            note_col = rng.integers(40, page_width - 40)
+            page_image[note_row: note_row + 5, note_col: note_col + 6] = 0
+
+        row += 60
+
+    return page_image
+
+
+@pytest.fixture
+def score_page_image():
+    return make_score_page_image()
+
+
+def make_cluttered_score_page_image(page_height=1400, page_width=1000, skew=0.0, seed=0):
+
+    # --------------------------------------------------------------------------
+    # A page closer to a real score: a title, staves with slightly broken
+    # (and optionally skewed) lines, notes with stems, ledger lines, beams,
+    # hairpins, slurs, lyrics, and speckle noise
+    # --------------------------------------------------------------------------
+    rng = np.random.default_rng(seed)
+    ink = np.zeros((page_height, page_width), dtype="bool")
+
+    def draw_line(start_row, start_col, end_col, thickness, slope=0.0):
+        cols = np.arange(max(start_col, 0), min(end_col, page_width))
+        rows = np.round(start_row + slope * (cols - start_col)).astype("int")
+        for t in range(thickness):
+            is_inside = np.logical_and(rows + t >= 0, rows + t < page_height)
+            ink[rows[is_inside] + t, cols[is_inside]] = True
+
+    def draw_blob(row, col, row_radius, col_radius):
+        rr, cc = skdraw.ellipse(row, col, row_radius, col_radius, shape=ink.shape)
+        ink[rr, cc] = True
+
+    for _ in range(rng.integers(20, 60)):
+        draw_blob(rng.integers(10, 90), rng.integers(100, page_width - 100),
+                  rng.integers(5, 14), rng.integers(3, 9))
+
+    spacing = int(rng.integers(9, 16))
+    thickness = int(rng.integers(1, 4))
+    left_col = int(rng.integers(40, 90))
+    right_col = page_width - int(rng.integers(30, 80))
+
+    row = 130
+    while row + (4 * spacing) + 80 < page_height:
+        top_row = row
+        for line_idx in range(5):
+            line_row = row + (line_idx * spacing)
+            draw_line(line_row, left_col, right_col, thickness, skew)
+            for _ in range(rng.integers(0, 3)):
+                gap_col = rng.integers(left_col, right_col - 10)
+                ink[line_row: line_row + thickness + 1, gap_col: gap_col + rng.integers(2, 8)] = False
+        bottom_row = row + (4 * spacing) + thickness
+
+        bar_cols = rng.choice(np.arange(left_col + 60, right_col), rng.integers(2, 6), replace=False)
+        for col in list(bar_cols) + [left_col, right_col - 2]:
+            ink[top_row: bottom_row, col: col + 2] = True
+        draw_blob(top_row + (2 * spacing), left_col + 20, 3 * spacing, (spacing // 2) + 2)
+
+        for _ in range(rng.integers(20, 60)):
+            col = int(rng.integers(left_col + 50, right_col - 20))
+            note_row = int(top_row + rng.integers(-3, 8) * spacing / 2)
+            draw_blob(note_row, col, spacing // 2, (spacing // 2) + 2)
+
+            stem_col = col + (spacing // 2)
+            if rng.random() < 0.5:
+                stem_rows = (note_row - int(3.5 * spacing), note_row)
+            else:
+                stem_rows = (note_row, note_row + int(3.5 * spacing))
+            ink[max(stem_rows[0], 0): stem_rows[1], stem_col: stem_col + 1] = True
+
+            if (note_row < top_row - (spacing // 2)) or (note_row > bottom_row + (spacing // 2)):
+                draw_line(note_row, col - spacing, col + spacing, thickness)
+            if rng.random() < 0.3:
+                draw_line(stem_rows[0], col, col + int(rng.integers(30, 160)), spacing // 2,
+                          rng.uniform(-0.15, 0.15))
+
+        for _ in range(rng.integers(0, 3)):
+            start_col = int(rng.integers(left_col, right_col - 320))
+            end_col = start_col + int(rng.integers(80, 300))
+            draw_line(bottom_row + 25, start_col, end_col, 1, 0.04)
+            draw_line(bottom_row + 49, start_col, end_col, 1, -0.04)
+
+        for _ in range(rng.integers(0, 4)):
+            center_col = int(rng.integers(left_col, right_col - 200)) + 80
+            rr, cc = skdraw.ellipse_perimeter(top_row - 15, center_col, 8, 80, shape=ink.shape)
+            ink[rr[rr < top_row - 15], cc[rr < top_row - 15]] = True
+
+        if rng.random() < 0.6:
+            for col in range(left_col, right_col - 20, int(rng.integers(9, 15))):
+                if rng.random() < 0.8:
+                    draw_blob(bottom_row + 50, col, rng.integers(3, 6), rng.integers(2, 5))
+
+        row = bottom_row + int(rng.integers(90, 150))
+
+    num_specks = int(page_height * page_width * rng.uniform(0, 0.002))
+    ink[rng.integers(0, page_height, num_specks), rng.integers(0, page_width, num_specks)] = True
+
+    page_image = np.full((page_height, page_width, 3), 255, dtype="uint8")
+    page_image[ink] = 0
+
+    return page_image
@@ -0,0 +1,162 @@
+import numpy as np
+
+from pageUtils import Page
+from autoAnnotateUtils import auto_annotate_pages, auto_annotate_pages_in_parallel
+from conftest import make_score_page_image
+
+
+def make_pages(with_detection_render):
+
+    page_obj_list = []
+    for seed in range(2):
+        page_image = make_score_page_image(seed=seed)
+        page_obj = Page(orig_image=page_image, orig_image_filename="page_{}.png".format(seed))
+
+        if with_detection_render:
+            # A grayscale render at a third of the resolution (the darkest
+            # pixel of each 3x3 block, so the thin lines stay)
+            gray_image = page_image[:, :, 0]
+            gray_image = gray_image[:(gray_image.shape[0] // 3) * 3, :(gray_image.shape[1] // 3) * 3]
+            page_obj.set_detection_image(gray_image.reshape((gray_image.shape[0] // 3, 3,
+                                                             gray_image.shape[1] // 3, 3)).min(axis=(1, 3)))
+
+        page_obj_list.append(page_obj)
+
+    return page_obj_list
+
+
+def get_annotations(page_obj_list, report_list):
+    return ([page_obj.to_dict(json_compatible=True)["sg_list"] for page_obj in page_obj_list],
+            [report.to_dict() for report in report_list])
+
+
+def test_parallel_matches_serial_with_detection_render():
+
+    serial_page_obj_list = make_pages(with_detection_render=True)
+    serial_results = get_annotations(serial_page_obj_list,
+                                     auto_annotate_pages(serial_page_obj_list))
+
+    parallel_page_obj_list = make_pages(with_detection_render=True)
+    parallel_results = get_annotations(parallel_page_obj_list,
+                                       auto_annotate_pages_in_parallel(parallel_page_obj_list,
+                                                                       num_workers=2))
+
+    assert parallel_results == serial_results
+
+    # The render does change the result (its rows/cols are coarser); so the
+    # parallel run did use it
+    full_res_page_obj_list = make_pages(with_detection_render=False)
+    full_res_results = get_annotations(full_res_page_obj_list,
+                                       auto_annotate_pages(full_res_page_obj_list))
+
+    assert full_res_results[0] != serial_results[0]
+    assert len(serial_results[0][0]) > 0
+
+
+def count_detections(monkeypatch):
+
+    # Count the stave/bar line detections of each page (by its image's id)
+    import staveSelectorUtils
+    import barSelectorUtils
+
+    detection_count_dict = {"stave": {}, "bar": {}}
+    orig_detect_stave_lines = staveSelectorUtils.detect_stave_lines
+    orig_detect_bar_lines_in_stave_group = barSelectorUtils.detect_bar_lines_in_stave_group
+
+    def spy_detect_stave_lines(detection_image, coarse_to_fine=False):
+        key = id(detection_image.bin_image)
+        detection_count_dict["stave"][key] = detection_count_dict["stave"].get(key, 0) + 1
+        return orig_detect_stave_lines(detection_image, coarse_to_fine=coarse_to_fine)
+
+    def spy_detect_bar_lines_in_stave_group(detection_image, stave_group):
+        key = id(detection_image.bin_image)
+        detection_count_dict["bar"][key] = detection_count_dict["bar"].get(key, 0) + 1
+        return orig_detect_bar_lines_in_stave_group(detection_image, stave_group)
+
+    monkeypatch.setattr(staveSelectorUtils, "detect_stave_lines", spy_detect_stave_lines)
+    monkeypatch.setattr(barSelectorUtils, "detect_bar_lines_in_stave_group", spy_detect_bar_lines_in_stave_group)
+
+    return detection_count_dict
+
+
+def test_auto_annotation_fills_the_detection_cache(monkeypatch):
+
+    from staveSelectorUtils import STAVE_LINE_CANDIDATES_KEY
+    from detectionPrefetchUtils import prefetch_page_detections
+
+    serial_page_obj_list = make_pages(with_detection_render=False)
+    parallel_page_obj_list = make_pages(with_detection_render=False)
+    auto_annotate_pages_in_parallel(parallel_page_obj_list, num_workers=2)
+
+    detection_count_dict = count_detections(monkeypatch)
+    auto_annotate_pages(serial_page_obj_list)
+
+    # The serial pass detects each page once; the parallel one seeds the
+    # pages' caches with the detections of its workers
+    assert sorted(detection_count_dict["stave"].values()) == [1, 1]
+    for page_obj in parallel_page_obj_list:
+        assert STAVE_LINE_CANDIDATES_KEY in page_obj.detection_candidate_cache
+
+    # So, preparing the pages' GUIs detects nothing again
+    num_bar_detections = sum(detection_count_dict["bar"].values())
+    for page_obj in serial_page_obj_list + parallel_page_obj_list:
+        assert prefetch_page_detections(page_obj, 1)
+
+    assert sorted(detection_count_dict["stave"].values()) == [1, 1]
+    assert sum(detection_count_dict["bar"].values()) == num_bar_detections
+
+
+def test_annotate_pages_detects_ahead_of_the_review(monkeypatch):
+
+    import autoAnnotateUtils
+    from staveSelectorUtils import STAVE_LINE_CANDIDATES_KEY
+    from barSelectorUtils import BAR_LINE_CANDIDATES_KEY
+
+    page_obj_list = make_pages(with_detection_render=False) + make_pages(with_detection_render=False)
+    detection_count_dict = count_detections(monkeypatch)
+
+    # Page 0 is made to have a doubtful stave line, and page 1 to need no
+    # review at all (the other pages only have doubtful bar lines)
+    orig_auto_annotate_page = autoAnnotateUtils.auto_annotate_page
+
+    def auto_annotate_page_with_review_mix(page_obj, stave_group_size, page_idx):
+        report = orig_auto_annotate_page(page_obj, stave_group_size, page_idx)
+        if page_idx == 0:
+            report.doubtful_stave_line_list = [(40, 41)]
+        elif page_idx == 1:
+            report.doubtful_bar_line_list = []
+        return report
+
+    # The GUIs just record what the page had ready when they opened, and how
+    # far the background detection of the other pages had got
+    opened_gui_list = []
+
+    def record_gui_opening(gui_name):
+        def open_gui(page_obj, stave_group_size=1):
+            cache_keys = list(page_obj.detection_candidate_cache.keys())
+            opened_gui_list.append((gui_name, page_obj_list.index(page_obj),
+                                    STAVE_LINE_CANDIDATES_KEY in cache_keys,
+                                    any(key[0] == BAR_LINE_CANDIDATES_KEY for key in cache_keys
+                                        if isinstance(key, tuple)),
+                                    page_obj.display_pyramid is not None))
+            return True
+        return open_gui
+
+    monkeypatch.setattr(autoAnnotateUtils, "auto_annotate_page", auto_annotate_page_with_review_mix)
+    monkeypatch.setattr(autoAnnotateUtils, "interactive_stave_line_process", record_gui_opening("stave"))
+    monkeypatch.setattr(autoAnnotateUtils, "interactive_bar_selector_process", record_gui_opening("bar"))
+
+    report_list = autoAnnotateUtils.annotate_pages(page_obj_list)
+
+    assert [r.needs_review() for r in report_list] == [True, False, True, True]
+    assert [(gui_name, page_idx) for (gui_name, page_idx, _, _, _) in opened_gui_list] == [
+        ("stave", 0), ("bar", 0), ("bar", 2), ("bar", 3)
+    ]
+
+    # Every GUI opens with the page's stave and bar lines ready; the pages
+    # with doubtful bar lines have their display pyramid ready too
+    assert all(opened_gui[2:4] == (True, True) for opened_gui in opened_gui_list)
+    assert opened_gui_list[2][4] and opened_gui_list[3][4]
+
+    # Each page was detected just once, for both its annotation and its GUIs
+    assert sorted(detection_count_dict["stave"].values()) == [1, 1, 1, 1]
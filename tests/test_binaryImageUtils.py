@@ -0,0 +1,145 @@
+import numpy as np
+import pytest
+
+from binaryImageUtils import (PackedBinaryImage, RunLengthIndex, get_col_counts_at, get_fully_covered_cols,
+                              get_longest_row_runs, get_pooled_row_counts, get_row_counts)
+from pageUtils import Page
+from staveSelectorUtils import detect_stave_lines, make_stave_groups
+from barSelectorUtils import detect_bar_lines_in_stave_group
+from conftest import make_score_page_image
+
+
+def to_plain(obj):
+    if isinstance(obj, (list, tuple)):
+        return [to_plain(o) for o in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return obj
+
+
+def get_longest_row_runs_brute_force(bin_image):
+
+    longest_run_list = []
+    for row in bin_image:
+        longest_run = curr_run = 0
+        for is_ink in row:
+            curr_run = curr_run + 1 if is_ink else 0
+            longest_run = max(longest_run, curr_run)
+        longest_run_list.append(longest_run)
+
+    return np.array(longest_run_list)
+
+
+def check_queries(bin_index, bin_image):
+
+    img_height, img_width = bin_image.shape
+
+    assert np.array_equal(bin_index.row_counts(), np.count_nonzero(bin_image, axis=1))
+    assert np.array_equal(bin_index.row_counts(3, img_height // 2),
+                          np.count_nonzero(bin_image[3: img_height // 2 + 1], axis=1))
+
+    for start_row, end_row in [(0, img_height - 1), (5, 17), (img_height - 3, img_height + 10), (7, 7)]:
+        clipped_rows = bin_image[max(start_row, 0): end_row + 1]
+
+        assert bin_index.count_in_rows(start_row, end_row) == np.count_nonzero(clipped_rows)
+        assert np.array_equal(bin_index.col_counts(start_row, end_row),
+                              np.count_nonzero(clipped_rows, axis=0))
+        for col in [0, img_width // 3, img_width - 1]:
+            assert bin_index.count_in_col(col, start_row, end_row) == np.count_nonzero(clipped_rows[:, col])
+
+        col_arr = np.array([img_width - 1, 0, img_width // 3, 0])
+        assert np.array_equal(bin_index.col_counts_at(col_arr, start_row, end_row),
+                              np.count_nonzero(clipped_rows[:, col_arr], axis=0))
+        assert np.array_equal(bin_index.fully_covered_cols(start_row, end_row),
+                              np.all(clipped_rows, axis=0))
+
+    longest_run_arr = get_longest_row_runs_brute_force(bin_image)
+    assert np.array_equal(bin_index.longest_row_runs(), longest_run_arr)
+    assert np.array_equal(bin_index.longest_row_runs(3, img_height // 2), longest_run_arr[3: img_height // 2 + 1])
+
+    row_arr = np.array([img_height - 1, 0, img_height // 2, 0])
+    assert np.array_equal(bin_index.longest_row_runs_at(row_arr), longest_run_arr[row_arr])
+
+
+@pytest.mark.parametrize("bin_index_class", [PackedBinaryImage, RunLengthIndex])
+@pytest.mark.parametrize("ink_fraction", [0.0, 0.05, 0.5, 1.0])
+def test_queries_match_ndarray(bin_index_class, ink_fraction):
+
+    rng = np.random.default_rng(0)
+    bin_image = rng.random((150, 77)) < ink_fraction
+
+    check_queries(bin_index_class(bin_image), bin_image)
+
+
+@pytest.mark.parametrize("bin_index_class", [PackedBinaryImage, RunLengthIndex])
+def test_run_queries_match_ndarray(bin_index_class):
+
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        bin_image = rng.random(tuple(rng.integers(1, 60, 2))) < rng.random()
+        img_height, img_width = bin_image.shape
+        bin_index = bin_index_class(bin_image)
+
+        row_arr = rng.integers(0, img_height, 7)
+        col_arr = rng.integers(0, img_width, 7)
+        start_row = int(rng.integers(0, img_height))
+        end_row = start_row + int(rng.integers(0, img_height))
+
+        for bin_img in [bin_image, bin_index]:
+            assert np.array_equal(get_longest_row_runs(bin_img),
+                                  get_longest_row_runs_brute_force(bin_image))
+            assert np.array_equal(get_longest_row_runs(bin_img, row_arr),
+                                  get_longest_row_runs_brute_force(bin_image)[row_arr])
+            assert np.array_equal(get_col_counts_at(bin_img, col_arr, start_row, end_row),
+                                  np.count_nonzero(bin_image[start_row: end_row + 1, col_arr], axis=0))
+            assert np.array_equal(get_fully_covered_cols(bin_img, start_row, end_row),
+                                  np.all(bin_image[start_row: end_row + 1], axis=0))
+
+
+def test_detection_on_run_length_index_matches_packed():
+
+    page_obj = Page(orig_image=make_score_page_image(), orig_image_filename="page.png")
+
+    results = []
+    for use_run_length_index in [False, True]:
+        detection_image = page_obj.get_detection_image(use_run_length_index=use_run_length_index)
+        top_edge_rows, bottom_edge_rows = detect_stave_lines(detection_image)
+
+        bar_results = [detect_bar_lines_in_stave_group(detection_image, sg)
+                       for sg in make_stave_groups(top_edge_rows, bottom_edge_rows,
+                                                   1, page_obj.page_width)]
+        results.append((top_edge_rows, bottom_edge_rows, bar_results))
+
+    # Detection on the full resolution image runs on the run-length index,
+    # unless asked otherwise
+    assert isinstance(page_obj.get_detection_image().bin_image, RunLengthIndex)
+    assert isinstance(page_obj.get_detection_image(use_run_length_index=False).bin_image, PackedBinaryImage)
+    assert len(results[0][0]) == 20
+    assert to_plain(results[0]) == to_plain(results[1])
+
+
+@pytest.mark.parametrize("bin_index_class", [PackedBinaryImage, RunLengthIndex])
+def test_pooled_row_counts(bin_index_class):
+
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        bin_image = rng.random(tuple(rng.integers(1, 90, 2))) < rng.random()
+        row_pool_factor = int(rng.integers(1, 6))
+        col_step = int(rng.integers(1, 12))
+        num_pooled_rows = (bin_image.shape[0] // row_pool_factor) * row_pool_factor
+
+        # The indices pool the full row counts; a plain ndarray, the counts
+        # on the sampled columns
+        pooled_shape = (num_pooled_rows // row_pool_factor, row_pool_factor)
+        expected_index_counts = np.count_nonzero(bin_image[:num_pooled_rows], axis=1).reshape(pooled_shape).max(axis=1)
+        expected_ndarray_counts = np.count_nonzero(bin_image[:num_pooled_rows, ::col_step],
+                                                   axis=1).reshape(pooled_shape).max(axis=1)
+
+        assert np.array_equal(get_pooled_row_counts(bin_index_class(bin_image), row_pool_factor, col_step),
+                              expected_index_counts)
+        assert np.array_equal(get_pooled_row_counts(bin_image, row_pool_factor, col_step),
+                              expected_ndarray_counts)
+
+        row_arr = rng.integers(0, bin_image.shape[0], 10)
+        assert np.array_equal(get_row_counts(bin_index_class(bin_image), row_arr),
+                              np.count_nonzero(bin_image[row_arr], axis=1))
@@ -0,0 +1,39 @@
+import hsluv
+import numpy as np
+
+from hsluvUtils import hsluv_array_to_rgb_array, rgb_array_to_hsluv_array
+
+
+def make_rgb_grid():
+
+    # A coarse grid over the RGB cube, plus greys and colors right at the
+    # black and white ends (where the conversions special-case lightness)
+    levels = np.linspace(0, 1, 9)
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1).reshape(-1, 3)
+
+    greys = np.repeat(np.linspace(0, 1, 17)[:, None], 3, axis=1)
+    near_black = np.array([[1e-9, 0, 0], [0, 1e-6, 0], [1e-4, 1e-4, 1e-4], [0.002, 0, 0.001]])
+    near_white = 1 - near_black
+
+    return np.concatenate([grid, greys, near_black, near_white])
+
+
+def test_rgb_to_hsluv_matches_reference():
+
+    rgb_arr = make_rgb_grid()
+    expected = np.array([hsluv.rgb_to_hsluv(tuple(rgb)) for rgb in rgb_arr])
+
+    assert np.allclose(rgb_array_to_hsluv_array(rgb_arr), expected, rtol=0, atol=1e-9)
+
+
+def test_hsluv_to_rgb_matches_reference():
+
+    hsluv_arr = np.array([hsluv.rgb_to_hsluv(tuple(rgb)) for rgb in make_rgb_grid()])
+    expected = np.array([hsluv.hsluv_to_rgb(tuple(hsl)) for hsl in hsluv_arr])
+
+    assert np.allclose(hsluv_array_to_rgb_array(hsluv_arr), expected, rtol=0, atol=1e-12)
+
+    # Works on any leading shape, e.g. an image
+    image_hsluv_arr = hsluv_arr[:64].reshape(8, 8, 3)
+    assert np.allclose(hsluv_array_to_rgb_array(image_hsluv_arr), expected[:64].reshape(8, 8, 3),
+                       rtol=0, atol=1e-12)
@@ -0,0 +1,111 @@
+import os
+import shutil
+
+import imageio
+import numpy as np
+import pytest
+
+import pdf_to_image
+from pdf_to_image import PageGeometry, PageRasterCache, convert_pdf_to_single_page_images
+
+# A portrait A4 page, then a landscape A4 page (twice as wide, in points)
+MIXED_PAGE_SIZE_LIST = [(595, 842), (1190, 842)]
+OUTPUT_PAGE_WIDTH_PX = 300
+
+HAS_POPPLER = (shutil.which("pdftocairo") is not None) and (shutil.which("pdfinfo") is not None)
+
+
+def write_mixed_size_pdf(pdf_filepath, page_size_list=MIXED_PAGE_SIZE_LIST):
+
+    # A minimal PDF with one blank page per (width, height) in points
+    num_pages = len(page_size_list)
+    obj_list = ["<< /Type /Catalog /Pages 2 0 R >>",
+                "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+                    " ".join("{} 0 R".format(3 + idx) for idx in range(num_pages)), num_pages)]
+    for width, height in page_size_list:
+        obj_list.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {} {}] >>".format(width, height))
+
+    content = b"%PDF-1.4\n"
+    offset_list = []
+    for obj_idx, obj in enumerate(obj_list):
+        offset_list.append(len(content))
+        content += "{} 0 obj\n{}\nendobj\n".format(obj_idx + 1, obj).encode("ascii")
+
+    xref_offset = len(content)
+    content += "xref\n0 {}\n0000000000 65535 f \n".format(len(obj_list) + 1).encode("ascii")
+    for offset in offset_list:
+        content += "{:010d} 00000 n \n".format(offset).encode("ascii")
+    content += "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(
+        len(obj_list) + 1, xref_offset).encode("ascii")
+
+    with open(pdf_filepath, "wb") as fp:
+        fp.write(content)
+
+    return
+
+
+def fake_run_pdftocairo(input_pdf_filepath, resolution, output_prefix,
+                        first_page=None, last_page=None):
+
+    # Writes what `pdftocairo -r <resolution>` would, for the sizes above
+    num_digits = len(str(len(MIXED_PAGE_SIZE_LIST)))
+    first_page = 1 if first_page is None else first_page
+    last_page = len(MIXED_PAGE_SIZE_LIST) if last_page is None else last_page
+    for page_number in range(first_page, last_page + 1):
+        width_pts, height_pts = MIXED_PAGE_SIZE_LIST[page_number - 1]
+        page_image = np.full((int(round(height_pts * resolution / 72.0)),
+                              int(round(width_pts * resolution / 72.0))), 255, dtype="uint8")
+        imageio.imwrite("{}-{:0{}d}.png".format(output_prefix, page_number, num_digits), page_image)
+
+    return True
+
+
+def get_page_widths(pdf_filepath, output_dir, raster_cache, per_page_resolution):
+
+    os.makedirs(output_dir)
+    page_fp_list = convert_pdf_to_single_page_images(pdf_filepath, OUTPUT_PAGE_WIDTH_PX, output_dir,
+                                                     raster_cache=raster_cache,
+                                                     per_page_resolution=per_page_resolution)
+    return [imageio.imread(page_fp).shape[1] for page_fp in page_fp_list]
+
+
+def check_cache_keeps_resolution_modes_apart(tmp_path):
+
+    pdf_filepath = str(tmp_path / "mixed.pdf")
+    write_mixed_size_pdf(pdf_filepath)
+    raster_cache = PageRasterCache(str(tmp_path / "cache"))
+
+    # Uncached renders in both modes, to compare against
+    expected_dict = {mode: get_page_widths(pdf_filepath, str(tmp_path / "plain_{}".format(mode)),
+                                           None, mode)
+                     for mode in (False, True)}
+    assert expected_dict[False][1] != expected_dict[True][1]
+
+    # Fill the cache in one mode, then read in the other, and then again
+    for run_idx, mode in enumerate((False, True, False, True)):
+        widths = get_page_widths(pdf_filepath, str(tmp_path / "cached_{}".format(run_idx)),
+                                 raster_cache, mode)
+        assert widths == expected_dict[mode]
+
+    return
+
+
+def test_cache_keeps_resolution_modes_apart(tmp_path, monkeypatch):
+
+    # `pdfinfo` and `pdftocairo` replaced by what they would give for the
+    # PDF written above
+
+    monkeypatch.setattr(pdf_to_image, "get_page_geometry_list",
+                        lambda input_pdf_filepath: [PageGeometry(idx + 1, width, height)
+                                                    for idx, (width, height)
+                                                    in enumerate(MIXED_PAGE_SIZE_LIST)])
+    monkeypatch.setattr(pdf_to_image, "get_page_size",
+                        lambda input_pdf_filepath: MIXED_PAGE_SIZE_LIST[0][::-1])
+    monkeypatch.setattr(pdf_to_image, "run_pdftocairo", fake_run_pdftocairo)
+
+    check_cache_keeps_resolution_modes_apart(tmp_path)
+
+
+@pytest.mark.skipif(not HAS_POPPLER, reason="needs `pdftocairo` and `pdfinfo`")
+def test_cache_keeps_resolution_modes_apart_with_poppler(tmp_path):
+    check_cache_keeps_resolution_modes_apart(tmp_path)
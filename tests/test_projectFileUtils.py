@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+
+from projectFileUtils import ProjectFile, PROJECT_FILE_MODE_OPEN, PROJECT_FILE_MODE_CREATE
+
+
+def test_open_missing_file_raises(tmp_path):
+
+    with pytest.raises(FileNotFoundError):
+        ProjectFile(str(tmp_path / "no_such_project.ssv"))
+
+    assert not os.path.exists(tmp_path / "no_such_project.ssv")
+
+
+def test_create_and_reopen(tmp_path):
+
+    filepath = str(tmp_path / "project.ssv")
+    project_obj = ProjectFile(filepath, mode=PROJECT_FILE_MODE_CREATE)
+    project_obj.write_arrays({"a": np.arange(10)})
+
+    reopened_obj = ProjectFile(filepath, mode=PROJECT_FILE_MODE_OPEN)
+    assert np.array_equal(reopened_obj.read_array("a"), np.arange(10))
+
+
+@pytest.mark.parametrize("num_kept_bytes", [1, 10, 100, 1000, -1])
+def test_torn_save_keeps_previous_index(tmp_path, num_kept_bytes):
+
+    filepath = str(tmp_path / "project.ssv")
+    project_obj = ProjectFile(filepath, mode=PROJECT_FILE_MODE_CREATE)
+    project_obj.write_arrays({"a": np.arange(100)})
+    saved_size = os.path.getsize(filepath)
+
+    # A second save, cut short somewhere in its data/index/footer
+    rng = np.random.default_rng(0)
+    project_obj.write_arrays({"a": np.zeros(100, dtype="int64"),
+                              "b": rng.integers(0, 255, 5000, dtype="uint8")})
+    full_size = os.path.getsize(filepath)
+    if num_kept_bytes < 0:
+        num_kept_bytes = full_size - saved_size - 1
+    os.truncate(filepath, saved_size + num_kept_bytes)
+
+    reopened_obj = ProjectFile(filepath)
+    assert not reopened_obj.has_array("b")
+    assert np.array_equal(reopened_obj.read_array("a"), np.arange(100))
+
+    # Saving again after the partial save works as usual
+    reopened_obj.write_arrays({"c": np.ones(3)})
+    reopened_obj = ProjectFile(filepath)
+    assert np.array_equal(reopened_obj.read_array("a"), np.arange(100))
+    assert np.array_equal(reopened_obj.read_array("c"), np.ones(3))
+
+
+def test_file_without_footer_raises(tmp_path):
+
+    filepath = str(tmp_path / "project.ssv")
+    ProjectFile(filepath, mode=PROJECT_FILE_MODE_CREATE)
+    os.truncate(filepath, 10)
+
+    with pytest.raises(Exception):
+        ProjectFile(filepath)
+
+
+@pytest.mark.parametrize("block_size", [9, 16, 33])
+def test_footer_search_across_blocks(tmp_path, monkeypatch, block_size):
+
+    import projectFileUtils
+    monkeypatch.setattr(projectFileUtils, "FOOTER_SEARCH_BLOCK_SIZE", block_size)
+
+    filepath = str(tmp_path / "project.ssv")
+    project_obj = ProjectFile(filepath, mode=PROJECT_FILE_MODE_CREATE)
+    project_obj.write_arrays({"a": np.arange(100)})
+    saved_size = os.path.getsize(filepath)
+
+    project_obj.write_arrays({"b": np.arange(1000)})
+    os.truncate(filepath, saved_size + 50)
+
+    reopened_obj = ProjectFile(filepath)
+    assert reopened_obj.list_arrays() == ["a"]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import staveSelectorUtils
+from pageUtils import Page
+from staveSelectorUtils import detect_stave_lines
+from conftest import make_score_page_image, make_cluttered_score_page_image
+
+
+def make_page_obj_list():
+
+    page_image_list = [make_score_page_image()]
+    for seed in range(6):
+        page_image_list.append(make_cluttered_score_page_image(1000 + (seed % 3) * 300, 800 + (seed % 2) * 300,
+                                                               seed=seed))
+    # Slightly skewed, so the lines cross the coarse row pools
+    for seed in range(3):
+        page_image_list.append(make_cluttered_score_page_image(skew=0.002, seed=seed))
+
+    return [Page(orig_image=page_image, orig_image_filename="page.png")
+            for page_image in page_image_list]
+
+
+@pytest.mark.parametrize("use_run_length_index", [False, True])
+def test_coarse_to_fine_matches_single_pass(use_run_length_index):
+
+    for page_obj in make_page_obj_list():
+        detection_image = page_obj.get_detection_image(use_run_length_index=use_run_length_index)
+
+        top_edge_rows, bottom_edge_rows = detect_stave_lines(detection_image)
+        c2f_top_edge_rows, c2f_bottom_edge_rows = detect_stave_lines(detection_image, coarse_to_fine=True)
+
+        assert len(top_edge_rows) % 5 == 0
+        assert np.array_equal(c2f_top_edge_rows, top_edge_rows)
+        assert np.array_equal(c2f_bottom_edge_rows, bottom_edge_rows)
+
+
+def test_coarse_to_fine_counts_only_band_rows(monkeypatch):
+
+    # --------------------------------------------------------------------------
+    # On the detection image, the coarse pass itself runs (there is
+    # no falling back to the single pass filter), and the only rows counted
+    # are the band rows, and the sample of the other rows for the threshold
+    # --------------------------------------------------------------------------
+    row_arr_list = []
+    orig_get_row_counts = staveSelectorUtils.get_row_counts
+
+    def spy_get_row_counts(bin_img, row_arr=None):
+        row_arr_list.append(row_arr)
+        return orig_get_row_counts(bin_img, row_arr)
+
+    def fail_weak_filter_stave_lines(bin_img):
+        raise AssertionError("Fell back to the single pass filter")
+
+    monkeypatch.setattr(staveSelectorUtils, "get_row_counts", spy_get_row_counts)
+    monkeypatch.setattr(staveSelectorUtils, "weak_filter_stave_lines", fail_weak_filter_stave_lines)
+
+    page_obj = Page(orig_image=make_cluttered_score_page_image(seed=1), orig_image_filename="page.png")
+    detection_image = page_obj.get_detection_image()
+    img_height = detection_image.bin_image.shape[0]
+
+    top_edge_rows, bottom_edge_rows = detect_stave_lines(detection_image, coarse_to_fine=True)
+
+    is_band_pool, band_rows = staveSelectorUtils.get_coarse_bands(detection_image.bin_image)
+    assert len(row_arr_list) == 1
+    assert row_arr_list[0] is not None
+
+    queried_rows = np.asarray(row_arr_list[0])
+    is_band_row = np.isin(queried_rows, band_rows)
+    assert np.array_equal(np.sort(queried_rows[is_band_row]), np.sort(band_rows))
+
+    sample_rows = queried_rows[np.invert(is_band_row)]
+    assert np.all(sample_rows % staveSelectorUtils.FINE_THRESH_ROW_SAMPLE_STEP == 0)
+
+    # Only a small part of the page is looked at, and all the lines are in it
+    assert len(queried_rows) < 0.3 * img_height
+    assert np.all(np.isin(top_edge_rows, band_rows)) and np.all(np.isin(bottom_edge_rows, band_rows))
+    assert len(top_edge_rows) % 5 == 0
+
+
+@pytest.mark.parametrize("coarse_to_fine", [False, True])
+def test_dashed_rows_are_not_stave_lines(coarse_to_fine):
+
+    # --------------------------------------------------------------------------
+    # A row of dashes (4 on, 1 off) across the page, under the staves, has
+    # more ink than the staff lines, but only in short runs; so it passes the
+    # count threshold, and is dropped by the longest run test
+    # --------------------------------------------------------------------------
+    page_image = make_score_page_image()
+    dash_row = 560
+    is_dash_col = (np.arange(page_image.shape[1]) % 5) < 4
+    page_image[dash_row: dash_row + 2, is_dash_col] = 0
+
+    page_obj = Page(orig_image=page_image, orig_image_filename="page.png")
+    detection_image = page_obj.get_detection_image()
+
+    # The count threshold alone keeps it
+    count_arr = staveSelectorUtils.get_row_counts(detection_image.bin_image)
+    assert count_arr[dash_row] > staveSelectorUtils.get_long_line_count_thresh(count_arr)
+
+    top_edge_rows, bottom_edge_rows = detect_stave_lines(detection_image, coarse_to_fine=coarse_to_fine)
+
+    assert len(top_edge_rows) == 20
+    assert dash_row not in top_edge_rows
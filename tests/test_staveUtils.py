@@ -0,0 +1,37 @@
+import numpy as np
+
+from staveUtils import Stave, StaveGroup
+
+
+def make_stave(top_row, parent_group=None):
+    line_top_edge_rows = top_row + (12 * np.arange(5))
+    return Stave(line_top_edge_rows, line_top_edge_rows + 1, 10, 500, parent_group)
+
+
+def test_line_rows_keep_their_values():
+
+    stave = make_stave(40)
+    line_top_edge_rows = stave.line_top_edge_rows
+    stave_dict = stave.to_dict()
+
+    # Neither an edit of the stave, nor the store growing, changes them
+    stave.offset_row_lims(100)
+    for top_row in range(100, 1000, 100):
+        Stave(top_row + (12 * np.arange(5)), top_row + 1 + (12 * np.arange(5)),
+              parent_group=None).move_to_store(stave.annotation_store)
+
+    assert np.array_equal(line_top_edge_rows, 40 + (12 * np.arange(5)))
+    assert np.array_equal(stave_dict["line_top_edge_rows"], 40 + (12 * np.arange(5)))
+    assert np.array_equal(stave_dict["line_bottom_edge_rows"], 41 + (12 * np.arange(5)))
+
+    assert np.array_equal(stave.line_top_edge_rows, 140 + (12 * np.arange(5)))
+
+
+def test_to_dict_round_trip():
+
+    sg = StaveGroup.make_object_from_dict(None, {"stave_list": [make_stave(40).to_dict()],
+                                                 "bar_list": []})
+    stave = sg.stave_list[0]
+
+    assert np.array_equal(stave.line_top_edge_rows, 40 + (12 * np.arange(5)))
+    assert (stave.left_lim_col, stave.right_lim_col) == (10, 500)
@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+
+from tiledPageStore import TiledPageStore
+from videoGenHelpers import FullSizeImageIterator
+
+
+class FakeVizBar:
+
+    # Just what `FullSizeImageIterator` uses of a `VizBar`: a box, the frames
+    # it is drawn in, and a half-opaque colored overlay
+    def __init__(self, top_row, left_col, start_frame, end_frame):
+        self.bar_top_row = top_row
+        self.bar_bottom_row = top_row + 29
+        self.bar_left_col = left_col
+        self.bar_right_col = left_col + 39
+        self.actual_start_frame = start_frame
+        self.actual_end_frame = end_frame
+
+    def get_bar_image_at_frame(self, frame_index):
+        color_image = np.zeros((30, 40, 3), dtype="uint8")
+        color_image[..., 0] = 200
+        return color_image, np.full((30, 40), 0.5)
+
+
+def make_page_and_bars():
+
+    rng = np.random.default_rng(0)
+    page_image = np.full((400, 200, 3), 255, dtype="uint8")
+    page_image[rng.random((400, 200)) < 0.1] = 0
+
+    viz_bar_list = [FakeVizBar(20 + (60 * (b_idx // 3)), 10 + (60 * (b_idx % 3)),
+                               10 * b_idx, (10 * b_idx) + 14)
+                    for b_idx in range(12)]
+
+    return page_image, viz_bar_list
+
+
+def test_tiled_iterator_cleans_up(tmp_path):
+
+    page_image, viz_bar_list = make_page_and_bars()
+    tiled_page_image = TiledPageStore.from_array(page_image, str(tmp_path / "page"), tile_height=64)
+
+    with FullSizeImageIterator(page_image, viz_bar_list, 0, 124) as full_iter:
+        for frame_index in full_iter:
+            pass
+        expected_output_image = full_iter.full_output_image
+
+    with FullSizeImageIterator(tiled_page_image, viz_bar_list, 0, 124) as tiled_iter:
+        work_dir = tiled_iter.temp_work_dir_obj.name
+        assert os.path.isdir(work_dir)
+
+        for frame_index in tiled_iter:
+            # Only the black portions of the bars being drawn are kept
+            assert set(tiled_iter.bar_black_portions_dict.keys()) <= set(tiled_iter.curr_valid_bar_indices)
+            assert len(tiled_iter.bar_black_portions_dict) <= 2
+
+        assert np.array_equal(tiled_iter.full_output_image.to_array(), expected_output_image)
+
+    assert not os.path.exists(work_dir)
+
+
+def test_tiled_iterator_keeps_given_work_dir(tmp_path):
+
+    page_image, viz_bar_list = make_page_and_bars()
+    tiled_page_image = TiledPageStore.from_array(page_image, str(tmp_path / "page"), tile_height=64)
+
+    tiled_iter = FullSizeImageIterator(tiled_page_image, viz_bar_list, 0, 124,
+                                       tiled_work_dir=str(tmp_path / "work"))
+    for frame_index in tiled_iter:
+        pass
+    tiled_iter.close()
+
+    assert os.path.isdir(str(tmp_path / "work" / "output"))